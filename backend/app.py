@@ -1,17 +1,43 @@
 import os
-from flask import Flask, request, jsonify, send_from_directory
+import json
+import time
+import shutil
+import hashlib
+import threading
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
+from werkzeug.utils import safe_join, secure_filename
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-from datetime import datetime
+from datetime import datetime, timedelta
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 from config import config
-from models import db, bcrypt, User, Photo, ClothingItem, SavedLook, Challenge, ChallengeEntry
+from models import db, bcrypt, utcnow, User, Photo, ClothingItem, SavedLook, Challenge, ChallengeEntry, Job
 from gemini_service import GeminiService
+from upstream import create_upstream_caller
+from scheduler import create_scheduler
+from single_flight import SingleFlight
+from job_queue import JobQueue
+from fanout import fan_out, fan_out_ordered
+from result_cache import ResultCache
+from background_removal import BackgroundRemovalStage
+from derivatives import DerivativeGenerator
+from model_inputs import ModelInputCache
+from clothing_importer import ClothingImporter, ClothingImportError
+from entry_sampling import sample_entry_ids
+from media_index import MediaIndex
+from media_store import create_media_store
+from media_cli import register_media_commands
+from wardrobe_cache import WardrobeSnapshot, WardrobeSnapshotCache
+from counters import VoteRecorder, increment, spend_credits, current_credits
+from metrics import metrics
+from progress import stream_format, event_stream_response, run_with_progress
+from pagination import PaginationError, parse_limit, parse_fields, project, keyset_page
 from weather_service import WeatherService
 import requests
-from bs4 import BeautifulSoup
-from sqlalchemy.sql.expression import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import defer, joinedload
 from PIL import Image
 from io import BytesIO
 
@@ -21,32 +47,28 @@ def create_app(config_name='development'):
     app.config.from_object(config[config_name])
     
     # Initialize extensions
-    # Initialize extensions
-    # Configure SQLite for better concurrency
-    if 'sqlite' in app.config['SQLALCHEMY_DATABASE_URI']:
-        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-            'connect_args': {'timeout': 30}
-        }
-        
+    # Engine and pool options come from config (SQLite or a pooled server database)
     db.init_app(app)
     
-    # Enable WAL mode
+    # Enable WAL mode on SQLite connections only
     with app.app_context():
-        try:
-            from sqlalchemy import event
-            from sqlalchemy.engine import Engine
-            
-            @event.listens_for(Engine, "connect")
-            def set_sqlite_pragma(dbapi_connection, connection_record):
-                cursor = dbapi_connection.cursor()
-                cursor.execute("PRAGMA journal_mode=WAL")
-                cursor.execute("PRAGMA synchronous=NORMAL")
-                cursor.close()
-        except Exception as e:
-            print(f"⚠️ Failed to set SQLite PRAGMAs: {e}")
+        if db.engine.dialect.name == 'sqlite':
+            try:
+                from sqlalchemy import event
+                
+                @event.listens_for(db.engine, "connect")
+                def set_sqlite_pragma(dbapi_connection, connection_record):
+                    cursor = dbapi_connection.cursor()
+                    cursor.execute("PRAGMA journal_mode=WAL")
+                    cursor.execute("PRAGMA synchronous=NORMAL")
+                    cursor.close()
+            except Exception as e:
+                print(f"⚠️ Failed to set SQLite PRAGMAs: {e}")
 
     bcrypt.init_app(app)
     jwt = JWTManager(app)
+    # Per-route/per-stage latency histograms and upstream counters, served on /metrics
+    metrics.init_app(app)
     CORS(app, resources={
         r"/*": {
             "origins": app.config['CORS_ORIGINS'],
@@ -78,69 +100,214 @@ def create_app(config_name='development'):
     os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'clothing'), exist_ok=True)
     os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'results'), exist_ok=True)
     
+    # Index of legacy flat media files; the database stores keys like 'photos/<name>'
+    media_index = MediaIndex(app.config['UPLOAD_FOLDER'])
+    media_index.rebuild()
+    
+    # Content-addressed, sharded media storage (local directory or S3-compatible bucket)
+    media_store = create_media_store(app.config, media_index)
+    register_media_commands(app, media_store)
+    
     # Initialize Gemini service
-    gemini_service = GeminiService(app.config['GOOGLE_API_KEY'])
+    gemini_service = GeminiService(
+        app.config['GOOGLE_API_KEY'],
+        rembg_model=app.config['REMBG_MODEL'],
+        rembg_intra_op_threads=app.config['REMBG_INTRA_OP_THREADS'],
+        rembg_inter_op_threads=app.config['REMBG_INTER_OP_THREADS'],
+        rembg_parallel_execution=app.config['REMBG_PARALLEL_EXECUTION'],
+        upstream=create_upstream_caller(app.config),
+        scheduler=create_scheduler(app.config)
+    )
+    if app.config['REMBG_WARMUP']:
+        # Load the model in the background so startup isn't blocked; /api/health reports readiness
+        threading.Thread(target=gemini_service.warm_up, name='rembg-warmup', daemon=True).start()
     
     # Initialize Weather service
-    weather_service = WeatherService()
+    weather_service = WeatherService(
+        timeout=app.config['WEATHER_TIMEOUT'],
+        forecast_ttl=app.config['WEATHER_CACHE_TTL'],
+        stale_ttl=app.config['WEATHER_STALE_TTL'],
+        geocode_ttl=app.config['GEOCODE_CACHE_TTL']
+    )
+    
+    # Product-page importer with pooled connections and lookup caches
+    clothing_importer = ClothingImporter(
+        timeout=app.config['IMPORT_TIMEOUT'],
+        max_page_bytes=app.config['IMPORT_MAX_PAGE_BYTES'],
+        max_image_bytes=app.config['MAX_CONTENT_LENGTH'],
+        cache_ttl=app.config['IMPORT_CACHE_TTL'],
+        cache_max_bytes=app.config['IMPORT_CACHE_MAX_BYTES']
+    )
+    
+    # Initialize background job workers
+    job_queue = JobQueue(
+        app,
+        max_workers=app.config['JOB_WORKERS'],
+        lease_timeout=app.config['JOB_LEASE_TIMEOUT'],
+        heartbeat_interval=app.config['JOB_HEARTBEAT_INTERVAL']
+    )
+    
+    # Content-addressed cache of try-on results
+    result_cache = ResultCache(app.config['RESULT_CACHE_DIR'], app.config['RESULT_CACHE_MAX_BYTES'])
+    
+    # Downscaled thumbnails served via /uploads/<path>?w=<width>
+    derivatives = DerivativeGenerator(
+        widths=app.config['THUMBNAIL_WIDTHS'],
+        quality=app.config['THUMBNAIL_QUALITY']
+    )
+    
+    # Downscaled, re-encoded copies of photos and clothing sent to the model
+    model_inputs = ModelInputCache(
+        max_side=app.config['MODEL_INPUT_MAX_SIDE'],
+        quality=app.config['MODEL_INPUT_QUALITY']
+    )
+    
+    def prepare_source_media(path):
+        """Build thumbnails and the model input for a newly stored photo or clothing image"""
+        derivatives.schedule(path)
+        model_inputs.schedule(path)
+    
+    # Per-user wardrobe snapshots for style-me, dropped whenever clothing changes
+    wardrobe_cache = WardrobeSnapshotCache(ttl=app.config['WARDROBE_CACHE_TTL'])
+    
+    def clothing_ready(item):
+        """Run once background removal has swapped in an item's final image"""
+        prepare_source_media(media_store.resolve(item.filepath, 'clothing', item.filename))
+        wardrobe_cache.invalidate(item.user_id)
+    
+    # Off-request background removal for uploaded clothing
+    background_removal = BackgroundRemovalStage(
+        app,
+        gemini_service,
+        result_cache,
+        media_store,
+        max_workers=app.config['BG_REMOVAL_WORKERS'],
+        group_size=app.config['BG_REMOVAL_GROUP_SIZE'],
+        on_ready=clothing_ready
+    )
+    
+    # Identical clothing generations in flight share one upstream call
+    clothing_generations = SingleFlight(app.config['INFLIGHT_DIR'], 'clothing_generate')
+    
+    # Shared pool bounding concurrent style-me outfit renders across requests
+    style_executor = ThreadPoolExecutor(max_workers=app.config['STYLE_ME_WORKERS'], thread_name_prefix='style-me')
+    
+    # Challenge votes, buffered and written in batches
+    vote_recorder = VoteRecorder(
+        app,
+        flush_interval=app.config['VOTE_FLUSH_INTERVAL'],
+        max_batch=app.config['VOTE_FLUSH_MAX_BATCH']
+    )
+    
+    # Shared pool bounding concurrent URL fetches for bulk clothing imports
+    import_executor = ThreadPoolExecutor(max_workers=app.config['IMPORT_WORKERS'], thread_name_prefix='clothing-import')
+    
+    # Metrics read at scrape time: queue depths and cache effectiveness
+    caches = {
+        'result': result_cache,
+        'wardrobe': wardrobe_cache,
+        'import': clothing_importer,
+        'weather': weather_service
+    }
+    
+    def cache_hit_ratios():
+        return {(name,): cache.hits / (cache.hits + cache.misses) if cache.hits + cache.misses else 0.0
+                for name, cache in caches.items()}
+    
+    metrics.collector('queue_depth', 'gauge', 'Work items waiting to be processed', ('queue',), lambda: {
+        ('jobs',): Job.query.filter_by(status='queued').count(),
+        ('background_removal',): background_removal.pending(),
+        ('votes',): vote_recorder.pending()
+    })
+    metrics.collector('cache_hits_total', 'counter', 'Cache hits in this process', ('cache',),
+                      lambda: {(name,): cache.hits for name, cache in caches.items()})
+    metrics.collector('cache_misses_total', 'counter', 'Cache misses in this process', ('cache',),
+                      lambda: {(name,): cache.misses for name, cache in caches.items()})
+    metrics.collector('cache_hit_ratio', 'gauge', 'Cache hit ratio in this process', ('cache',), cache_hit_ratios)
     
     # Helper functions
     def allowed_file(filename):
         return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
     
     def save_uploaded_file(file, folder):
-        """Save uploaded file and return filepath"""
+        """Store an uploaded file (the caller commits); returns the filename and local path"""
         if file and allowed_file(file.filename):
             # Generate unique filename
             ext = file.filename.rsplit('.', 1)[1].lower()
             filename = f"{uuid.uuid4()}.{ext}"
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], folder, filename)
-            file.save(filepath)
-            return filename, filepath
+            staged_path = media_store.staging_path(filename)
+            file.save(staged_path)
+            return filename, media_store.ingest(media_index.key_for(folder, filename), staged_path)
         return None, None
     
     def resolve_media_path(record, subfolder):
         """
-        Resolve a media file path, handling legacy absolute paths and relative paths.
+        Resolve a record's media file through the media store (no stat calls for known files).
         Returns an existing absolute path or None if not found.
+        Legacy paths are rewritten to keys by `flask media backfill`.
         """
-        stored_path = getattr(record, 'filepath', None)
-        filename = getattr(record, 'filename', None) or (os.path.basename(stored_path) if stored_path else None)
-        
-        candidates = []
-        
-        if stored_path:
-            if os.path.isabs(stored_path):
-                candidates.append(stored_path)
-            else:
-                normalized = stored_path.lstrip("./")
-                if normalized.startswith('uploads/'):
-                    normalized = normalized.split('/', 1)[1]
-                candidates.append(os.path.join(app.config['UPLOAD_FOLDER'], normalized))
-        
-        if filename:
-            candidates.append(os.path.join(app.config['UPLOAD_FOLDER'], subfolder, filename))
-            legacy_uploads = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'uploads', filename)
-            candidates.append(legacy_uploads)
-        
-        seen = set()
-        for candidate in candidates:
-            if not candidate or candidate in seen:
-                continue
-            seen.add(candidate)
-            if os.path.exists(candidate):
-                if stored_path != candidate:
-                    record.filepath = candidate
-                    print(f"🔄 Resolved {subfolder} path from '{stored_path}' to '{candidate}'")
-                return candidate
+        return media_store.resolve(getattr(record, 'filepath', None), subfolder, getattr(record, 'filename', None))
+    
+    def temp_clothing_path(filename):
+        """Path of a generated temp_*.png named by the client, or None if the name isn't one"""
+        if not filename or secure_filename(filename) != filename or not filename.startswith('temp_'):
+            return None
+        clothing_dir = os.path.realpath(os.path.join(app.config['UPLOAD_FOLDER'], 'clothing'))
+        path = os.path.realpath(os.path.join(clothing_dir, filename))
+        if os.path.dirname(path) != clothing_dir:
+            return None
+        return path
+    
+    def delete_media(stored_path, subfolder, filename):
+        """Drop a deleted record's reference to its file; returns a callable to run after commit"""
+        token = media_store.release(stored_path, subfolder, filename)
         
-        return None
+        def purge():
+            # Thumbnails and model inputs go with the last reference to the bytes
+            path = media_store.purge(token)
+            if path:
+                derivatives.remove(path)
+                model_inputs.remove(path)
+        return purge
+    
+    def no_progress(stage, **detail):
+        pass
+    
+    def with_progress(work):
+        """
+        Answer a generation request, streaming stage events when the client asks
+        for them (Accept: text/event-stream or ?stream=1), otherwise as plain JSON.
+        work(emit) reports stages through emit and returns the response payload.
+        """
+        fmt = stream_format(request)
+        if fmt:
+            return event_stream_response(run_with_progress(work), fmt)
+        return jsonify(work(no_progress)), 200
     
     # Routes
     @app.route('/api/health', methods=['GET'])
     def health_check():
         """Health check endpoint"""
-        return jsonify({'status': 'healthy', 'message': 'Try On API is running'}), 200
+        return jsonify({
+            'status': 'healthy',
+            'message': 'Try On API is running',
+            'background_removal_ready': gemini_service.rembg_ready
+        }), 200
+    
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint():
+        """Prometheus scrape endpoint (this process's metrics)"""
+        if not metrics.enabled:
+            return jsonify({'error': 'Metrics are disabled'}), 404
+        return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    
+    @app.route('/api/cache/stats', methods=['GET'])
+    def cache_stats():
+        """Result cache hit/miss counters for monitoring"""
+        try:
+            return jsonify({'result_cache': result_cache.stats()}), 200
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
     
     @app.route('/api/auth/register', methods=['POST'])
     def register():
@@ -225,15 +392,28 @@ def create_app(config_name='development'):
     @app.route('/api/photos', methods=['GET'])
     @jwt_required()
     def get_photos():
-        """Get all user photos"""
+        """Get user photos, newest first (?limit=&cursor=&fields= for paging)"""
         try:
             user_id = int(get_jwt_identity())
-            photos = Photo.query.filter_by(user_id=user_id).order_by(Photo.uploaded_at.desc()).all()
+            fields = parse_fields(request.args.get('fields'), Photo.FIELDS)
+            photos, next_cursor = keyset_page(
+                Photo.query.filter_by(user_id=user_id),
+                Photo.uploaded_at, Photo.id,
+                limit=parse_limit(
+                    request.args.get('limit'),
+                    app.config['LIST_MAX_PAGE_SIZE'],
+                    app.config['LIST_DEFAULT_PAGE_SIZE']
+                ),
+                cursor=request.args.get('cursor')
+            )
             
             return jsonify({
-                'photos': [photo.to_dict() for photo in photos]
+                'photos': [project(photo.to_dict(), fields) for photo in photos],
+                'next_cursor': next_cursor
             }), 200
             
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
@@ -257,12 +437,14 @@ def create_app(config_name='development'):
             photo = Photo(
                 user_id=user_id,
                 filename=filename,
-                filepath=filepath
+                filepath=media_index.key_for('photos', filename)
             )
             
             db.session.add(photo)
             db.session.commit()
             
+            prepare_source_media(filepath)
+            
             return jsonify({
                 'message': 'Photo uploaded successfully',
                 'photo': photo.to_dict()
@@ -283,17 +465,11 @@ def create_app(config_name='development'):
             if not photo:
                 return jsonify({'error': 'Photo not found'}), 404
             
-            # Delete file
-            if os.path.isabs(photo.filepath):
-                photo_path = photo.filepath
-            else:
-                photo_filename = os.path.basename(photo.filepath)
-                photo_path = os.path.join(app.config['UPLOAD_FOLDER'], 'photos', photo_filename)
-            if os.path.exists(photo_path):
-                os.remove(photo_path)
-            
+            # Delete file (once no other record shares its bytes)
+            purge_media = delete_media(photo.filepath, 'photos', photo.filename)
             db.session.delete(photo)
             db.session.commit()
+            purge_media()
             
             return jsonify({'message': 'Photo deleted successfully'}), 200
             
@@ -331,21 +507,33 @@ def create_app(config_name='development'):
     @app.route('/api/clothing', methods=['GET'])
     @jwt_required()
     def get_clothing():
-        """Get all clothing items"""
+        """Get clothing items, newest first (?limit=&cursor=&fields= for paging)"""
         try:
             user_id = int(get_jwt_identity())
             category = request.args.get('category')
+            fields = parse_fields(request.args.get('fields'), ClothingItem.FIELDS)
             
             query = ClothingItem.query.filter_by(user_id=user_id)
             if category and category != 'all':
                 query = query.filter_by(category=category)
             
-            items = query.order_by(ClothingItem.uploaded_at.desc()).all()
+            items, next_cursor = keyset_page(
+                query, ClothingItem.uploaded_at, ClothingItem.id,
+                limit=parse_limit(
+                    request.args.get('limit'),
+                    app.config['LIST_MAX_PAGE_SIZE'],
+                    app.config['LIST_DEFAULT_PAGE_SIZE']
+                ),
+                cursor=request.args.get('cursor')
+            )
             
             return jsonify({
-                'items': [item.to_dict() for item in items]
+                'items': [project(item.to_dict(), fields) for item in items],
+                'next_cursor': next_cursor
             }), 200
             
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
@@ -371,33 +559,20 @@ def create_app(config_name='development'):
             
             uploaded_items = []
             
+            # Store originals right away; backgrounds are removed by the worker stage
             for file in files:
-                if not file or not allowed_file(file.filename):
+                filename, filepath = save_uploaded_file(file, 'clothing')
+                if not filename:
                     continue
-                    
-                # Generate unique filename
-                ext = file.filename.rsplit('.', 1)[1].lower()
-                filename = f"{uuid.uuid4()}.{ext}"
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'clothing', filename)
-                
-                # Process with Gemini background removal
-                try:
-                    input_image = Image.open(file.stream)
-                    output_image = gemini_service.remove_background(input_image)
-                    output_image.save(filepath)
-                except Exception as e:
-                    print(f"⚠️ Background removal failed for {file.filename}: {e}")
-                    # Fallback to original (or rembg if gemini_service failed internally)
-                    file.seek(0)
-                    file.save(filepath)
                 
                 # Create clothing item record
                 item = ClothingItem(
                     user_id=user_id,
                     filename=filename,
-                    filepath=filepath,
+                    filepath=media_index.key_for('clothing', filename),
                     category=category,
-                    price=price
+                    price=price,
+                    status='processing'
                 )
                 
                 db.session.add(item)
@@ -405,6 +580,9 @@ def create_app(config_name='development'):
             
             db.session.commit()
             
+            background_removal.submit([item.id for item in uploaded_items])
+            wardrobe_cache.invalidate(user_id)
+            
             return jsonify({
                 'message': f'{len(uploaded_items)} clothing items uploaded successfully',
                 'items': [item.to_dict() for item in uploaded_items]
@@ -425,17 +603,12 @@ def create_app(config_name='development'):
             if not item:
                 return jsonify({'error': 'Clothing item not found'}), 404
             
-            # Delete file
-            if os.path.isabs(item.filepath):
-                item_path = item.filepath
-            else:
-                item_filename = os.path.basename(item.filepath)
-                item_path = os.path.join(app.config['UPLOAD_FOLDER'], 'clothing', item_filename)
-            if os.path.exists(item_path):
-                os.remove(item_path)
-            
+            # Delete file (once no other record shares its bytes)
+            purge_media = delete_media(item.filepath, 'clothing', item.filename)
             db.session.delete(item)
             db.session.commit()
+            purge_media()
+            wardrobe_cache.invalidate(user_id)
             
             return jsonify({'message': 'Clothing item deleted successfully'}), 200
             
@@ -446,7 +619,7 @@ def create_app(config_name='development'):
     @app.route('/api/tryon', methods=['POST'])
     @jwt_required()
     def virtual_tryon():
-        """Generate virtual try-on"""
+        """Queue a virtual try-on job"""
         try:
             user_id = int(get_jwt_identity())
             data = request.get_json()
@@ -469,80 +642,396 @@ def create_app(config_name='development'):
             if not photo or not clothing:
                 return jsonify({'error': 'Photo or clothing not found'}), 404
             
-            # Resolve absolute paths, tolerating legacy locations
+            if clothing.status == 'processing':
+                return jsonify({'error': 'This clothing item is still being processed. Please try again shortly.'}), 409
+            
+            # Fail fast on missing files instead of queueing a job that cannot run
             photo_path = resolve_media_path(photo, 'photos')
             clothing_path = resolve_media_path(clothing, 'clothing')
-            
             if not photo_path or not clothing_path:
                 return jsonify({'error': 'Photo or clothing image not found on server. Please re-upload and try again.'}), 404
             
-            # Debug logging (only in development)
-            if app.debug:
-                print(f"🔍 UPLOAD_FOLDER: {app.config['UPLOAD_FOLDER']}")
-                print(f"🔍 photo.filepath from DB: {photo.filepath}")
-                print(f"🔍 clothing.filepath from DB: {clothing.filepath}")
-                print(f"🔍 photo_path resolved: {photo_path}")
-                print(f"🔍 clothing_path resolved: {clothing_path}")
-                print(f"🔍 photo exists? {os.path.exists(photo_path)} | clothing exists? {os.path.exists(clothing_path)}")
-            
-            if not os.path.exists(photo_path) or not os.path.exists(clothing_path):
-                return jsonify({'error': 'Source image missing on disk. Please re-upload and try again.'}), 404
-            
-            # Generate try-on using Gemini
-            clothing_desc = f"{clothing.category} ({os.path.splitext(clothing.filename)[0].replace('_', ' ')})"
-            prompt = (
-                f"Take the {clothing_desc} from the first image "
-                "and let the person from the second image wear it. "
-
+            # Start preparing the model inputs in the background; the job
+            # resolves them, so nothing is encoded on the request thread
+            model_inputs.lookup(photo_path)
+            model_inputs.lookup(clothing_path)
+            
+            # Identical inputs were generated before: answer from the cache
+            # without spending a credit or an upstream call. Keyed on the
+            # uploads, so the key doesn't depend on whether inputs are prepared yet.
+            cache_key = result_cache.make_key(
+                [photo_path, clothing_path],
+                build_tryon_prompt(clothing),
+                GeminiService.TRYON_CONFIG_SIGNATURE
             )
-            
-            try:
-                result_image = gemini_service.virtual_tryon(photo_path, clothing_path, prompt=prompt)
-            except Exception as gen_error:
-                import traceback
-                traceback.print_exc()
-                return jsonify({'error': f"Virtual try-on failed: {gen_error}"}), 500
-            
-            # Save result with optimization
-            result_filename = f"{uuid.uuid4()}.png"
-            result_filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'results', result_filename)
-            # Optimize image size if too large
-            if max(result_image.size) > 2048:
-                ratio = 2048 / max(result_image.size)
-                new_size = (int(result_image.width * ratio), int(result_image.height * ratio))
-                result_image = result_image.resize(new_size, Image.Resampling.LANCZOS)
-            result_image.save(result_filepath, optimize=True)
-            
-            # Get AI analysis from Gemini service
-            ai_analysis = getattr(gemini_service, 'last_analysis', None)
-            
-            # Save to database
-            saved_look = SavedLook(
+            cached = result_cache.get(cache_key)
+            if cached:
+                saved_look = save_cached_look(cached, user_id, photo, clothing)
+                job = Job(
+                    user_id=user_id,
+                    kind='tryon',
+                    status='succeeded',
+                    stage='saved',
+                    saved_look=saved_look,
+                    started_at=saved_look.created_at,
+                    finished_at=saved_look.created_at
+                )
+                db.session.add(job)
+                db.session.commit()
+                
+                return jsonify({
+                    'message': 'Virtual try-on served from cache',
+                    'job': job.to_dict(),
+                    'credits_remaining': user.credits
+                }), 200
+            
+            # The same request already queued or running (double tap, client
+            # retry): attach to that job rather than paying for a second one
+            dedupe_key = hashlib.sha256(f"{user_id}|{cache_key}".encode()).hexdigest()
+            active_job = find_active_job(dedupe_key)
+            if active_job:
+                return coalesced_job_response(active_job, user_id)
+            
+            job = Job(
                 user_id=user_id,
-                photo_id=photo_id,
-                clothing_id=clothing_id,
-                result_filename=result_filename,
-                result_filepath=result_filepath,
-                ai_analysis=ai_analysis
+                kind='tryon',
+                payload=json.dumps({'photo_id': photo.id, 'clothing_id': clothing.id}),
+                dedupe_key=dedupe_key
             )
             
-            # Update stats
-            user.credits -= 1
-            clothing.wear_count += 1
+            # Reserve the credit now so queued jobs can't overspend; refunded on failure.
+            # The check and decrement are one UPDATE, so parallel requests can't both
+            # spend the last credit.
+            if not spend_credits(user_id):
+                db.session.rollback()
+                return jsonify({'error': 'Insufficient credits. Watch an ad or upgrade to continue.'}), 402
             
-            db.session.add(saved_look)
-            db.session.commit()
+            db.session.add(job)
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # An identical request in another worker created its job first;
+                # the rollback also returns the credit
+                db.session.rollback()
+                active_job = find_active_job(dedupe_key)
+                if not active_job:
+                    raise
+                return coalesced_job_response(active_job, user_id)
+            
+            job_queue.submit(job.id)
             
             return jsonify({
-                'message': 'Virtual try-on generated successfully',
-                'result': saved_look.to_dict(),
-                'credits_remaining': user.credits
-            }), 201
+                'message': 'Virtual try-on queued',
+                'job': job.to_dict(),
+                'credits_remaining': current_credits(user_id)
+            }), 202
             
         except Exception as e:
             db.session.rollback()
             return jsonify({'error': str(e)}), 500
     
+    def find_active_job(dedupe_key):
+        """The queued or running job for an identical request, if any"""
+        active = Job.status.in_(('queued', 'running'))
+        # A job this old was most likely orphaned by a crashed worker; stop
+        # routing duplicates to it
+        cutoff = utcnow() - timedelta(seconds=app.config['JOB_DEDUPE_MAX_AGE'])
+        stale = Job.query.filter(Job.dedupe_key == dedupe_key, active, Job.created_at < cutoff).update(
+            {'dedupe_key': None}, synchronize_session=False
+        )
+        if stale:
+            db.session.commit()
+        return Job.query.filter(Job.dedupe_key == dedupe_key, active).first()
+    
+    def coalesced_job_response(job, user_id):
+        metrics.inc('coalesced_requests_total', kind='tryon_job')
+        return jsonify({
+            'message': 'Identical virtual try-on already in progress',
+            'job': job.to_dict(),
+            'coalesced': True,
+            'credits_remaining': current_credits(user_id)
+        }), 202
+    
+    def build_tryon_prompt(clothing):
+        clothing_desc = f"{clothing.category} ({os.path.splitext(clothing.filename)[0].replace('_', ' ')})"
+        return (
+            f"Take the {clothing_desc} from the first image "
+            "and let the person from the second image wear it. "
+
+        )
+    
+    def stage_generated_image(image, max_side=None):
+        """
+        Write a GeneratedImage to staging, returning (filename, staged_path).
+        
+        The encoded bytes are written verbatim; only an image larger than
+        max_side is decoded and downscaled. Compact WebP variants come from
+        the background derivative generator, not from re-encoding here.
+        """
+        if max_side and max(image.size) > max_side:
+            result_filename = f"{uuid.uuid4()}.png"
+            staged_path = media_store.staging_path(result_filename)
+            ratio = max_side / max(image.size)
+            new_size = (int(image.width * ratio), int(image.height * ratio))
+            with image.open() as decoded:
+                decoded.resize(new_size, Image.Resampling.LANCZOS).save(staged_path)
+            return result_filename, staged_path
+        
+        result_filename = f"{uuid.uuid4()}{image.extension}"
+        staged_path = media_store.staging_path(result_filename)
+        image.save(staged_path)
+        return result_filename, staged_path
+    
+    def save_cached_look(cached, user_id, photo, clothing):
+        """Create a SavedLook backed by a copy of a cached result"""
+        # Keep the cached file's format (results are stored as the model encoded them)
+        result_filename = f"{uuid.uuid4()}{os.path.splitext(cached.filename)[1] or '.png'}"
+        staged_path = media_store.staging_path(result_filename)
+        result_cache.materialize(cached, staged_path)
+        # Same bytes as the earlier result, so the store keeps a single copy
+        result_filepath = media_store.ingest(media_index.key_for('results', result_filename), staged_path)
+        derivatives.schedule(result_filepath)
+        
+        saved_look = SavedLook(
+            user_id=user_id,
+            photo_id=photo.id,
+            clothing_id=clothing.id,
+            result_filename=result_filename,
+            result_filepath=media_index.key_for('results', result_filename),
+            ai_analysis=cached.analysis,
+            created_at=utcnow()
+        )
+        increment(ClothingItem, clothing.id, 'wear_count')
+        db.session.add(saved_look)
+        return saved_look
+    
+    def run_tryon_job(job):
+        """Generate a try-on for a queued job and attach the resulting SavedLook"""
+        payload = json.loads(job.payload)
+        photo = Photo.query.filter_by(id=payload['photo_id'], user_id=job.user_id).first()
+        clothing = ClothingItem.query.filter_by(id=payload['clothing_id'], user_id=job.user_id).first()
+        
+        if not photo or not clothing:
+            raise ValueError('Photo or clothing not found')
+        
+        def set_stage(stage, **detail):
+            job_queue.set_stage(job, stage)
+        
+        set_stage('preparing_inputs')
+        
+        # Resolve absolute paths, tolerating legacy locations
+        photo_path = resolve_media_path(photo, 'photos')
+        clothing_path = resolve_media_path(clothing, 'clothing')
+        
+        if not photo_path or not clothing_path:
+            raise FileNotFoundError('Photo or clothing image not found on server. Please re-upload and try again.')
+        
+        # Debug logging (only in development)
+        if app.debug:
+            print(f"🔍 UPLOAD_FOLDER: {app.config['UPLOAD_FOLDER']}")
+            print(f"🔍 photo.filepath from DB: {photo.filepath}")
+            print(f"🔍 clothing.filepath from DB: {clothing.filepath}")
+            print(f"🔍 photo_path resolved: {photo_path}")
+            print(f"🔍 clothing_path resolved: {clothing_path}")
+        
+        # Send the pre-downscaled inputs rather than full-size originals
+        with metrics.timed('inputs_prepare'):
+            photo_input = model_inputs.resolve(photo_path)
+            clothing_input = model_inputs.resolve(clothing_path)
+        
+        prompt = build_tryon_prompt(clothing)
+        with metrics.timed('cache_key'):
+            # Same key as virtual_tryon(): the uploads, not the prepared inputs
+            cache_key = result_cache.make_key([photo_path, clothing_path], prompt, GeminiService.TRYON_CONFIG_SIGNATURE)
+        
+        # An identical job may have finished while this one was queued
+        cached = result_cache.get(cache_key)
+        if cached:
+            saved_look = save_cached_look(cached, job.user_id, photo, clothing)
+            db.session.flush()
+            job.saved_look_id = saved_look.id
+            job.stage = 'saved'
+            refund_job_credit(job)
+            return
+        
+        # Generate try-on using Gemini, reporting model call progress on the job
+        with gemini_service.reporting(set_stage), gemini_service.acting_for(job.user_id):
+            result_image = gemini_service.virtual_tryon(photo_input, clothing_input, prompt=prompt)
+        set_stage('post_processing')
+        
+        # Store the model's bytes as-is unless the image is too large
+        with metrics.timed('result_encode'):
+            result_filename, staged_path = stage_generated_image(result_image, max_side=2048)
+        with metrics.timed('result_store'):
+            result_filepath = media_store.ingest(media_index.key_for('results', result_filename), staged_path)
+        derivatives.schedule(result_filepath)
+        
+        # Previews are a degraded fallback, never cache them
+        if not gemini_service.last_was_preview:
+            result_cache.put(cache_key, result_filepath, analysis=gemini_service.last_analysis)
+        
+        # Save to database
+        saved_look = SavedLook(
+            user_id=job.user_id,
+            photo_id=photo.id,
+            clothing_id=clothing.id,
+            result_filename=result_filename,
+            result_filepath=media_index.key_for('results', result_filename),
+            ai_analysis=gemini_service.last_analysis
+        )
+        
+        # Update stats
+        increment(ClothingItem, clothing.id, 'wear_count')
+        
+        db.session.add(saved_look)
+        db.session.flush()
+        job.saved_look_id = saved_look.id
+        # Committed together with the job's 'succeeded' status
+        job.stage = 'saved'
+    
+    def refund_job_credit(job):
+        """Give back the credit reserved when the job was queued"""
+        increment(User, job.user_id, 'credits')
+    
+    job_queue.register('tryon', run_tryon_job, on_failure=refund_job_credit)
+    
+    @app.route('/api/jobs/<job_id>', methods=['GET'])
+    @jwt_required()
+    def get_job(job_id):
+        """Get job status; pass ?wait=<seconds> to long-poll until it finishes"""
+        try:
+            user_id = int(get_jwt_identity())
+            job = Job.query.filter_by(id=job_id, user_id=user_id).first()
+            
+            if not job:
+                return jsonify({'error': 'Job not found'}), 404
+            
+            try:
+                wait = min(float(request.args.get('wait', 0)), app.config['JOB_POLL_MAX_WAIT'])
+            except (ValueError, TypeError):
+                wait = 0
+            
+            deadline = time.monotonic() + wait
+            while not job.is_finished:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                # Release the DB connection while blocked, and wake at least once
+                # a second so jobs finished by other processes are seen
+                db.session.close()
+                job_queue.wait(min(remaining, 1.0))
+                job = db.session.get(Job, job_id)
+            
+            return jsonify({'job': job.to_dict()}), 200
+            
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+    
+    @app.route('/api/jobs/<job_id>/events', methods=['GET'])
+    @jwt_required()
+    def stream_job_events(job_id):
+        """Stream a job's progress stages as Server-Sent Events (?stream=ndjson for NDJSON) until it finishes"""
+        user_id = int(get_jwt_identity())
+        if not Job.query.filter_by(id=job_id, user_id=user_id).first():
+            return jsonify({'error': 'Job not found'}), 404
+        
+        def job_events():
+            deadline = time.monotonic() + app.config['JOB_EVENTS_MAX_WAIT']
+            last_stage = None
+            last_sent = time.monotonic()
+            while True:
+                job = db.session.get(Job, job_id)
+                if job.stage and job.stage != last_stage:
+                    last_stage = job.stage
+                    last_sent = time.monotonic()
+                    yield 'stage', {'stage': job.stage, 'status': job.status}
+                if job.is_finished:
+                    yield ('done' if job.status == 'succeeded' else 'failed'), {'job': job.to_dict()}
+                    return
+                if time.monotonic() >= deadline:
+                    # Clients reconnect to keep following the job
+                    yield 'timeout', {'job': job.to_dict()}
+                    return
+                if time.monotonic() - last_sent >= 15:
+                    last_sent = time.monotonic()
+                    yield None, {}
+                # Poll the job row once a second (stage changes in other workers
+                # aren't signalled here) without holding a connection in between
+                db.session.close()
+                job_queue.wait(1.0)
+        
+        return event_stream_response(job_events(), stream_format(request) or 'sse')
+    
+    def build_wardrobe_snapshot(user_id):
+        """Resolve the user's ready clothing to stored image paths and prompt names"""
+        clothing_items = ClothingItem.query.filter_by(user_id=user_id).all()
+        
+        items = {}
+        paths = {}
+        for item in clothing_items:
+            if item.status == 'processing':
+                continue
+            resolved_path = resolve_media_path(item, 'clothing')
+            if resolved_path:
+                paths[item.id] = resolved_path
+                items[item.id] = {
+                    'id': item.id,
+                    'category': item.category,
+                    'filename': item.filename,
+                    'display_name': os.path.splitext(item.filename)[0].replace('_', ' ')
+                }
+            else:
+                print(f"⚠️ Missing clothing image on disk for item {item.id} ({item.filename})")
+        
+        return WardrobeSnapshot(items, paths, total_items=len(clothing_items))
+    
+    def plan_outfits(outfits, wardrobe):
+        """Turn recommended outfits into render specs, dropping unknown or missing items"""
+        # Validate outfits up front so rendering threads never touch the ORM
+        outfit_specs = []
+        for outfit in outfits:
+            raw_ids = outfit.get('item_ids') or []
+            try:
+                item_ids = [int(i) for i in raw_ids]
+            except (TypeError, ValueError):
+                print(f"⚠️  Skipping outfit due to invalid item ids: {raw_ids}")
+                continue
+            
+            selected_items = []
+            item_paths = []
+            for item_id in item_ids:
+                item = wardrobe.items.get(item_id)
+                path = wardrobe.paths.get(item_id)
+                if item and path:
+                    selected_items.append(item)
+                    # Inputs still being prepared in the background go out as the original
+                    item_paths.append(model_inputs.lookup(path))
+                elif item:
+                    print(f"⚠️  Item id {item_id} found but file missing; skipping this item.")
+                else:
+                    print(f"⚠️  Item id {item_id} not found in wardrobe; skipping outfit segment.")
+            
+            if len(selected_items) == 0 or len(item_paths) == 0:
+                continue
+            
+            prompt_items = ", ".join(
+                f"{item['category']} ({item['display_name']})"
+                for item in selected_items
+            )
+            outfit_specs.append({
+                'name': outfit.get('name') or 'Outfit',
+                'description': outfit.get('description'),
+                'item_ids': item_ids,
+                'items': [dict(item) for item in selected_items],
+                'item_paths': item_paths,
+                'image_prompt': (
+                    f"Take the {prompt_items} from the clothing images "
+                    "and let the person from the final image wear them. "
+
+                )
+            })
+        return outfit_specs
+    
     @app.route('/api/style-me', methods=['POST'])
     @jwt_required()
     def style_me():
@@ -559,26 +1048,14 @@ def create_app(config_name='development'):
             if not occasion or not location:
                 return jsonify({'error': 'Occasion and location required'}), 400
             
-            # Get user's wardrobe and resolve available file paths
-            clothing_items = ClothingItem.query.filter_by(user_id=user_id).all()
-            if len(clothing_items) == 0:
+            # User's wardrobe with resolved file paths (cached until the wardrobe changes)
+            wardrobe = wardrobe_cache.get(user_id, lambda: build_wardrobe_snapshot(user_id))
+            if wardrobe.total_items == 0:
                 return jsonify({'error': 'No clothing items in wardrobe'}), 400
             
-            clothing_paths = {}
-            available_items = []
-            for item in clothing_items:
-                resolved_path = resolve_media_path(item, 'clothing')
-                if resolved_path and os.path.exists(resolved_path):
-                    clothing_paths[item.id] = resolved_path
-                    available_items.append(item)
-                else:
-                    print(f"⚠️ Missing clothing image on disk for item {item.id} ({item.filename})")
-            
-            if len(available_items) == 0:
+            if len(wardrobe.items) == 0:
                 return jsonify({'error': 'No clothing images found on server. Please re-upload your wardrobe items.'}), 404
             
-            clothing_lookup = {item.id: item for item in available_items}
-            
             # Ensure a base photo is selected for visualization output
             base_photo = Photo.query.filter_by(user_id=user_id, is_selected=True).first()
             if not base_photo:
@@ -587,8 +1064,9 @@ def create_app(config_name='development'):
                 return jsonify({'error': 'Please upload and select a photo before generating a style.'}), 400
             
             base_photo_path = resolve_media_path(base_photo, 'photos')
-            if not base_photo_path or not os.path.exists(base_photo_path):
+            if not base_photo_path:
                 return jsonify({'error': 'Base photo not found on server. Please re-upload and try again.'}), 404
+            base_photo_path = model_inputs.resolve(base_photo_path)
             
             # Get weather if requested
             weather_info = None
@@ -600,12 +1078,6 @@ def create_app(config_name='development'):
             if weather_info:
                 weather_context = f"Temperature: {weather_info['temperature']}°{weather_info['temperature_unit']}, Conditions: {weather_info['conditions']}"
             
-            wardrobe_lines = []
-            for item in available_items:
-                display_name = os.path.splitext(item.filename)[0].replace('_', ' ')
-                wardrobe_lines.append(f"{item.id}: Category={item.category}, Name={display_name}")
-            wardrobe_text = "\n".join(wardrobe_lines)
-            
             styling_prompt = f"""
 You are an expert fashion stylist. Using the wardrobe inventory provided, build 2-3 complete outfits that fit the user request.
 
@@ -616,7 +1088,7 @@ User Context:
 - Weather: {weather_context}
 
 Wardrobe Inventory (each item has a unique numeric id):
-{wardrobe_text}
+{wardrobe.inventory_text}
 
 Rules:
 1. Only reference item ids that exist in the wardrobe inventory.
@@ -641,77 +1113,80 @@ Ensure each outfit lists at least one item id.
             if weather_info:
                 print(f"🌡️  Weather: {weather_info['temperature']}°{weather_info['temperature_unit']}, {weather_info['conditions']}")
             
-            recommendation_payload = gemini_service.recommend_outfits(styling_prompt)
-            outfits = recommendation_payload.get('outfits', [])
+            def recommend():
+                with gemini_service.acting_for(user_id):
+                    outfits = gemini_service.recommend_outfits(styling_prompt).get('outfits', [])
+                return plan_outfits(outfits, wardrobe) if outfits else []
+            
+            def render_outfit(spec):
+                with metrics.timed('style_me_outfit'):
+                    with gemini_service.acting_for(user_id):
+                        result_image = gemini_service.virtual_tryon(
+                            base_photo_path,
+                            spec['item_paths'],
+                            prompt=spec['image_prompt']
+                        )
+                    
+                    result_filename, staged_path = stage_generated_image(result_image)
+                    # Runs on a style-me worker thread, outside the request's app context
+                    with app.app_context():
+                        result_filepath = media_store.ingest(media_index.key_for('results', result_filename), staged_path)
+                        db.session.commit()
+                    derivatives.schedule(result_filepath)
+                
+                return {
+                    'name': spec['name'],
+                    'description': spec['description'],
+                    'item_ids': spec['item_ids'],
+                    'items': spec['items'],
+                    'image_url': f"/uploads/results/{result_filename}",
+                    'analysis': gemini_service.last_analysis
+                }
+            
+            outfit_timeout = app.config['STYLE_ME_OUTFIT_TIMEOUT']
+            
+            fmt = stream_format(request)
+            if fmt:
+                def stream_outfits():
+                    # Stage events, then one event per outfit as it finishes;
+                    # `index` preserves the recommendation order for the client.
+                    yield 'model_call_started', {'step': 'recommendations'}
+                    outfit_specs = recommend()
+                    if not outfit_specs:
+                        raise ValueError('Gemini did not return any outfit selections')
+                    yield 'recommendations', {'outfits': [
+                        {key: spec[key] for key in ('name', 'description', 'item_ids', 'items')}
+                        for spec in outfit_specs
+                    ]}
+                    
+                    tasks = [lambda spec=spec: render_outfit(spec) for spec in outfit_specs]
+                    generated = 0
+                    for index, outfit, error in fan_out(style_executor, tasks, timeout=outfit_timeout):
+                        if error:
+                            print(f"⚠️  Failed to generate visualization for outfit: {error}")
+                            yield 'outfit_failed', {'index': index, 'error': str(error)}
+                            continue
+                        generated += 1
+                        yield 'outfit', {'index': index, 'outfit': outfit}
+                    yield 'done', {
+                        'generated': generated,
+                        'weather': weather_info,
+                        'wardrobe_items': len(wardrobe.items)
+                    }
+                
+                return event_stream_response(stream_outfits(), fmt)
             
-            if not outfits:
+            outfit_specs = recommend()
+            if not outfit_specs:
                 return jsonify({'error': 'Gemini did not return any outfit selections'}), 502
             
+            tasks = [lambda spec=spec: render_outfit(spec) for spec in outfit_specs]
             generated_outfits = []
-            for outfit in outfits:
-                raw_ids = outfit.get('item_ids') or []
-                try:
-                    item_ids = [int(i) for i in raw_ids]
-                except (TypeError, ValueError):
-                    print(f"⚠️  Skipping outfit due to invalid item ids: {raw_ids}")
-                    continue
-                
-                selected_items = []
-                item_paths = []
-                for item_id in item_ids:
-                    item = clothing_lookup.get(item_id)
-                    path = clothing_paths.get(item_id)
-                    if item and path:
-                        selected_items.append(item)
-                        item_paths.append(path)
-                    elif item:
-                        print(f"⚠️  Item id {item_id} found but file missing; skipping this item.")
-                    else:
-                        print(f"⚠️  Item id {item_id} not found in wardrobe; skipping outfit segment.")
-                
-                if len(selected_items) == 0 or len(item_paths) == 0:
-                    continue
-                
-                try:
-                    prompt_items = ", ".join(
-                        f"{item.category} ({os.path.splitext(item.filename)[0].replace('_', ' ')})"
-                        for item in selected_items
-                    )
-                    image_prompt = (
-                        f"Take the {prompt_items} from the clothing images "
-                        "and let the person from the final image wear them. "
-
-                    )
-                    
-                    result_image = gemini_service.virtual_tryon(
-                        base_photo_path,
-                        item_paths,
-                        prompt=image_prompt
-                    )
-                    
-                    result_filename = f"{uuid.uuid4()}.png"
-                    result_filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'results', result_filename)
-                    result_image.save(result_filepath)
-                    
-                    generated_outfits.append({
-                        'name': outfit.get('name') or 'Outfit',
-                        'description': outfit.get('description'),
-                        'item_ids': item_ids,
-                        'items': [
-                            {
-                                'id': item.id,
-                                'category': item.category,
-                                'filename': item.filename,
-                                'display_name': os.path.splitext(item.filename)[0].replace('_', ' ')
-                            }
-                            for item in selected_items
-                        ],
-                        'image_url': f"/uploads/results/{result_filename}",
-                        'analysis': getattr(gemini_service, 'last_analysis', None)
-                    })
-                except Exception as outfit_error:
-                    print(f"⚠️  Failed to generate visualization for outfit: {outfit_error}")
+            for outfit, error in fan_out_ordered(style_executor, tasks, timeout=outfit_timeout):
+                if error:
+                    print(f"⚠️  Failed to generate visualization for outfit: {error}")
                     continue
+                generated_outfits.append(outfit)
             
             if len(generated_outfits) == 0:
                 return jsonify({'error': 'Unable to generate visual outfits. Please try again.'}), 500
@@ -720,7 +1195,7 @@ Ensure each outfit lists at least one item id.
                 'message': 'Outfit recommendations generated',
                 'outfits': generated_outfits,
                 'weather': weather_info,
-                'wardrobe_items': len(available_items)
+                'wardrobe_items': len(wardrobe.items)
             }), 200
             
         except Exception as e:
@@ -731,15 +1206,33 @@ Ensure each outfit lists at least one item id.
     @app.route('/api/saved-looks', methods=['GET'])
     @jwt_required()
     def get_saved_looks():
-        """Get all saved looks"""
+        """Get saved looks, newest first (?limit=&cursor=&fields= for paging)"""
         try:
             user_id = int(get_jwt_identity())
-            looks = SavedLook.query.filter_by(user_id=user_id).order_by(SavedLook.created_at.desc()).all()
+            fields = parse_fields(request.args.get('fields'), SavedLook.FIELDS)
+            
+            query = SavedLook.query.filter_by(user_id=user_id)
+            if fields is not None and 'ai_analysis' not in fields:
+                # The analysis text dwarfs the rest of the row; leave it on disk
+                query = query.options(defer(SavedLook.ai_analysis))
+            
+            looks, next_cursor = keyset_page(
+                query, SavedLook.created_at, SavedLook.id,
+                limit=parse_limit(
+                    request.args.get('limit'),
+                    app.config['LIST_MAX_PAGE_SIZE'],
+                    app.config['LIST_DEFAULT_PAGE_SIZE']
+                ),
+                cursor=request.args.get('cursor')
+            )
             
             return jsonify({
-                'looks': [look.to_dict() for look in looks]
+                'looks': [project(look.to_dict(fields), fields) for look in looks],
+                'next_cursor': next_cursor
             }), 200
             
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
@@ -754,17 +1247,12 @@ Ensure each outfit lists at least one item id.
             if not look:
                 return jsonify({'error': 'Saved look not found'}), 404
             
-            # Delete file
-            if os.path.isabs(look.result_filepath):
-                result_path = look.result_filepath
-            else:
-                result_filename = os.path.basename(look.result_filepath)
-                result_path = os.path.join(app.config['UPLOAD_FOLDER'], 'results', result_filename)
-            if os.path.exists(result_path):
-                os.remove(result_path)
-            
+            # Delete file (once no other record shares its bytes)
+            purge_media = delete_media(look.result_filepath, 'results', look.result_filename)
+            Job.query.filter_by(saved_look_id=look.id).update({'saved_look_id': None})
             db.session.delete(look)
             db.session.commit()
+            purge_media()
             
             return jsonify({'message': 'Saved look deleted successfully'}), 200
             
@@ -774,8 +1262,33 @@ Ensure each outfit lists at least one item id.
     
     @app.route('/uploads/<path:filename>')
     def serve_upload(filename):
-        """Serve uploaded files with caching"""
-        response = send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+        """Serve uploaded files with caching; ?w=<width> serves a downscaled copy"""
+        response = None
+        
+        # Stored media resolve through the store; anything else (unsaved previews)
+        # is served from the upload folder
+        source = media_store.resolve_key(filename) if safe_join(app.config['UPLOAD_FOLDER'], filename) else None
+        
+        width = request.args.get('w', type=int)
+        if width and width > 0:
+            if source:
+                # Only trust an explicit image/webp, not */* or image/* wildcards
+                accepts_webp = any(mimetype == 'image/webp' for mimetype, _ in request.accept_mimetypes)
+                try:
+                    derivative = derivatives.get(source, derivatives.snap_width(width), 'webp' if accepts_webp else 'jpeg')
+                except Exception as e:
+                    print(f"⚠️ Could not build thumbnail for {filename}: {e}")
+                    derivative = None
+                if derivative:
+                    response = send_from_directory(os.path.dirname(derivative), os.path.basename(derivative))
+                    response.vary.add('Accept')
+        
+        # send_from_directory sets an ETag and answers If-None-Match with 304
+        if response is None:
+            if source:
+                response = send_from_directory(os.path.dirname(source), os.path.basename(source))
+            else:
+                response = send_from_directory(app.config['UPLOAD_FOLDER'], filename)
         # Add cache headers for static images (30 days)
         response.cache_control.max_age = 2592000  # 30 days in seconds
         response.cache_control.public = True
@@ -825,6 +1338,14 @@ Ensure each outfit lists at least one item id.
             if existing:
                 return jsonify({'error': 'You have already entered this challenge'}), 400
             
+            # Bump the counter in SQL so concurrent entries don't lose updates
+            updated = Challenge.query.filter_by(id=challenge_id).update(
+                {Challenge.entry_count: Challenge.entry_count + 1},
+                synchronize_session=False
+            )
+            if not updated:
+                return jsonify({'error': 'Challenge not found'}), 404
+            
             entry = ChallengeEntry(
                 challenge_id=challenge_id,
                 user_id=user_id,
@@ -835,6 +1356,7 @@ Ensure each outfit lists at least one item id.
             
             return jsonify({'message': 'Entered challenge successfully', 'entry': entry.to_dict()}), 201
         except Exception as e:
+            db.session.rollback()
             return jsonify({'error': str(e)}), 500
 
     @app.route('/api/challenges/<int:challenge_id>/entries', methods=['GET'])
@@ -843,11 +1365,21 @@ Ensure each outfit lists at least one item id.
         """Get entries for a challenge to vote on"""
         try:
             user_id = int(get_jwt_identity())
-            # Get entries not by current user
-            entries = ChallengeEntry.query.filter(
-                ChallengeEntry.challenge_id == challenge_id,
-                ChallengeEntry.user_id != user_id
-            ).order_by(func.random()).limit(10).all()
+            # Random entries not by the current user and not yet voted on
+            entry_ids = sample_entry_ids(
+                challenge_id, user_id, limit=10,
+                exclude=vote_recorder.pending_entry_ids(user_id)
+            )
+            
+            entries = []
+            if entry_ids:
+                entries = ChallengeEntry.query.options(
+                    # Load author name and look filename in the same query as the entries
+                    joinedload(ChallengeEntry.user).load_only(User.full_name),
+                    joinedload(ChallengeEntry.saved_look).load_only(SavedLook.result_filename)
+                ).filter(ChallengeEntry.id.in_(entry_ids)).all()
+                # Keep the sampled (random) order
+                entries.sort(key=lambda e: entry_ids.index(e.id))
             
             return jsonify({'entries': [e.to_dict() for e in entries]}), 200
         except Exception as e:
@@ -875,11 +1407,13 @@ Ensure each outfit lists at least one item id.
             if entry.user_id == user_id:
                 return jsonify({'error': 'Cannot vote for your own entry'}), 400
 
-            entry.votes += 1
-            db.session.commit()
+            # Recorded so the entry isn't offered to this user again
+            if not vote_recorder.record(user_id, entry.challenge_id, entry.id):
+                return jsonify({'error': 'You have already voted for this entry'}), 400
 
             return jsonify({'message': 'Vote recorded'}), 200
         except Exception as e:
+            db.session.rollback()
             return jsonify({'error': str(e)}), 500
 
     # --- Monetization Features ---
@@ -890,11 +1424,12 @@ Ensure each outfit lists at least one item id.
         """Reward user with credit for watching ad"""
         try:
             user_id = int(get_jwt_identity())
-            user = User.query.get(user_id)
-            user.credits += 1
+            if not increment(User, user_id, 'credits'):
+                return jsonify({'error': 'User not found'}), 404
             db.session.commit()
-            return jsonify({'message': 'Credit added', 'credits': user.credits}), 200
+            return jsonify({'message': 'Credit added', 'credits': current_credits(user_id)}), 200
         except Exception as e:
+            db.session.rollback()
             return jsonify({'error': str(e)}), 500
 
     # --- Retention Features ---
@@ -940,19 +1475,41 @@ Ensure each outfit lists at least one item id.
             
             if not description:
                 return jsonify({'error': 'Description required'}), 400
-                
-            image = gemini_service.generate_clothing_image(description)
             
-            # Save image to temp folder first
-            filename = f"temp_{uuid.uuid4()}.png"
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'clothing', filename)
-            image.save(filepath)
-            
-            return jsonify({
-                'message': 'Preview generated',
-                'temp_image_url': f"/uploads/clothing/{filename}",
-                'filename': filename
-            }), 200
+            def generate(emit):
+                with gemini_service.reporting(emit), gemini_service.acting_for(user_id):
+                    image = gemini_service.generate_clothing_image(description)
+                
+                # Save image to temp folder first
+                emit('post_processing', step='save')
+                filename = f"temp_{uuid.uuid4()}.png"
+                filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'clothing', filename)
+                image.save(filepath)
+                emit('saved')
+                
+                return {
+                    'message': 'Preview generated',
+                    'temp_image_url': f"/uploads/clothing/{filename}",
+                    'filename': filename
+                }
+            
+            # Identical requests in flight (double taps, retries) share one generation
+            key = hashlib.sha256(json.dumps(
+                [user_id, description, GeminiService.GENERATE_CLOTHING_SIGNATURE]
+            ).encode()).hexdigest()
+            
+            def generate_once(emit):
+                payload, shared = clothing_generations.do(key, lambda: generate(emit))
+                if shared:
+                    # Refining or saving consumes the temp file, so each caller gets its own copy
+                    clothing_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'clothing')
+                    filename = f"temp_{uuid.uuid4()}.png"
+                    shutil.copyfile(os.path.join(clothing_dir, payload['filename']),
+                                    os.path.join(clothing_dir, filename))
+                    payload = {**payload, 'temp_image_url': f"/uploads/clothing/{filename}", 'filename': filename}
+                return {**payload, 'coalesced': shared}
+            
+            return with_progress(generate_once)
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
@@ -962,6 +1519,7 @@ Ensure each outfit lists at least one item id.
     def refine_clothing():
         """Refine a generated clothing item"""
         try:
+            user_id = int(get_jwt_identity())
             data = request.get_json()
             filename = data.get('filename')
             refinement_prompt = data.get('refinement_prompt')
@@ -969,29 +1527,37 @@ Ensure each outfit lists at least one item id.
             if not filename or not refinement_prompt:
                 return jsonify({'error': 'Filename and refinement prompt required'}), 400
                 
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'clothing', filename)
+            filepath = temp_clothing_path(filename)
+            if not filepath:
+                return jsonify({'error': 'Invalid filename'}), 400
             if not os.path.exists(filepath):
                 return jsonify({'error': 'Original image not found'}), 404
-                
-            image = gemini_service.refine_clothing_image(filepath, refinement_prompt)
-            
-            # Overwrite or create new temp file? Let's create new to allow undo if we wanted, 
-            # but for now simple flow: new file
-            new_filename = f"temp_{uuid.uuid4()}.png"
-            new_filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'clothing', new_filename)
-            image.save(new_filepath)
             
-            # Clean up old temp file
-            try:
-                os.remove(filepath)
-            except (FileNotFoundError, OSError):
-                pass  # File already deleted or permission issue
+            def refine(emit):
+                with gemini_service.reporting(emit), gemini_service.acting_for(user_id):
+                    image = gemini_service.refine_clothing_image(filepath, refinement_prompt)
+                
+                # Overwrite or create new temp file? Let's create new to allow undo if we wanted, 
+                # but for now simple flow: new file
+                emit('post_processing', step='save')
+                new_filename = f"temp_{uuid.uuid4()}.png"
+                new_filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'clothing', new_filename)
+                image.save(new_filepath)
+                
+                # Clean up old temp file
+                try:
+                    os.remove(filepath)
+                except (FileNotFoundError, OSError):
+                    pass  # File already deleted or permission issue
+                emit('saved')
+                
+                return {
+                    'message': 'Image refined',
+                    'temp_image_url': f"/uploads/clothing/{new_filename}",
+                    'filename': new_filename
+                }
             
-            return jsonify({
-                'message': 'Image refined',
-                'temp_image_url': f"/uploads/clothing/{new_filename}",
-                'filename': new_filename
-            }), 200
+            return with_progress(refine)
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
@@ -1009,7 +1575,10 @@ Ensure each outfit lists at least one item id.
             if not filename:
                 return jsonify({'error': 'Filename required'}), 400
                 
-            temp_filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'clothing', filename)
+            # The file is moved into the media store, so only accept temp files from the generate step
+            temp_filepath = temp_clothing_path(filename)
+            if not temp_filepath:
+                return jsonify({'error': 'Invalid filename'}), 400
             if not os.path.exists(temp_filepath):
                 return jsonify({'error': 'Image file not found'}), 404
                 
@@ -1021,12 +1590,16 @@ Ensure each outfit lists at least one item id.
                 user_id=user_id,
                 category=category,
                 filename=filename,
-                filepath=temp_filepath,
+                filepath=media_index.key_for('clothing', filename),
                 is_generated=True
             )
+            stored_path = media_store.ingest(item.filepath, temp_filepath)
             db.session.add(item)
             db.session.commit()
             
+            prepare_source_media(stored_path)
+            wardrobe_cache.invalidate(user_id)
+            
             return jsonify({'message': 'Item added to wardrobe', 'item': item.to_dict()}), 201
             
         except Exception as e:
@@ -1046,111 +1619,192 @@ Ensure each outfit lists at least one item id.
             if not url:
                 return jsonify({'error': 'URL required'}), 400
             
-            # Validate URL format
-            if not url.startswith('http://') and not url.startswith('https://'):
-                return jsonify({'error': 'Please enter a valid URL starting with http:// or https://'}), 400
-
-            # SSRF Protection: Block private/internal IPs
-            from urllib.parse import urlparse
-            parsed = urlparse(url)
-            hostname = parsed.hostname
-            if hostname:
-                hostname_lower = hostname.lower()
-                # Block localhost and common internal hostnames
-                blocked_hosts = ['localhost', '127.0.0.1', '0.0.0.0', '::1', 'internal', 'intranet']
-                if hostname_lower in blocked_hosts or hostname_lower.endswith('.local'):
-                    return jsonify({'error': 'Invalid URL: internal addresses not allowed'}), 400
-                # Block private IP ranges
-                try:
-                    import ipaddress
-                    ip = ipaddress.ip_address(hostname)
-                    if ip.is_private or ip.is_loopback or ip.is_reserved:
-                        return jsonify({'error': 'Invalid URL: private/internal addresses not allowed'}), 400
-                except ValueError:
-                    pass  # Not an IP address, hostname is fine
-
-            # Scraping with multiple strategies
-            headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
-            response = requests.get(url, headers=headers, timeout=10, allow_redirects=False)
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            img_url = None
-            
-            # Strategy 1: OpenGraph image
-            og_image = soup.find('meta', property='og:image')
-            if og_image and og_image.get('content'):
-                img_url = og_image['content']
-            
-            # Strategy 2: Twitter card image
-            if not img_url:
-                twitter_image = soup.find('meta', attrs={'name': 'twitter:image'})
-                if twitter_image and twitter_image.get('content'):
-                    img_url = twitter_image['content']
-            
-            # Strategy 3: Look for product image in common class names
-            if not img_url:
-                for class_name in ['product-image', 'main-image', 'primary-image', 'product-img']:
-                    img_tag = soup.find('img', class_=lambda x: x and class_name in x.lower())
-                    if img_tag and img_tag.get('src'):
-                        img_url = img_tag['src']
-                        break
-            
-            # Strategy 4: Find largest image
-            if not img_url:
-                all_imgs = soup.find_all('img', src=True)
-                if all_imgs:
-                    img_url = all_imgs[0].get('src')  # Take first image as fallback
-            
-            if not img_url:
-                return jsonify({'error': 'Could not find product image on this page'}), 400
-            
-            # Handle relative URLs
-            if img_url.startswith('//'):
-                img_url = 'https:' + img_url
-            elif img_url.startswith('/'):
-                from urllib.parse import urljoin
-                img_url = urljoin(url, img_url)
-                
-            # Download image
-            img_response = requests.get(img_url, headers=headers, timeout=10)
-            img_response.raise_for_status()
-            
-            # Process image with background removal
-            image = Image.open(BytesIO(img_response.content))
-            
-            # Convert to RGB if necessary
-            if image.mode in ('RGBA', 'LA', 'P'):
-                image = image.convert('RGB')
-            
-            # Apply background removal
-            output_image = gemini_service.remove_background(image)
-            
-            # Save processed image
-            filename = f"{uuid.uuid4()}.png"
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'clothing', filename)
-            
-            output_image.save(filepath)
+            # Scrape the page and download the product image (SSRF-checked, size-capped, cached)
+            _, image_bytes = clothing_importer.fetch(url)
+            filename, staged_path = save_imported_image(image_bytes)
             
+            # Background removal happens in the worker stage, like regular uploads
             item = ClothingItem(
                 user_id=user_id,
                 filename=filename,
-                filepath=filepath,
+                filepath=media_index.key_for('clothing', filename),
                 category=category,
-                price=0.0
+                price=0.0,
+                status='processing'
             )
+            media_store.ingest(item.filepath, staged_path)
             db.session.add(item)
             db.session.commit()
             
+            background_removal.submit([item.id])
+            wardrobe_cache.invalidate(user_id)
+            
             return jsonify({'message': 'Clothing imported successfully', 'item': item.to_dict()}), 201
             
+        except ClothingImportError as e:
+            return jsonify({'error': str(e)}), 400
         except requests.RequestException as e:
             return jsonify({'error': f'Failed to fetch URL: {str(e)}'}), 400
         except Exception as e:
+            db.session.rollback()
             return jsonify({'error': f'Import failed: {str(e)}'}), 500
     
+    @app.route('/api/clothing/import/bulk', methods=['POST'])
+    @jwt_required()
+    def import_clothing_bulk():
+        """Import several product URLs at once; ?stream=1 reports progress per URL"""
+        try:
+            user_id = int(get_jwt_identity())
+            data = request.get_json() or {}
+            urls = data.get('urls')
+            category = data.get('category', 'tops')
+            
+            if not isinstance(urls, list):
+                return jsonify({'error': 'urls must be a list'}), 400
+            
+            urls = [url for url in (str(url).strip() for url in urls) if url]
+            if not urls:
+                return jsonify({'error': 'URL required'}), 400
+            max_urls = app.config['IMPORT_BULK_MAX_URLS']
+            if len(urls) > max_urls:
+                return jsonify({'error': f'At most {max_urls} URLs per import'}), 400
+            
+            # Repeated page URLs are fetched once
+            unique_urls = list(dict.fromkeys(urls))
+            
+            # Pages that resolve to the same product image share one download and one item
+            claims = {}  # image url -> index into unique_urls
+            claims_lock = threading.Lock()
+            
+            def fetch_one(index):
+                url = unique_urls[index]
+                clothing_importer.validate_url(url)
+                img_url = clothing_importer.find_image_url(url)
+                with claims_lock:
+                    owner = claims.setdefault(img_url, index)
+                if owner != index:
+                    return {'duplicate_of': owner}
+                image_bytes = clothing_importer.download_image(img_url)
+                filename, staged_path = save_imported_image(image_bytes)
+                return {'filename': filename, 'staged_path': staged_path}
+            
+            tasks = [lambda index=index: fetch_one(index) for index in range(len(unique_urls))]
+            
+            def run_import():
+                """Yield one progress event per unique URL, then a summary"""
+                items = {}  # index into unique_urls -> created item dict
+                duplicates = []
+                imported = failed = 0
+            
+                for index, fetched, error in fan_out(import_executor, tasks):
+                    url = unique_urls[index]
+                    if error:
+                        failed += 1
+                        yield {'event': 'failed', 'url': url, 'error': describe_import_error(error)}
+                        continue
+                    if 'duplicate_of' in fetched:
+                        # Reported once the image's owning URL has finished
+                        duplicates.append((index, fetched['duplicate_of']))
+                        continue
+                
+                    try:
+                        item = ClothingItem(
+                            user_id=user_id,
+                            filename=fetched['filename'],
+                            filepath=media_index.key_for('clothing', fetched['filename']),
+                            category=category,
+                            price=0.0,
+                            status='processing'
+                        )
+                        media_store.ingest(item.filepath, fetched['staged_path'])
+                        db.session.add(item)
+                        db.session.commit()
+                    except Exception as e:
+                        db.session.rollback()
+                        failed += 1
+                        yield {'event': 'failed', 'url': url, 'error': f'Import failed: {str(e)}'}
+                        continue
+                
+                    background_removal.submit([item.id])
+                    wardrobe_cache.invalidate(user_id)
+                    items[index] = item.to_dict()
+                    imported += 1
+                    yield {'event': 'imported', 'url': url, 'item': items[index]}
+            
+                for index, owner in duplicates:
+                    yield {
+                        'event': 'duplicate',
+                        'url': unique_urls[index],
+                        'duplicate_of': unique_urls[owner],
+                        'item': items.get(owner)
+                    }
+            
+                yield {
+                    'event': 'done',
+                    'imported': imported,
+                    'duplicates': len(duplicates) + len(urls) - len(unique_urls),
+                    'failed': failed
+                }
+            
+            if request.args.get('stream') in ('1', 'true'):
+                def stream_events():
+                    try:
+                        for outcome in run_import():
+                            yield json.dumps(outcome) + "\n"
+                    except Exception as e:
+                        db.session.rollback()
+                        print(f"❌ Bulk import stream failed: {e}")
+                        yield json.dumps({'event': 'error', 'error': str(e)}) + "\n"
+            
+                return Response(stream_with_context(stream_events()), mimetype='application/x-ndjson')
+            
+            outcomes = list(run_import())
+            summary = outcomes.pop()
+            # Report results in the order the URLs were submitted
+            by_url = {outcome['url']: outcome for outcome in outcomes}
+            results = [by_url[url] for url in urls]
+            summary.pop('event')
+            return jsonify({'message': 'Bulk import finished', 'results': results, **summary}), 200
+            
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+    
+    def describe_import_error(error):
+        """User-facing message for a failed URL import"""
+        if isinstance(error, ClothingImportError):
+            return str(error)
+        if isinstance(error, requests.RequestException):
+            return f'Failed to fetch URL: {str(error)}'
+        return f'Import failed: {str(error)}'
+    
+    def save_imported_image(image_bytes):
+        """Stage downloaded image bytes for the media store (verbatim when the format is allowed); returns the filename and staged path"""
+        try:
+            image = Image.open(BytesIO(image_bytes))
+        except Exception:
+            raise ClothingImportError('The product link did not return a valid image')
+        
+        with image:
+            ext = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}.get(image.format)
+            filename = f"{uuid.uuid4()}.{ext or 'png'}"
+            staged_path = media_store.staging_path(filename)
+            if ext:
+                with open(staged_path, 'wb') as f:
+                    f.write(image_bytes)
+            else:
+                # GIF, AVIF etc. are converted so downstream code only sees allowed types
+                image.save(staged_path, 'PNG')
+        
+        return filename, staged_path
+    
     # Database initialization
     with app.app_context():
         db.create_all()
+        media_store.load()
+    
+    job_queue.recover()
+    background_removal.recover()
     
     return app
 
@@ -0,0 +1,171 @@
+import queue
+import shutil
+import threading
+import traceback
+import uuid
+
+from models import db, ClothingItem
+from gemini_service import GeminiService
+from metrics import metrics
+from imaging import open_reduced
+
+
+class BackgroundRemovalStage:
+    """
+    Removes backgrounds from uploaded clothing off the request path.
+
+    Uploads are stored as-is with status 'processing'; worker threads take
+    up to `group_size` queued item ids at a time, run background removal on
+    each item in turn (the rembg session takes one image per call), swap in
+    the processed PNG and commit each item as 'ready'. Identical images are
+    only processed once, via the result cache; rembg-only fallbacks are not
+    cached, so a later upload of the same bytes gets another try.
+    """
+
+    def __init__(self, app, gemini_service, result_cache, media_store, max_workers=2, group_size=8, on_ready=None):
+        """
+        Args:
+            app: Flask app; groups run inside its app context
+            gemini_service: GeminiService doing the removal
+            result_cache: ResultCache used to deduplicate identical images
+            media_store: MediaStore holding the clothing images
+            max_workers: Worker threads
+            group_size: Maximum queued item ids taken per pass
+            on_ready: Optional callable(item) run for each processed item after commit
+        """
+        self.app = app
+        self.gemini_service = gemini_service
+        self.result_cache = result_cache
+        self.media_store = media_store
+        self.max_workers = max_workers
+        self.group_size = group_size
+        self.on_ready = on_ready
+
+        self._queue = queue.Queue()
+        self._threads = []
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        # Threads start on first use so they are created in the serving
+        # process rather than a pre-fork parent
+        with self._start_lock:
+            if self._threads:
+                return
+            for idx in range(self.max_workers):
+                thread = threading.Thread(target=self._worker, name=f'bg-removal-{idx}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, item_ids):
+        """Queue clothing item ids for background removal"""
+        if not item_ids:
+            return
+        self._ensure_started()
+        for item_id in item_ids:
+            self._queue.put(item_id)
+
+    def recover(self):
+        """Re-queue items left in 'processing' by a previous process"""
+        with self.app.app_context():
+            pending = [item_id for (item_id,) in
+                       db.session.query(ClothingItem.id).filter_by(status='processing').all()]
+        self.submit(pending)
+        if pending:
+            print(f"🔁 Re-queued {len(pending)} clothing item(s) for background removal")
+
+    def pending(self):
+        """Approximate number of item ids waiting for a worker"""
+        return self._queue.qsize()
+
+    def _worker(self):
+        while True:
+            group = [self._queue.get()]
+            while len(group) < self.group_size:
+                try:
+                    group.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            with self.app.app_context():
+                try:
+                    with metrics.timed('background_removal_group'):
+                        self._process_group(group)
+                except Exception:
+                    traceback.print_exc()
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+    def _process_group(self, item_ids):
+        print(f"✨ Removing backgrounds for {len(item_ids)} item(s)")
+        processed = {}  # cache key -> output path committed in this group
+        for item_id in item_ids:
+            # Each item commits on its own, so one deleted or failing item
+            # doesn't hold the others in 'processing'
+            token = None
+            try:
+                item = ClothingItem.query.filter_by(id=item_id, status='processing').first()
+                if item is None:
+                    continue
+                token = self._process_item(item, processed)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                # The rolled back item's output may be gone
+                processed.clear()
+                print(f"⚠️ Background removal failed for item {item_id}: {e}")
+                # Keep the original upload, same as the old inline fallback
+                updated = ClothingItem.query.filter_by(id=item_id, status='processing').update({'status': 'ready'})
+                db.session.commit()
+                if not updated:
+                    continue
+                item = db.session.get(ClothingItem, item_id)
+
+            self.media_store.purge(token)
+            if self.on_ready:
+                self.on_ready(item)
+
+    def _process_item(self, item, processed):
+        """Swap in the processed image; returns the original's release token"""
+        source_path = self.media_store.resolve(item.filepath, 'clothing', item.filename)
+        if not source_path:
+            raise FileNotFoundError(item.filepath)
+        key = self.result_cache.make_key(
+            [source_path],
+            GeminiService.BACKGROUND_REMOVAL_PROMPT,
+            GeminiService.BACKGROUND_REMOVAL_SIGNATURE
+        )
+
+        # Always write a fresh filename: the original URL may already be
+        # cached by browsers
+        filename = f"{uuid.uuid4()}.png"
+        output_key = self.media_store.index.key_for('clothing', filename)
+        staged_path = self.media_store.staging_path(filename)
+
+        cache_output = False
+        if key in processed:
+            shutil.copyfile(processed[key], staged_path)
+        else:
+            cached = self.result_cache.get(key)
+            if cached:
+                self.result_cache.materialize(cached, staged_path)
+            else:
+                # Phone photos are decoded straight at the model input size
+                input_image = open_reduced(source_path, GeminiService.INPUT_MAX_SIDE)
+                with self.gemini_service.acting_for(item.user_id):
+                    output_image = self.gemini_service.remove_background(input_image)
+                output_image.save(staged_path)
+                # The rembg-only fallback is a degraded cutout, never cache it
+                cache_output = not self.gemini_service.last_was_fallback
+
+        output_path = self.media_store.ingest(output_key, staged_path)
+        if cache_output:
+            self.result_cache.put(key, output_path)
+        processed[key] = output_path
+
+        token = self.media_store.release(item.filepath, 'clothing', item.filename)
+
+        item.filename = filename
+        item.filepath = output_key
+        item.status = 'ready'
+        return token
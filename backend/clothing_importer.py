@@ -0,0 +1,242 @@
+import re
+import time
+import ipaddress
+import threading
+from collections import OrderedDict
+from html.parser import HTMLParser
+from urllib.parse import urlparse, urljoin
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+
+class ClothingImportError(ValueError):
+    """Raised for import problems caused by the submitted URL or page"""
+
+
+class _HeadMetaParser(HTMLParser):
+    """Collects og:image / twitter:image from <meta> tags"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.og_image = None
+        self.twitter_image = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag != 'meta':
+            return
+        attrs = dict(attrs)
+        content = attrs.get('content')
+        if not content:
+            return
+        if attrs.get('property') == 'og:image' and not self.og_image:
+            self.og_image = content
+        elif attrs.get('name') == 'twitter:image' and not self.twitter_image:
+            self.twitter_image = content
+
+    @property
+    def image_url(self):
+        return self.og_image or self.twitter_image
+
+
+class ClothingImporter:
+    """
+    Finds and downloads the product image for a shop page.
+
+    Uses one pooled HTTP session, streams every download under a byte cap,
+    stops reading a page once its <head> yields og:image/twitter:image, and
+    remembers page -> image URL and image URL -> bytes for repeat imports.
+    """
+
+    HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
+    BLOCKED_HOSTS = ['localhost', '127.0.0.1', '0.0.0.0', '::1', 'internal', 'intranet']
+    _HEAD_END = re.compile(rb'</head\s*>', re.IGNORECASE)
+
+    def __init__(self, timeout=10, max_page_bytes=2 * 1024 * 1024, max_image_bytes=16 * 1024 * 1024,
+                 cache_ttl=24 * 3600, cache_max_bytes=64 * 1024 * 1024, pool_size=16):
+        """
+        Args:
+            timeout: Seconds per HTTP call
+            max_page_bytes: Maximum bytes read from a product page
+            max_image_bytes: Maximum size of a downloaded image
+            cache_ttl: Seconds page and image lookups are remembered
+            cache_max_bytes: Memory budget for cached image bytes
+            pool_size: Connections kept per host
+        """
+        self.timeout = timeout
+        self.max_page_bytes = max_page_bytes
+        self.max_image_bytes = max_image_bytes
+        self.cache_ttl = cache_ttl
+        self.cache_max_bytes = cache_max_bytes
+
+        self.session = requests.Session()
+        self.session.headers.update(self.HEADERS)
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._lock = threading.Lock()
+        self._image_urls = OrderedDict()  # page url -> (expires_at, image url)
+        self._images = OrderedDict()      # image url -> (expires_at, bytes)
+        self._image_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def validate_url(cls, url):
+        """Reject non-HTTP URLs and internal addresses (SSRF protection)"""
+        if not url.startswith('http://') and not url.startswith('https://'):
+            raise ClothingImportError('Please enter a valid URL starting with http:// or https://')
+
+        hostname = urlparse(url).hostname
+        if hostname:
+            hostname_lower = hostname.lower()
+            # Block localhost and common internal hostnames
+            if hostname_lower in cls.BLOCKED_HOSTS or hostname_lower.endswith('.local'):
+                raise ClothingImportError('Invalid URL: internal addresses not allowed')
+            # Block private IP ranges
+            try:
+                ip = ipaddress.ip_address(hostname)
+            except ValueError:
+                ip = None  # Not an IP address, hostname is fine
+            if ip and (ip.is_private or ip.is_loopback or ip.is_reserved):
+                raise ClothingImportError('Invalid URL: private/internal addresses not allowed')
+
+    # --- caches ---
+
+    def _cache_get(self, cache, key):
+        with self._lock:
+            entry = cache.get(key)
+            if not entry:
+                self.misses += 1
+                return None
+            if entry[0] < time.time():
+                self._cache_pop(cache, key)
+                self.misses += 1
+                return None
+            cache.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def _cache_pop(self, cache, key):
+        _, value = cache.pop(key)
+        if cache is self._images:
+            self._image_bytes -= len(value)
+
+    def _cache_put(self, cache, key, value):
+        with self._lock:
+            if key in cache:
+                self._cache_pop(cache, key)
+            cache[key] = (time.time() + self.cache_ttl, value)
+            if cache is self._images:
+                self._image_bytes += len(value)
+                while self._image_bytes > self.cache_max_bytes and cache:
+                    self._cache_pop(cache, next(iter(cache)))
+            else:
+                while len(cache) > 4096:
+                    cache.popitem(last=False)
+
+    # --- fetching ---
+
+    def _read_capped(self, response, limit, stop=None):
+        """Read a streamed body up to limit bytes; `stop(buffer)` may end the read early"""
+        buffer = bytearray()
+        for chunk in response.iter_content(chunk_size=16384):
+            buffer.extend(chunk)
+            if len(buffer) > limit:
+                return bytes(buffer[:limit]), True
+            if stop and stop(buffer):
+                break
+        return bytes(buffer), False
+
+    def find_image_url(self, url):
+        """Return the absolute product image URL for a page"""
+        cached = self._cache_get(self._image_urls, url)
+        if cached:
+            return cached
+
+        head_parser = _HeadMetaParser()
+        head_parsed = []
+
+        def head_has_image(buffer):
+            # Parse <head> once it is complete; stop early only if it has the image
+            if head_parsed:
+                return False
+            match = self._HEAD_END.search(buffer)
+            if not match:
+                return False
+            head_parser.feed(bytes(buffer[:match.start()]).decode('utf-8', errors='replace'))
+            head_parsed.append(True)
+            return bool(head_parser.image_url)
+
+        # Redirects stay disabled so a public URL can't bounce to an internal host
+        with self.session.get(url, timeout=self.timeout, allow_redirects=False, stream=True) as response:
+            content, _ = self._read_capped(response, self.max_page_bytes, stop=head_has_image)
+
+        # Strategies 1 & 2: OpenGraph / Twitter card image from <head> only
+        img_url = head_parser.image_url
+
+        if not img_url:
+            soup = BeautifulSoup(content, 'html.parser')
+
+            og_image = soup.find('meta', property='og:image')
+            if og_image and og_image.get('content'):
+                img_url = og_image['content']
+
+            if not img_url:
+                twitter_image = soup.find('meta', attrs={'name': 'twitter:image'})
+                if twitter_image and twitter_image.get('content'):
+                    img_url = twitter_image['content']
+
+            # Strategy 3: Look for product image in common class names
+            if not img_url:
+                for class_name in ['product-image', 'main-image', 'primary-image', 'product-img']:
+                    img_tag = soup.find('img', class_=lambda x: x and class_name in x.lower())
+                    if img_tag and img_tag.get('src'):
+                        img_url = img_tag['src']
+                        break
+
+            # Strategy 4: Take first image as fallback
+            if not img_url:
+                first_img = soup.find('img', src=True)
+                if first_img:
+                    img_url = first_img.get('src')
+
+        if not img_url:
+            raise ClothingImportError('Could not find product image on this page')
+
+        # Handle relative and protocol-relative URLs
+        if img_url.startswith('//'):
+            img_url = 'https:' + img_url
+        img_url = urljoin(url, img_url)
+
+        self._cache_put(self._image_urls, url, img_url)
+        return img_url
+
+    def download_image(self, img_url):
+        """Download image bytes, refusing anything larger than max_image_bytes"""
+        cached = self._cache_get(self._images, img_url)
+        if cached:
+            return cached
+
+        self.validate_url(img_url)
+
+        with self.session.get(img_url, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            declared = response.headers.get('Content-Length')
+            if declared and declared.isdigit() and int(declared) > self.max_image_bytes:
+                raise ClothingImportError('Product image is too large')
+            data, truncated = self._read_capped(response, self.max_image_bytes)
+
+        if truncated:
+            raise ClothingImportError('Product image is too large')
+
+        self._cache_put(self._images, img_url, data)
+        return data
+
+    def fetch(self, url):
+        """Validate a page URL and return (image_url, image_bytes)"""
+        self.validate_url(url)
+        img_url = self.find_image_url(url)
+        return img_url, self.download_image(img_url)
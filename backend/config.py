@@ -13,10 +13,18 @@ load_dotenv(BASE_DIR / ".env")
 
 
 def _build_db_uri() -> str:
-    """Return a fully-qualified SQLite URI, normalizing relative paths."""
+    """Return the database URI; SQLite paths are made absolute, server URIs pass through."""
     env_uri = os.getenv("DATABASE_URL")
     default_path = BASE_DIR / "instance" / "tryon.db"
 
+    if env_uri and env_uri.startswith("postgres://"):
+        # Older hosting providers still hand out the scheme SQLAlchemy dropped
+        return env_uri.replace("postgres://", "postgresql://", 1)
+
+    if env_uri and not env_uri.startswith("sqlite"):
+        # PostgreSQL, MySQL etc. (the matching driver must be installed)
+        return env_uri
+
     if env_uri and env_uri.startswith("sqlite:///"):
         db_path = env_uri.replace("sqlite:///", "", 1)
         db_path = Path(db_path)
@@ -28,10 +36,25 @@ def _build_db_uri() -> str:
     default_path.parent.mkdir(parents=True, exist_ok=True)
     return f"sqlite:///{default_path}"
 
+def _build_engine_options(uri: str) -> dict:
+    """SQLAlchemy engine options for the configured database."""
+    if uri.startswith("sqlite"):
+        # Wait on a locked database instead of failing immediately
+        return {"connect_args": {"timeout": 30}}
+
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", 10)),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 20)),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800)),  # seconds before a connection is replaced
+        "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", 30)),  # seconds to wait for a free connection
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() == "true",
+    }
+
 class Config:
     """Base configuration"""
     SECRET_KEY = os.getenv('SECRET_KEY')
     SQLALCHEMY_DATABASE_URI = _build_db_uri()
+    SQLALCHEMY_ENGINE_OPTIONS = _build_engine_options(SQLALCHEMY_DATABASE_URI)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
     # JWT Configuration
@@ -50,9 +73,114 @@ class Config:
     UPLOAD_FOLDER = os.path.join(os.path.dirname(BASE_DIR), os.getenv('UPLOAD_FOLDER', 'uploads'))
     MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp'}
+
+    # Media storage: content-addressed blobs in sharded directories ('local') or an S3-compatible bucket ('s3')
+    MEDIA_STORAGE_BACKEND = os.getenv('MEDIA_STORAGE_BACKEND', 'local').lower()
+    MEDIA_STORAGE_DIR = str(BASE_DIR / os.getenv('MEDIA_STORAGE_DIR', 'instance/media'))
+    MEDIA_CACHE_DIR = str(BASE_DIR / os.getenv('MEDIA_CACHE_DIR', 'instance/media_cache'))  # local copies of S3 blobs
+    S3_BUCKET = os.getenv('S3_BUCKET', '')
+    S3_PREFIX = os.getenv('S3_PREFIX', '')
+    S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL', '')  # e.g. a MinIO or R2 endpoint
+    S3_REGION = os.getenv('S3_REGION', '')
+    S3_ACCESS_KEY_ID = os.getenv('S3_ACCESS_KEY_ID', '')
+    S3_SECRET_ACCESS_KEY = os.getenv('S3_SECRET_ACCESS_KEY', '')
+
+    # Normalized model inputs (longest side in px, JPEG quality)
+    MODEL_INPUT_MAX_SIDE = int(os.getenv('MODEL_INPUT_MAX_SIDE', 1536))
+    MODEL_INPUT_QUALITY = int(os.getenv('MODEL_INPUT_QUALITY', 90))
+
+    # Thumbnail derivatives (served via /uploads/<path>?w=<width>)
+    THUMBNAIL_WIDTHS = [int(w) for w in os.getenv('THUMBNAIL_WIDTHS', '256,512,1024').split(',')]
+    THUMBNAIL_QUALITY = int(os.getenv('THUMBNAIL_QUALITY', 80))
     
     # Google Gemini Configuration
     GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY', '')
+
+    # Model API calls: per-operation deadlines (seconds, retries included), retry with
+    # jittered backoff, optional hedging of slow calls, and a circuit breaker
+    UPSTREAM_DEADLINES = os.getenv(
+        'UPSTREAM_DEADLINES',
+        'tryon=90,recommend_outfits=45,generate_clothing=60,refine_clothing=90,remove_background=30'
+    )
+    UPSTREAM_DEFAULT_DEADLINE = float(os.getenv('UPSTREAM_DEFAULT_DEADLINE', 60))
+    UPSTREAM_MAX_ATTEMPTS = int(os.getenv('UPSTREAM_MAX_ATTEMPTS', 3))
+    UPSTREAM_RETRY_BASE_DELAY = float(os.getenv('UPSTREAM_RETRY_BASE_DELAY', 0.5))
+    UPSTREAM_RETRY_MAX_DELAY = float(os.getenv('UPSTREAM_RETRY_MAX_DELAY', 8))
+    UPSTREAM_HEDGE_AFTER = float(os.getenv('UPSTREAM_HEDGE_AFTER', 0))  # 0 = no hedged requests
+    UPSTREAM_HEDGE_OPERATIONS = os.getenv('UPSTREAM_HEDGE_OPERATIONS', 'recommend_outfits')
+    UPSTREAM_BREAKER_FAILURE_RATE = float(os.getenv('UPSTREAM_BREAKER_FAILURE_RATE', 0.5))
+    UPSTREAM_BREAKER_MIN_CALLS = int(os.getenv('UPSTREAM_BREAKER_MIN_CALLS', 10))
+    UPSTREAM_BREAKER_WINDOW = float(os.getenv('UPSTREAM_BREAKER_WINDOW', 60))  # seconds of history considered
+    UPSTREAM_BREAKER_COOLDOWN = float(os.getenv('UPSTREAM_BREAKER_COOLDOWN', 30))  # seconds before a probe call
+    UPSTREAM_MAX_WORKERS = int(os.getenv('UPSTREAM_MAX_WORKERS', 16))
+
+    # Admission control for model calls, shared by all workers on the host: a token
+    # bucket at the provider quota, global and per-user concurrency caps, and
+    # weighted fair sharing between interactive and background work
+    SCHEDULER_DB_PATH = str(BASE_DIR / os.getenv('SCHEDULER_DB_PATH', 'instance/scheduler.db'))
+    SCHEDULER_RATE_PER_MINUTE = float(os.getenv('SCHEDULER_RATE_PER_MINUTE', 60))  # 0 = no rate limit
+    SCHEDULER_BURST = int(os.getenv('SCHEDULER_BURST', 10))
+    SCHEDULER_MAX_CONCURRENT = int(os.getenv('SCHEDULER_MAX_CONCURRENT', 8))
+    SCHEDULER_PER_USER_LIMIT = int(os.getenv('SCHEDULER_PER_USER_LIMIT', 2))  # per class (interactive, background)
+    SCHEDULER_WEIGHTS = os.getenv('SCHEDULER_WEIGHTS', 'interactive=3,background=1')
+    SCHEDULER_MAX_WAIT = float(os.getenv('SCHEDULER_MAX_WAIT', 120))  # seconds a call may queue for a slot
+
+    # Weather lookups (Open-Meteo)
+    WEATHER_TIMEOUT = float(os.getenv('WEATHER_TIMEOUT', 5))
+    WEATHER_CACHE_TTL = int(os.getenv('WEATHER_CACHE_TTL', 600))  # seconds a forecast is fresh
+    WEATHER_STALE_TTL = int(os.getenv('WEATHER_STALE_TTL', 3600))  # seconds a stale forecast may be served while refreshing
+    GEOCODE_CACHE_TTL = int(os.getenv('GEOCODE_CACHE_TTL', 7 * 24 * 3600))
+
+    # Clothing import from product URLs
+    IMPORT_TIMEOUT = float(os.getenv('IMPORT_TIMEOUT', 10))
+    IMPORT_MAX_PAGE_BYTES = int(os.getenv('IMPORT_MAX_PAGE_BYTES', 2 * 1024 * 1024))
+    IMPORT_CACHE_TTL = int(os.getenv('IMPORT_CACHE_TTL', 24 * 3600))
+    IMPORT_CACHE_MAX_BYTES = int(os.getenv('IMPORT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    IMPORT_WORKERS = int(os.getenv('IMPORT_WORKERS', 8))  # concurrent URLs across bulk imports
+    IMPORT_BULK_MAX_URLS = int(os.getenv('IMPORT_BULK_MAX_URLS', 50))
+
+    # Background job configuration
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 4))
+    JOB_LEASE_TIMEOUT = int(os.getenv('JOB_LEASE_TIMEOUT', 60))  # seconds without a heartbeat before a running job is failed and refunded
+    JOB_HEARTBEAT_INTERVAL = int(os.getenv('JOB_HEARTBEAT_INTERVAL', 15))
+    JOB_POLL_MAX_WAIT = int(os.getenv('JOB_POLL_MAX_WAIT', 30))  # seconds a GET /api/jobs/<id>?wait= may block
+    JOB_EVENTS_MAX_WAIT = int(os.getenv('JOB_EVENTS_MAX_WAIT', 300))  # seconds a /api/jobs/<id>/events stream stays open
+
+    # Coalescing of identical in-flight generation requests (lock files shared by workers on this host)
+    INFLIGHT_DIR = str(BASE_DIR / os.getenv('INFLIGHT_DIR', 'instance/inflight'))
+    JOB_DEDUPE_MAX_AGE = int(os.getenv('JOB_DEDUPE_MAX_AGE', 900))  # seconds an unfinished job keeps absorbing duplicates
+
+    # Generation result cache (outside UPLOAD_FOLDER so it is never served directly)
+    RESULT_CACHE_DIR = str(BASE_DIR / os.getenv('RESULT_CACHE_DIR', 'instance/result_cache'))
+    RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))  # 2GB
+
+    # Local rembg fallback for background removal (ONNX Runtime on CPU)
+    REMBG_MODEL = os.getenv('REMBG_MODEL', 'u2net')
+    REMBG_INTRA_OP_THREADS = int(os.getenv('REMBG_INTRA_OP_THREADS', 0))  # 0 = ONNX Runtime default
+    REMBG_INTER_OP_THREADS = int(os.getenv('REMBG_INTER_OP_THREADS', 0))
+    REMBG_PARALLEL_EXECUTION = os.getenv('REMBG_PARALLEL_EXECUTION', 'false').lower() == 'true'
+    REMBG_WARMUP = os.getenv('REMBG_WARMUP', 'true').lower() == 'true'  # load the model at startup
+
+    # Clothing background removal stage
+    BG_REMOVAL_WORKERS = int(os.getenv('BG_REMOVAL_WORKERS', 2))
+    BG_REMOVAL_GROUP_SIZE = int(os.getenv('BG_REMOVAL_GROUP_SIZE', 8))  # items committed together
+
+    # Challenge votes are buffered and written in batches (0 = write each vote immediately)
+    VOTE_FLUSH_INTERVAL = float(os.getenv('VOTE_FLUSH_INTERVAL', 0.25))
+    VOTE_FLUSH_MAX_BATCH = int(os.getenv('VOTE_FLUSH_MAX_BATCH', 500))
+
+    # List endpoints (photos, clothing, saved looks)
+    LIST_DEFAULT_PAGE_SIZE = int(os.getenv('LIST_DEFAULT_PAGE_SIZE', 50))  # when ?limit= is absent; ?limit=all opts out
+    LIST_MAX_PAGE_SIZE = int(os.getenv('LIST_MAX_PAGE_SIZE', 200))
+
+    # Style-me outfit rendering
+    STYLE_ME_WORKERS = int(os.getenv('STYLE_ME_WORKERS', 6))
+    STYLE_ME_OUTFIT_TIMEOUT = int(os.getenv('STYLE_ME_OUTFIT_TIMEOUT', 120))  # seconds per outfit render
+    WARDROBE_CACHE_TTL = int(os.getenv('WARDROBE_CACHE_TTL', 300))  # seconds a wardrobe snapshot is reused
+    
+    # Metrics: latency histograms and counters on /metrics; JSON log line per observation
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_JSON_LOGS = os.getenv('METRICS_JSON_LOGS', 'false').lower() == 'true'
     
     # CORS Configuration
     CORS_ORIGINS = os.getenv('CORS_ORIGINS', 'http://localhost:3000,http://localhost:5173').split(',')
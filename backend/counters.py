@@ -0,0 +1,190 @@
+import atexit
+import threading
+import traceback
+from collections import Counter
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User, ChallengeEntry, ChallengeVote
+
+
+def increment(model, row_id, column, amount=1):
+    """
+    Add `amount` to a counter column with a single UPDATE.
+
+    The addition happens in SQL, so concurrent requests can't overwrite each
+    other's increments. Returns False when the row doesn't exist.
+    """
+    counter = getattr(model, column)
+    updated = model.query.filter(model.id == row_id).update(
+        {counter: counter + amount},
+        synchronize_session=False
+    )
+    return updated > 0
+
+
+def spend_credits(user_id, amount=1):
+    """Take `amount` credits only if the user still has them; returns True on success"""
+    updated = User.query.filter(User.id == user_id, User.credits >= amount).update(
+        {User.credits: User.credits - amount},
+        synchronize_session=False
+    )
+    return updated > 0
+
+
+def current_credits(user_id):
+    """Read the user's credit balance straight from the database"""
+    return db.session.query(User.credits).filter(User.id == user_id).scalar()
+
+
+class VoteRecorder:
+    """
+    Records challenge votes: one challenge_votes row per user and entry, plus
+    the entry's vote counter.
+
+    With a flush interval, votes are acknowledged from memory and written in
+    batches by a background thread: one transaction per batch inserts the
+    vote rows and applies a single `votes = votes + n` per entry. A burst of
+    votes then costs a handful of write transactions instead of one each.
+    Votes still buffered when the process is killed (not a clean exit) are lost.
+    """
+
+    def __init__(self, app, flush_interval=0.25, max_batch=500):
+        """
+        Args:
+            app: Flask app; flushes run inside its app context
+            flush_interval: Seconds between batch writes; 0 writes each vote immediately
+            max_batch: Pending votes that trigger an early flush
+        """
+        self.app = app
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+
+        self._lock = threading.Lock()
+        self._pending = {}   # (user_id, entry_id) -> challenge_id
+        self._flushing = {}  # batch currently being written
+        self._wake = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_started(self):
+        # The flusher is created by the first recorded vote; pending votes are
+        # also flushed at interpreter exit
+        with self._lock:
+            if self._thread:
+                return
+            self._thread = threading.Thread(target=self._run, name='vote-flusher', daemon=True)
+            self._thread.start()
+        atexit.register(self.flush)
+
+    def has_voted(self, user_id, entry_id):
+        with self._lock:
+            key = (user_id, entry_id)
+            if key in self._pending or key in self._flushing:
+                return True
+        return db.session.query(
+            ChallengeVote.query.filter_by(user_id=user_id, entry_id=entry_id).exists()
+        ).scalar()
+
+    def pending(self):
+        """Votes buffered in memory and not yet written"""
+        with self._lock:
+            return len(self._pending) + len(self._flushing)
+
+    def pending_entry_ids(self, user_id):
+        """Entry ids this user voted on that aren't in the database yet"""
+        with self._lock:
+            return {entry_id for (voter, entry_id) in list(self._pending) + list(self._flushing)
+                    if voter == user_id}
+
+    def record(self, user_id, challenge_id, entry_id):
+        """Record a vote; returns False if the user already voted for this entry"""
+        if self.has_voted(user_id, entry_id):
+            return False
+
+        if self.flush_interval <= 0:
+            db.session.add(ChallengeVote(user_id=user_id, challenge_id=challenge_id, entry_id=entry_id))
+            increment(ChallengeEntry, entry_id, 'votes')
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                return False
+            return True
+
+        self._ensure_started()
+        with self._lock:
+            key = (user_id, entry_id)
+            if key in self._pending or key in self._flushing:
+                return False
+            self._pending[key] = challenge_id
+            if len(self._pending) >= self.max_batch:
+                self._wake.set()
+        return True
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Write all buffered votes in one transaction"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                self._flushing, self._pending = self._pending, {}
+            batch = self._flushing
+
+            with self.app.app_context():
+                try:
+                    self._write(batch)
+                except Exception:
+                    traceback.print_exc()
+                    db.session.rollback()
+                    # Put the batch back so the next flush retries it
+                    with self._lock:
+                        for key, challenge_id in batch.items():
+                            self._pending.setdefault(key, challenge_id)
+                finally:
+                    db.session.remove()
+                    with self._lock:
+                        self._flushing = {}
+
+    def _write(self, batch):
+        # Votes another process already wrote are dropped, not double counted
+        existing = set(db.session.query(ChallengeVote.user_id, ChallengeVote.entry_id).filter(
+            ChallengeVote.user_id.in_({user_id for user_id, _ in batch}),
+            ChallengeVote.entry_id.in_({entry_id for _, entry_id in batch})
+        ).all())
+        votes = [(user_id, entry_id, challenge_id) for (user_id, entry_id), challenge_id in batch.items()
+                 if (user_id, entry_id) not in existing]
+
+        try:
+            written = self._insert(votes)
+        except IntegrityError:
+            # Lost a race with another process: fall back to one savepoint per vote
+            db.session.rollback()
+            written = self._insert(votes, savepoints=True)
+
+        for entry_id, count in Counter(entry_id for _, entry_id, _ in written).items():
+            increment(ChallengeEntry, entry_id, 'votes', count)
+        db.session.commit()
+
+    def _insert(self, votes, savepoints=False):
+        written = []
+        for user_id, entry_id, challenge_id in votes:
+            vote = ChallengeVote(user_id=user_id, challenge_id=challenge_id, entry_id=entry_id)
+            if not savepoints:
+                db.session.add(vote)
+                written.append((user_id, entry_id, challenge_id))
+                continue
+            try:
+                with db.session.begin_nested():
+                    db.session.add(vote)
+                written.append((user_id, entry_id, challenge_id))
+            except IntegrityError:
+                pass
+        db.session.flush()
+        return written
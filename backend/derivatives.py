@@ -0,0 +1,109 @@
+import os
+import glob
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+from metrics import metrics
+
+
+class DerivativeGenerator:
+    """
+    Produces downscaled WebP/JPEG variants of uploaded and generated images.
+
+    Derivatives sit next to their original as `<name>.w<width>.<format>`,
+    e.g. `results/abc.png` -> `results/abc.png.w512.webp`.
+    """
+
+    FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+
+    def __init__(self, widths=(256, 512, 1024), quality=80, max_workers=2):
+        """
+        Args:
+            widths: Fixed target widths; requests are snapped up to the nearest one
+            quality: Encoder quality for WebP and JPEG output
+            max_workers: Threads generating derivatives in the background
+        """
+        self.widths = tuple(sorted(widths))
+        self.quality = quality
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='derivatives')
+
+    def snap_width(self, requested):
+        """Return the smallest configured width >= requested, or the largest one"""
+        for width in self.widths:
+            if width >= requested:
+                return width
+        return self.widths[-1]
+
+    @staticmethod
+    def derivative_path(path, width, fmt):
+        return f"{path}.w{width}.{fmt}"
+
+    def schedule(self, path):
+        """Generate the default (WebP) derivatives for path in the background"""
+        self.executor.submit(self._generate_all, path)
+
+    def _generate_all(self, path):
+        try:
+            with metrics.timed('thumbnails'), Image.open(path) as image:
+                # JPEG decodes at a reduced scale that still covers the largest width
+                image.draft(None, (self.widths[-1], self.widths[-1]))
+                image = ImageOps.exif_transpose(image)
+                for width in self.widths:
+                    if width < image.width:
+                        self._write(image, path, width, 'webp')
+        except Exception:
+            traceback.print_exc()
+
+    def get(self, path, width, fmt='webp'):
+        """
+        Return the derivative for path at width, creating it if it is missing.
+
+        Returns None when the original is already no wider than `width`, so the
+        caller should serve the original instead.
+        """
+        target = self.derivative_path(path, width, fmt)
+        if os.path.exists(target):
+            return target
+
+        with Image.open(path) as image:
+            image.draft(None, (width, width))
+            image = ImageOps.exif_transpose(image)
+            if image.width <= width:
+                return None
+            return self._write(image, path, width, fmt)
+
+    def _write(self, image, path, width, fmt):
+        target = self.derivative_path(path, width, fmt)
+        height = max(1, round(image.height * width / image.width))
+
+        resized = image.copy()
+        resized.thumbnail((width, height), Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+        if fmt == 'jpeg':
+            # JPEG has no alpha: flatten transparent clothing onto white
+            if resized.mode in ('RGBA', 'LA', 'P'):
+                resized = resized.convert('RGBA')
+                background = Image.new('RGB', resized.size, (255, 255, 255))
+                background.paste(resized, mask=resized.split()[-1])
+                resized = background
+            elif resized.mode != 'RGB':
+                resized = resized.convert('RGB')
+        elif resized.mode not in ('RGB', 'RGBA'):
+            resized = resized.convert('RGBA')
+
+        # Write to a temp name so concurrent readers never see a partial file
+        tmp = f"{target}.{threading.get_ident()}.tmp"
+        resized.save(tmp, self.FORMATS[fmt], quality=self.quality)
+        os.replace(tmp, target)
+        return target
+
+    def remove(self, path):
+        """Delete all derivatives of path"""
+        for derivative in glob.glob(f"{glob.escape(path)}.w*.*"):
+            try:
+                os.remove(derivative)
+            except OSError:
+                pass
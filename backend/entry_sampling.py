@@ -0,0 +1,58 @@
+import random
+
+from sqlalchemy import func
+
+from models import db, ChallengeEntry, ChallengeVote
+
+
+def sample_entry_ids(challenge_id, user_id, limit=10, probes=4, exclude=()):
+    """
+    Pick up to `limit` random entry ids a user can still vote on.
+
+    Instead of ORDER BY RANDOM() (a full scan and sort of the challenge),
+    this seeks to a few random points of the (challenge_id, id) index and
+    reads a short run of eligible ids from each, wrapping around at the end.
+    Each probe touches roughly `limit` index rows no matter how many entries
+    the challenge has. Ids are not perfectly uniform (an entry that follows
+    a gap of deleted ids is picked more often), which is fine for voting.
+
+    The caller's own entries and entries they already voted on are skipped,
+    as are any ids in `exclude` (e.g. votes not yet written to the database).
+    """
+    in_challenge = ChallengeEntry.challenge_id == challenge_id
+
+    # Separate MIN and MAX queries each resolve with one index lookup
+    low = db.session.query(func.min(ChallengeEntry.id)).filter(in_challenge).scalar()
+    if low is None:
+        return []
+    high = db.session.query(func.max(ChallengeEntry.id)).filter(in_challenge).scalar()
+
+    voted = db.session.query(ChallengeVote.entry_id).filter(
+        ChallengeVote.user_id == user_id,
+        ChallengeVote.challenge_id == challenge_id
+    )
+    eligible = db.session.query(ChallengeEntry.id).filter(
+        in_challenge,
+        ChallengeEntry.user_id != user_id,
+        ChallengeEntry.id.notin_(voted)
+    )
+
+    found = set()
+    for _ in range(probes):
+        pivot = random.randint(low, high)
+        ids = [row_id for (row_id,) in
+               eligible.filter(ChallengeEntry.id >= pivot).order_by(ChallengeEntry.id).limit(limit).all()]
+        if len(ids) < limit:
+            # Wrap around to the start of the challenge
+            ids += [row_id for (row_id,) in
+                    eligible.filter(ChallengeEntry.id < pivot).order_by(ChallengeEntry.id)
+                    .limit(limit - len(ids)).all()]
+        if not ids:
+            # Nothing left to vote on anywhere in the challenge
+            return []
+        found.update(ids)
+        if len(found) >= limit * 2:
+            break
+
+    found.difference_update(exclude)
+    return random.sample(sorted(found), min(limit, len(found)))
@@ -0,0 +1,65 @@
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+
+
+def fan_out(executor, tasks, timeout=None):
+    """
+    Run independent tasks concurrently on a bounded executor.
+
+    Args:
+        executor: concurrent.futures executor that bounds the parallelism
+        tasks: List of zero-argument callables
+        timeout: Seconds each task may run once it has started (None = no limit)
+
+    Yields:
+        (index, result, error) tuples in completion order. `index` is the
+        task's position in `tasks` so callers can restore the input order.
+        A task exceeding its timeout is abandoned and reported with a
+        TimeoutError; its worker thread is left to finish in the background.
+    """
+    started = {}
+
+    def run(index, task):
+        started[index] = time.monotonic()
+        return task()
+
+    futures = {executor.submit(run, index, task): index for index, task in enumerate(tasks)}
+    pending = set(futures)
+
+    while pending:
+        wait_for = None
+        if timeout is not None:
+            # Wake up when the earliest running task hits its deadline
+            deadlines = [started[futures[f]] + timeout for f in pending if futures[f] in started]
+            wait_for = max(min(deadlines) - time.monotonic(), 0) if deadlines else 0.25
+
+        done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+        if timeout is None:
+            continue
+
+        now = time.monotonic()
+        for future in list(pending):
+            index = futures[future]
+            if index in started and now - started[index] >= timeout:
+                pending.discard(future)
+                yield index, None, TimeoutError(f"Task {index} exceeded {timeout}s")
+
+
+def fan_out_ordered(executor, tasks, timeout=None):
+    """
+    Run tasks concurrently and return their outcomes in input order.
+
+    Returns:
+        List of (result, error) tuples aligned with `tasks`
+    """
+    outcomes = [(None, None)] * len(tasks)
+    for index, result, error in fan_out(executor, tasks, timeout=timeout):
+        outcomes[index] = (result, error)
+    return outcomes
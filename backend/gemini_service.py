@@ -1,21 +1,217 @@
 import os
 import json
+import time
+import mimetypes
+import threading
+from contextlib import contextmanager
+import onnxruntime as ort
 from google import genai
 from PIL import Image
 from io import BytesIO
-from rembg import remove
+from rembg import remove, new_session
+
+from metrics import metrics
+from imaging import open_reduced
+from upstream import ResilientCaller
+
+
+class GeneratedImage:
+    """
+    An image exactly as the model encoded it.
+
+    Only the header is parsed (format and dimensions); pixels are decoded on
+    demand by open(), so the bytes can be stored without a re-encode.
+    """
+
+    EXTENSIONS = {'PNG': '.png', 'JPEG': '.jpg', 'WEBP': '.webp'}
+
+    def __init__(self, data):
+        self.data = data
+        with Image.open(BytesIO(data)) as header:
+            self.format = header.format
+            self.size = header.size
+
+    @classmethod
+    def from_image(cls, image, fmt='PNG'):
+        """Encode a PIL image (e.g. a locally composed fallback)"""
+        buffer = BytesIO()
+        image.save(buffer, fmt)
+        return cls(buffer.getvalue())
+
+    @property
+    def width(self):
+        return self.size[0]
+
+    @property
+    def height(self):
+        return self.size[1]
+
+    @property
+    def extension(self):
+        return self.EXTENSIONS.get(self.format, f".{(self.format or 'png').lower()}")
+
+    def open(self):
+        """Decode into a PIL image"""
+        return Image.open(BytesIO(self.data))
+
+    def save(self, path):
+        """Write the encoded bytes verbatim"""
+        with open(path, 'wb') as f:
+            f.write(self.data)
+
 
 class GeminiService:
     """Service for Google Gemini API integration"""
+
+    IMAGE_MODEL = "gemini-3-pro-image-preview"
+    # Identifies everything besides inputs and prompt that shapes a try-on
+    # result; bump when the model or generation config changes.
+    TRYON_CONFIG_SIGNATURE = f"{IMAGE_MODEL}|temperature=0.0|aspect=4:5|size=2048"
+
+    BACKGROUND_REMOVAL_PROMPT = "remove background and any human part and put it on a white transparent background"
+    # Longest side uploads are decoded at before they are sent to the model
+    INPUT_MAX_SIDE = 2048
+    BACKGROUND_REMOVAL_SIGNATURE = f"{IMAGE_MODEL}|temperature=0.0|aspect=4:5|size=1024|rembg|input={INPUT_MAX_SIDE}"
+    GENERATE_CLOTHING_SIGNATURE = f"{IMAGE_MODEL}|temperature=0.0|aspect=4:5|size=1024|{BACKGROUND_REMOVAL_SIGNATURE}"
     
-    def __init__(self, api_key):
-        """Initialize Gemini API with key"""
+    def __init__(self, api_key, rembg_model='u2net', rembg_intra_op_threads=0,
+                 rembg_inter_op_threads=0, rembg_parallel_execution=False, upstream=None, scheduler=None,
+                 client=None):
+        """
+        Initialize Gemini API with key
+
+        Args:
+            api_key: Google API key
+            rembg_model: rembg model used for the local background-removal fallback
+            rembg_intra_op_threads: ONNX Runtime threads per operator (0 = runtime default)
+            rembg_inter_op_threads: ONNX Runtime threads across operators (0 = runtime default)
+            rembg_parallel_execution: Run independent graph nodes in parallel
+            upstream: ResilientCaller applying deadlines, retries and the circuit breaker
+            scheduler: ModelCallScheduler admitting calls (default: no admission control)
+            client: Pre-built genai-style client (e.g. a local fake)
+        """
         if not api_key:
             raise ValueError("Google API key is required")
         
         os.environ['GOOGLE_API_KEY'] = api_key
-        self.client = genai.Client(api_key=api_key)
+        self.client = client or genai.Client(api_key=api_key)
+        self.upstream = upstream or ResilientCaller()
+        self.scheduler = scheduler
+        # Per-thread state so concurrent workers don't see each other's analysis
+        self._local = threading.local()
+
+        # Long-lived rembg session, loaded once by warm_up() or on first use
+        self.rembg_model = rembg_model
+        self.rembg_intra_op_threads = rembg_intra_op_threads
+        self.rembg_inter_op_threads = rembg_inter_op_threads
+        self.rembg_parallel_execution = rembg_parallel_execution
+        self.rembg_ready = False
+        self._rembg_session = None
+        self._rembg_lock = threading.Lock()
+
+    @property
+    def last_analysis(self):
+        """Text returned alongside the most recent generation on the calling thread"""
+        return getattr(self._local, 'last_analysis', None)
+
+    @last_analysis.setter
+    def last_analysis(self, value):
+        self._local.last_analysis = value
+
+    @property
+    def last_was_preview(self):
+        """True if the most recent try-on on this thread fell back to a side-by-side preview"""
+        return getattr(self._local, 'last_was_preview', False)
     
+    @property
+    def last_was_fallback(self):
+        """True if the most recent background removal on this thread fell back to rembg alone"""
+        return getattr(self._local, 'last_was_fallback', False)
+    
+    @contextmanager
+    def reporting(self, on_stage):
+        """Send progress stages of calls made on this thread to on_stage(stage, **detail)"""
+        previous = getattr(self._local, 'on_stage', None)
+        self._local.on_stage = on_stage
+        try:
+            yield
+        finally:
+            self._local.on_stage = previous
+
+    @contextmanager
+    def acting_for(self, user_id):
+        """Attribute model calls made on this thread to user_id for scheduling"""
+        previous = getattr(self._local, 'user_id', None)
+        self._local.user_id = user_id
+        try:
+            yield
+        finally:
+            self._local.user_id = previous
+
+    def _stage(self, stage, **detail):
+        on_stage = getattr(self._local, 'on_stage', None)
+        if on_stage:
+            on_stage(stage, **detail)
+    
+    def _rembg_session_options(self):
+        sess_opts = ort.SessionOptions()
+        sess_opts.intra_op_num_threads = self.rembg_intra_op_threads
+        sess_opts.inter_op_num_threads = self.rembg_inter_op_threads
+        sess_opts.execution_mode = (
+            ort.ExecutionMode.ORT_PARALLEL if self.rembg_parallel_execution
+            else ort.ExecutionMode.ORT_SEQUENTIAL
+        )
+        return sess_opts
+
+    def _get_rembg_session(self):
+        if self._rembg_session is None:
+            with self._rembg_lock:
+                if self._rembg_session is None:
+                    print(f"🧠 Loading rembg model '{self.rembg_model}'...")
+                    self._rembg_session = new_session(self.rembg_model, sess_opts=self._rembg_session_options())
+        return self._rembg_session
+
+    def _generate(self, operation, **request):
+        """Call the model API through the upstream layer, each attempt admitted by the scheduler"""
+        def attempt(timeout):
+            config = request.get('config')
+            if config is not None:
+                # Have the HTTP client give up at the deadline too, so abandoned attempts don't linger
+                http_options = genai.types.HttpOptions(timeout=int(timeout * 1000))
+                config = config.model_copy(update={'http_options': http_options})
+            with metrics.upstream(operation):
+                return self.client.models.generate_content(**{**request, 'config': config})
+
+        # Every attempt (retries and hedges too) costs a token and holds its
+        # own slot until it returns
+        admit = self._admission(operation) if self.scheduler else None
+        return self.upstream.call(operation, attempt, admit=admit)
+
+    def _admission(self, operation):
+        """admit(timeout) for ResilientCaller: a scheduler slot for the calling thread's user"""
+        # Attempts run on upstream worker threads, so capture the caller's user here
+        user_id = getattr(self._local, 'user_id', None)
+
+        def admit(timeout):
+            return self.scheduler.slot(user_id, operation, max_wait=timeout)
+        return admit
+
+    def _remove_with_rembg(self, image):
+        """Run rembg with the shared session"""
+        with metrics.timed('rembg'):
+            result = remove(image, session=self._get_rembg_session())
+        self.rembg_ready = True
+        return result
+
+    def warm_up(self):
+        """Load the rembg model and run one small inference so the first real call is fast"""
+        try:
+            start = time.monotonic()
+            self._remove_with_rembg(Image.new('RGB', (64, 64), (255, 255, 255)))
+            print(f"✓ rembg '{self.rembg_model}' warmed up in {time.monotonic() - start:.1f}s")
+        except Exception as e:
+            print(f"⚠️ rembg warm-up failed, will retry on first use: {e}")
+
     def _resize_image_if_needed(self, image, max_size=1024):
         """Resize image if it exceeds max_size, preserving aspect ratio"""
         if max(image.size) > max_size:
@@ -25,6 +221,13 @@ class GeminiService:
             return image.resize(new_size, Image.Resampling.LANCZOS)
         return image
     
+    @staticmethod
+    def _image_part(path):
+        """Wrap an image file's bytes in a request part without decoding it"""
+        mime_type = mimetypes.guess_type(path)[0] or 'image/png'
+        with open(path, 'rb') as f:
+            return genai.types.Part.from_bytes(data=f.read(), mime_type=mime_type)
+
     def virtual_tryon(self, person_image_path, clothing_image_paths, prompt="try on clothes"):
         """
         Generate virtual try-on using Gemini 2.5 Flash Image Generation
@@ -35,31 +238,37 @@ class GeminiService:
             prompt: Instruction prompt for Gemini
             
         Returns:
-            Generated image as PIL Image object
+            GeneratedImage holding the model's encoded bytes
         """
+        self.last_analysis = None
+        self._local.last_was_preview = False
         try:
-            # Load images at full resolution
-            person_image = Image.open(person_image_path)
-            
             if isinstance(clothing_image_paths, (list, tuple, set)):
-                clothing_images = [Image.open(path) for path in clothing_image_paths]
+                clothing_image_paths = list(clothing_image_paths)
             else:
-                clothing_images = [Image.open(clothing_image_paths)]
+                clothing_image_paths = [clothing_image_paths]
+            
+            # Send the encoded files as-is; nothing is decoded unless the
+            # preview fallback needs it
+            clothing_parts = [self._image_part(path) for path in clothing_image_paths]
+            person_part = self._image_part(person_image_path)
             
             print(f"🤖 Generating virtual try-on with Gemini...")
-            print(f"Person image: {person_image.size}")
-            for idx, img in enumerate(clothing_images, start=1):
-                print(f"Clothing image {idx}: {img.size}")
+            print(f"Person image: {len(person_part.inline_data.data)} bytes")
+            for idx, part in enumerate(clothing_parts, start=1):
+                print(f"Clothing image {idx}: {len(part.inline_data.data)} bytes")
             
             # Build contents payload with clothing images, person image, and prompt
             # Matching user example: Clothing first, then Person
             contents = []
-            contents.extend(clothing_images)
-            contents.append(person_image)
+            contents.extend(clothing_parts)
+            contents.append(person_part)
             contents.append(prompt)
             
-            response = self.client.models.generate_content(
-                model="gemini-3-pro-image-preview",
+            self._stage('model_call_started', step='tryon')
+            response = self._generate(
+                'tryon',
+                model=self.IMAGE_MODEL,
                 contents=contents,
                 config=genai.types.GenerateContentConfig(
                     response_modalities=["IMAGE", "TEXT"],
@@ -74,21 +283,25 @@ class GeminiService:
             # Extract generated image from response
             if not response.candidates or not response.candidates[0].content.parts:
                 print("⚠️ Empty response from Gemini, creating preview...")
-                return self._create_preview_image(person_image, clothing_images[0])
+                return GeneratedImage.from_image(
+                    self._create_preview_image(*self._preview_sources(person_image_path, clothing_image_paths[0]))
+                )
 
             for part in response.candidates[0].content.parts:
                 if part.text is not None:
                     print(f"✓ Gemini response: {part.text[:100]}...")
                     self.last_analysis = part.text
                 elif part.inline_data is not None:
-                    # Decode the generated image
+                    # Keep the encoded bytes; only the header is parsed here
                     print("✓ Image generated successfully!")
-                    image = Image.open(BytesIO(part.inline_data.data))
-                    return image
+                    self._stage('image_received', step='tryon')
+                    return GeneratedImage(part.inline_data.data)
             
             # If no image was generated, create preview
             print("⚠️  No image in response, creating preview...")
-            return self._create_preview_image(person_image, clothing_images[0])
+            return GeneratedImage.from_image(
+                self._create_preview_image(*self._preview_sources(person_image_path, clothing_image_paths[0]))
+            )
             
         except Exception as e:
             print(f"❌ Error in virtual try-on: {str(e)}")
@@ -96,8 +309,14 @@ class GeminiService:
             traceback.print_exc()
             raise Exception(f"Virtual try-on failed: {str(e)}")
     
+    @staticmethod
+    def _preview_sources(person_image_path, clothing_image_path):
+        # The preview is 600px tall; decode no more than that needs
+        return open_reduced(person_image_path, 1200), open_reduced(clothing_image_path, 1200)
+
     def _create_preview_image(self, person_image, clothing_image):
         """Create a simple preview by combining images (fallback)"""
+        self._local.last_was_preview = True
         # Resize images to same height
         target_height = 600
         
@@ -128,7 +347,8 @@ class GeminiService:
             Parsed JSON response with outfit recommendations.
         """
         try:
-            response = self.client.models.generate_content(
+            response = self._generate(
+                'recommend_outfits',
                 model="gemini-3-pro-preview",
                 contents=styling_context,
                 config=genai.types.GenerateContentConfig(
@@ -194,8 +414,10 @@ class GeminiService:
             
             print(f"🎨 Generating clothing image for: {description}")
             
-            response = self.client.models.generate_content(
-                model="gemini-3-pro-image-preview",
+            self._stage('model_call_started', step='generate')
+            response = self._generate(
+                'generate_clothing',
+                model=self.IMAGE_MODEL,
                 contents=prompt,
                 config=genai.types.GenerateContentConfig(
                     response_modalities=["IMAGE", "TEXT"],
@@ -213,10 +435,12 @@ class GeminiService:
             for part in response.candidates[0].content.parts:
                 if part.inline_data is not None:
                     print("✓ Clothing image generated successfully!")
+                    self._stage('image_received', step='generate')
                     img = Image.open(BytesIO(part.inline_data.data))
 
                     # Remove background using Gemini
                     print("✨ Removing background using Gemini...")
+                    self._stage('post_processing', step='background_removal')
                     return self.remove_background(img)
 
             raise Exception("No image generated")
@@ -237,8 +461,8 @@ class GeminiService:
             Refined image as PIL Image object
         """
         try:
-            # Load previous image
-            previous_image = Image.open(image_path)
+            # Load previous image, decoded directly at the model input size
+            previous_image = open_reduced(image_path, self.INPUT_MAX_SIDE)
             
             # Construct prompt
             prompt = f"Edit this clothing item. {refinement_prompt}. Keep the item isolated on a pure white background. High quality, realistic texture."
@@ -247,8 +471,10 @@ class GeminiService:
             
             contents = [prompt, previous_image]
             
-            response = self.client.models.generate_content(
-                model="gemini-3-pro-image-preview",
+            self._stage('model_call_started', step='refine')
+            response = self._generate(
+                'refine_clothing',
+                model=self.IMAGE_MODEL,
                 contents=contents,
                 config=genai.types.GenerateContentConfig(
                     response_modalities=["IMAGE", "TEXT"],
@@ -265,10 +491,12 @@ class GeminiService:
             for part in response.candidates[0].content.parts:
                 if part.inline_data is not None:
                     print("✓ Refined image generated successfully!")
+                    self._stage('image_received', step='refine')
                     img = Image.open(BytesIO(part.inline_data.data))
 
                     # Remove background using Gemini
                     print("✨ Removing background using Gemini...")
+                    self._stage('post_processing', step='background_removal')
                     return self.remove_background(img)
 
             raise Exception("No image generated during refinement")
@@ -283,17 +511,19 @@ class GeminiService:
         We use Gemini to remove human parts and the original background,
         placing the item on a clean background. Then we use rembg for transparency.
         """
+        self._local.last_was_fallback = False
         try:
             # Convert to RGB if needed
             if image.mode != 'RGB':
                 image = image.convert('RGB')
                 
-            prompt = "remove background and any human part and put it on a white transparent background"
+            prompt = self.BACKGROUND_REMOVAL_PROMPT
             
             print("🤖 Requesting background removal via Gemini...")
             
-            response = self.client.models.generate_content(
-                model="gemini-3-pro-image-preview",
+            response = self._generate(
+                'remove_background',
+                model=self.IMAGE_MODEL,
                 contents=[prompt, image],
                 config=genai.types.GenerateContentConfig(
                     response_modalities=["IMAGE"],
@@ -307,7 +537,8 @@ class GeminiService:
             
             if not response.candidates or not response.candidates[0].content.parts:
                 print("⚠️ Empty response from Gemini background removal, falling back to rembg")
-                return remove(image)
+                self._local.last_was_fallback = True
+                return self._remove_with_rembg(image)
 
             for part in response.candidates[0].content.parts:
                 if part.inline_data is not None:
@@ -316,13 +547,15 @@ class GeminiService:
                     # Since Gemini generates a rectangular image (likely with white background based on prompt),
                     # we use rembg to ensure it's actually transparent.
                     print("✨ Applying final transparency with rembg...")
-                    return remove(img_result)
+                    return self._remove_with_rembg(img_result)
             
             # Fallback if Gemini fails
             print("⚠️ Gemini background removal failed, falling back to rembg")
-            return remove(image)
+            self._local.last_was_fallback = True
+            return self._remove_with_rembg(image)
             
         except Exception as e:
             print(f"❌ Error in Gemini background removal: {e}")
             # Fallback
-            return remove(image)
+            self._local.last_was_fallback = True
+            return self._remove_with_rembg(image)
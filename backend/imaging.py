@@ -0,0 +1,33 @@
+import math
+
+from PIL import Image, ImageOps
+
+# A decode may come out this much smaller than max_side if that lets JPEG
+# skip a whole scale step (a 4032px photo decodes at 2016px for 2048)
+DRAFT_TOLERANCE = 0.9
+
+
+def decode_reduced(image, max_side, mode=None):
+    """
+    Decode an opened (not yet loaded) image at reduced resolution, upright.
+
+    JPEGs use draft mode: libjpeg scales by 1/2, 1/4 or 1/8 during the
+    inverse DCT, picking the smallest scale whose longest side still
+    reaches about max_side, so the full-size bitmap of a 12MP photo is
+    never allocated. Other formats decode at full size. EXIF orientation is
+    applied; the result is a new, loaded image that may still exceed max_side.
+    """
+    scale = min(1.0, max_side * DRAFT_TOLERANCE / max(image.size))
+    image.draft(mode, (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+    return ImageOps.exif_transpose(image)
+
+
+def open_reduced(source, max_side, mode=None):
+    """
+    Open a path or file object as an upright image no larger than max_side
+    on its longest side, decoding no more pixels than needed.
+    """
+    with Image.open(source) as image:
+        image = decode_reduced(image, max_side, mode)
+    image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    return image
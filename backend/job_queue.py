@@ -0,0 +1,191 @@
+import os
+import time
+import threading
+import traceback
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func
+
+from models import db, Job, utcnow
+from metrics import metrics
+
+
+class JobQueue:
+    """
+    Runs long generation jobs on a worker pool outside the request cycle.
+
+    A process running jobs refreshes their heartbeat_at every
+    `heartbeat_interval` seconds. A 'running' job whose heartbeat is older
+    than `lease_timeout` was left by a worker that died or restarted; the
+    periodic sweep fails it and runs its failure hook (refund).
+    """
+
+    def __init__(self, app, max_workers=4, lease_timeout=60, heartbeat_interval=15):
+        """
+        Args:
+            app: Flask app; each job runs inside its own app context
+            max_workers: Number of worker threads processing jobs
+            lease_timeout: Seconds without a heartbeat after which a running
+                job is presumed abandoned
+            heartbeat_interval: Seconds between heartbeats and sweeps
+        """
+        self.app = app
+        self.lease_timeout = lease_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job-worker')
+        self.handlers = {}
+        self._finished = threading.Condition()
+        self._running = set()  # ids of jobs running in this process
+        self._heartbeat_pid = None
+        self._start_lock = threading.Lock()
+
+    def register(self, kind, handler, on_failure=None):
+        """
+        Register the handler for a job kind.
+
+        Args:
+            kind: Job.kind value the handler processes
+            handler: Callable(job) doing the work; it may set result fields on the job
+            on_failure: Optional callable(job) run after a failed attempt (e.g. credit refund)
+        """
+        self.handlers[kind] = (handler, on_failure)
+
+    def submit(self, job_id):
+        """Schedule a queued job on the worker pool"""
+        self._ensure_heartbeat()
+        self.executor.submit(self._run, job_id)
+
+    def _ensure_heartbeat(self):
+        # Started on first use and again in a forked child, where the
+        # parent's thread doesn't exist
+        with self._start_lock:
+            if self._heartbeat_pid == os.getpid():
+                return
+            self._heartbeat_pid = os.getpid()
+            threading.Thread(target=self._heartbeat_loop, name='job-heartbeat', daemon=True).start()
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(self.heartbeat_interval)
+            with self.app.app_context():
+                try:
+                    running = list(self._running)
+                    if running:
+                        Job.query.filter(Job.id.in_(running), Job.status == 'running').update(
+                            {'heartbeat_at': utcnow()}, synchronize_session=False
+                        )
+                        db.session.commit()
+                    self._fail_abandoned()
+                except Exception:
+                    traceback.print_exc()
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+    def recover(self):
+        """Fail jobs abandoned mid-run and re-submit jobs left queued by a previous process"""
+        self._ensure_heartbeat()
+        with self.app.app_context():
+            self._fail_abandoned()
+            pending = [job.id for job in Job.query.filter_by(status='queued').all()]
+        for job_id in pending:
+            self.submit(job_id)
+        if pending:
+            print(f"🔁 Re-queued {len(pending)} pending job(s)")
+
+    def _fail_abandoned(self):
+        """Mark running jobs whose lease expired failed and run their failure hook (e.g. refund)"""
+        cutoff = utcnow() - timedelta(seconds=self.lease_timeout)
+        stale = [job_id for (job_id,) in db.session.query(Job.id).filter(
+            Job.status == 'running',
+            func.coalesce(Job.heartbeat_at, Job.started_at) < cutoff
+        ).all() if job_id not in self._running]
+        failed = 0
+        for job_id in stale:
+            # Guarded like the claim in _process, so each row is failed (and
+            # refunded) by exactly one process
+            updated = Job.query.filter_by(id=job_id, status='running').update({
+                'status': 'failed',
+                'error': 'The worker running this job stopped. Please try again.',
+                'finished_at': utcnow(),
+                'dedupe_key': None
+            })
+            if updated:
+                job = db.session.get(Job, job_id)
+                _, on_failure = self.handlers.get(job.kind, (None, None))
+                if on_failure:
+                    on_failure(job)
+                failed += 1
+            db.session.commit()
+        if failed:
+            print(f"⚠️ Failed {failed} job(s) abandoned while running")
+            with self._finished:
+                self._finished.notify_all()
+
+    def wait(self, timeout):
+        """Block until any job finishes or changes stage in this process, or the timeout elapses"""
+        self._ensure_heartbeat()
+        with self._finished:
+            self._finished.wait(timeout)
+
+    def set_stage(self, job, stage):
+        """Record a running job's progress stage and wake anyone streaming it"""
+        job.stage = stage
+        db.session.commit()
+        with self._finished:
+            self._finished.notify_all()
+
+    def _run(self, job_id):
+        with self.app.app_context():
+            try:
+                self._process(job_id)
+            finally:
+                db.session.remove()
+        with self._finished:
+            self._finished.notify_all()
+
+    def _process(self, job_id):
+        # Claim the job atomically so a job is never run twice, even if
+        # several processes recover the same queued rows.
+        claimed = Job.query.filter_by(id=job_id, status='queued').update(
+            {'status': 'running', 'started_at': utcnow(), 'heartbeat_at': utcnow()}
+        )
+        db.session.commit()
+        if not claimed:
+            return
+
+        self._running.add(job_id)
+        try:
+            self._execute(job_id)
+        finally:
+            self._running.discard(job_id)
+
+    def _execute(self, job_id):
+
+        job = db.session.get(Job, job_id)
+        handler, on_failure = self.handlers.get(job.kind, (None, None))
+
+        try:
+            if handler is None:
+                raise ValueError(f"No handler registered for job kind '{job.kind}'")
+            with metrics.timed(f'job_{job.kind}'):
+                handler(job)
+            job.status = 'succeeded'
+            job.finished_at = utcnow()
+            job.dedupe_key = None
+            with metrics.timed('job_commit'):
+                db.session.commit()
+            print(f"✓ Job {job.id} ({job.kind}) succeeded")
+        except Exception as e:
+            traceback.print_exc()
+            db.session.rollback()
+            job = db.session.get(Job, job_id)
+            job.status = 'failed'
+            job.error = str(e)
+            job.finished_at = utcnow()
+            job.dedupe_key = None
+            if on_failure:
+                on_failure(job)
+            db.session.commit()
+            print(f"❌ Job {job.id} ({job.kind}) failed: {e}")
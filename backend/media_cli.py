@@ -0,0 +1,130 @@
+import os
+import glob
+
+import click
+from flask.cli import AppGroup
+
+from models import db, Photo, ClothingItem, SavedLook
+
+# (model, stored path column, filename column, subfolder)
+MEDIA_COLUMNS = (
+    (Photo, 'filepath', 'filename', 'photos'),
+    (ClothingItem, 'filepath', 'filename', 'clothing'),
+    (SavedLook, 'result_filepath', 'result_filename', 'results'),
+)
+
+
+def _legacy_candidates(media_index, stored_path, subfolder, filename):
+    """Places older versions of the app may have written a file to"""
+    candidates = []
+    if stored_path:
+        if os.path.isabs(stored_path):
+            candidates.append(stored_path)
+        else:
+            normalized = stored_path.lstrip("./")
+            if normalized.startswith('uploads/'):
+                normalized = normalized.split('/', 1)[1]
+            candidates.append(os.path.join(media_index.upload_folder, normalized))
+    if filename:
+        candidates.append(os.path.join(media_index.upload_folder, subfolder, filename))
+        candidates.append(os.path.join(os.path.abspath(os.path.dirname(__file__)), 'uploads', filename))
+    return candidates
+
+
+def _remove_derived(path):
+    """Delete thumbnails and model inputs left next to a flat file"""
+    for derived in glob.glob(f"{glob.escape(path)}.*"):
+        os.remove(derived)
+
+
+def register_media_commands(app, media_store):
+    """Add `flask media ...` commands for maintaining stored media"""
+    media_index = media_store.index
+    media_cli = AppGroup('media', help='Maintain stored media, the media store and the media index.')
+
+    @media_cli.command('backfill')
+    @click.option('--dry-run', is_flag=True, help='Report changes without writing them.')
+    def backfill(dry_run):
+        """Rewrite stored paths as canonical keys and move flat files into the media store."""
+        media_index.rebuild()
+        media_store.load()
+        stored = media_store.keys()
+        updated = ingested = missing = 0
+        for model, path_column, name_column, subfolder in MEDIA_COLUMNS:
+            # Collect first: ingesting commits as it goes
+            records = [(record.id, getattr(record, path_column), getattr(record, name_column))
+                       for record in model.query.yield_per(500)]
+            for record_id, stored_path, filename in records:
+                key = media_index.normalize(stored_path, subfolder, filename)
+
+                if key not in stored:
+                    source = next((candidate for candidate in
+                                   [media_index.path(key)] +
+                                   _legacy_candidates(media_index, stored_path, subfolder, filename)
+                                   if os.path.exists(candidate)), None)
+                    if source:
+                        print(f"📦 {model.__tablename__} {record_id}: storing {source} as {key}")
+                        if not dry_run:
+                            media_store.ingest(key, source)
+                            _remove_derived(source)
+                            media_index.discard(source)
+                            stored.add(key)
+                        ingested += 1
+                    else:
+                        print(f"⚠️ {model.__tablename__} {record_id}: file not found ({stored_path})")
+                        missing += 1
+
+                if stored_path != key:
+                    if not dry_run:
+                        model.query.filter_by(id=record_id).update({path_column: key})
+                    updated += 1
+
+                if not dry_run:
+                    # The file has moved, so record it right away
+                    db.session.commit()
+
+        if dry_run:
+            db.session.rollback()
+        print(f"✅ {updated} path(s) normalized, {ingested} file(s) moved into the store, {missing} missing"
+              f"{' (dry run)' if dry_run else ''}")
+
+    @media_cli.command('rebuild-index')
+    def rebuild_index():
+        """Reload the store's key map and rescan the flat upload folder."""
+        print(f"Media store: {media_store.load()} key(s)")
+        counts = media_index.rebuild()
+        for subfolder, count in counts.items():
+            print(f"{subfolder}: {count} flat file(s)")
+        print(f"✅ Indexed {len(media_index)} flat media file(s) under {media_index.upload_folder}")
+
+    @media_cli.command('verify')
+    def verify():
+        """Check every stored path against the media store; exits 1 if files are missing."""
+        media_store.load()
+        media_index.rebuild()
+        stored = media_store.keys()
+        referenced = set()
+        missing = unnormalized = flat = 0
+        for model, path_column, name_column, subfolder in MEDIA_COLUMNS:
+            for record in model.query.yield_per(500):
+                stored_path = getattr(record, path_column)
+                key = media_index.normalize(stored_path, subfolder, getattr(record, name_column))
+                referenced.add(key)
+                if stored_path != key:
+                    unnormalized += 1
+                if key in stored:
+                    continue
+                if key in media_index:
+                    flat += 1
+                else:
+                    print(f"❌ {model.__tablename__} {record.id}: {key} is missing")
+                    missing += 1
+
+        unreferenced = stored - referenced
+        print(f"{len(referenced)} referenced, {missing} missing, "
+              f"{unnormalized} not yet normalized and {flat} not yet in the store "
+              f"(run `flask media backfill`), {len(unreferenced)} unreferenced key(s)")
+        if missing:
+            raise SystemExit(1)
+
+    app.cli.add_command(media_cli)
@@ -0,0 +1,134 @@
+import os
+import re
+import threading
+
+
+class MediaIndex:
+    """
+    In-memory set of media files present under the upload folder.
+
+    Files are addressed by a canonical key relative to the upload folder,
+    e.g. `photos/<uuid>.jpg`, `clothing/<uuid>.png`, `results/<uuid>.png`,
+    which is also what the database stores. The index is built with one
+    directory listing per subfolder at startup and kept up to date by
+    add()/discard() on every write and delete, so resolving a record's file
+    needs no stat calls.
+    """
+
+    SUBFOLDERS = ('photos', 'clothing', 'results')
+    # Thumbnails, model inputs and in-flight temp files living next to the originals
+    _DERIVED = re.compile(r'(\.w\d+\.(webp|jpeg)|\.model\.jpg|\.tmp)$')
+
+    def __init__(self, upload_folder):
+        self.upload_folder = os.path.abspath(upload_folder)
+        self._lock = threading.Lock()
+        self._keys = set()
+
+    # --- keys and paths (string operations only) ---
+
+    def key_for(self, subfolder, filename):
+        return f"{subfolder}/{filename}"
+
+    def path(self, key):
+        """Absolute path of a canonical key"""
+        return os.path.join(self.upload_folder, *key.split('/'))
+
+    def normalize(self, stored_path, subfolder, filename=None):
+        """
+        Canonical key for a stored path, which may be a key already, an
+        `uploads/...` relative path or a legacy absolute path.
+        """
+        if stored_path and not os.path.isabs(stored_path):
+            key = stored_path.replace(os.sep, '/')
+            while key.startswith('./'):
+                key = key[2:]
+            if key.startswith('uploads/'):
+                key = key.split('/', 1)[1]
+            if key.startswith(f"{subfolder}/"):
+                return key
+
+        if stored_path and os.path.isabs(stored_path):
+            relative = os.path.relpath(os.path.abspath(stored_path), self.upload_folder)
+            if not relative.startswith('..'):
+                return relative.replace(os.sep, '/')
+
+        # Legacy location outside the upload folder: the file belongs at
+        # <subfolder>/<filename> (the backfill moves it there)
+        filename = filename or (os.path.basename(stored_path) if stored_path else None)
+        return self.key_for(subfolder, filename) if filename else None
+
+    def locate(self, stored_path, subfolder, filename=None):
+        """Absolute path a record's file lives at, whether or not it exists"""
+        key = self.normalize(stored_path, subfolder, filename)
+        return self.path(key) if key else None
+
+    # --- membership ---
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._keys
+
+    def __len__(self):
+        with self._lock:
+            return len(self._keys)
+
+    def keys(self):
+        with self._lock:
+            return set(self._keys)
+
+    def add(self, key_or_path):
+        """Mark a file as present; accepts a key or an absolute path"""
+        key = self._as_key(key_or_path)
+        if key:
+            with self._lock:
+                self._keys.add(key)
+
+    def discard(self, key_or_path):
+        key = self._as_key(key_or_path)
+        if key:
+            with self._lock:
+                self._keys.discard(key)
+
+    def _as_key(self, key_or_path):
+        if not key_or_path:
+            return None
+        if os.path.isabs(key_or_path):
+            relative = os.path.relpath(key_or_path, self.upload_folder)
+            return None if relative.startswith('..') else relative.replace(os.sep, '/')
+        return key_or_path
+
+    def resolve(self, stored_path, subfolder, filename=None):
+        """
+        Absolute path of a record's file, or None if it isn't present.
+
+        Known files cost no stat call. An unknown key is checked on disk once,
+        since another worker process may have written it.
+        """
+        key = self.normalize(stored_path, subfolder, filename)
+        if not key:
+            return None
+        if key in self:
+            return self.path(key)
+        path = self.path(key)
+        if os.path.isfile(path):
+            self.add(key)
+            return path
+        return None
+
+    def rebuild(self):
+        """Re-scan the upload folder; returns {subfolder: file count}"""
+        keys = set()
+        counts = {}
+        for subfolder in self.SUBFOLDERS:
+            directory = os.path.join(self.upload_folder, subfolder)
+            counts[subfolder] = 0
+            if not os.path.isdir(directory):
+                continue
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file() and not self._DERIVED.search(entry.name):
+                        keys.add(self.key_for(subfolder, entry.name))
+                        counts[subfolder] += 1
+        with self._lock:
+            self._keys = keys
+        return counts
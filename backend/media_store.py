@@ -0,0 +1,339 @@
+import os
+import shutil
+import hashlib
+import threading
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, MediaBlob, MediaObject
+
+
+class LocalStorageBackend:
+    """Blobs stored as files under a local directory"""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.local_root = self.root
+        os.makedirs(self.root, exist_ok=True)
+
+    def local_path(self, name):
+        """Readable local file for a blob"""
+        return os.path.join(self.root, *name.split('/'))
+
+    def cached_path(self, name):
+        return self.local_path(name)
+
+    def store(self, name, source_path):
+        """Move source_path into the store as `name`, replacing any existing file"""
+        target = self.local_path(name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.replace(source_path, target)
+        except OSError:
+            # Different filesystem: copy to a temp name, then swap in atomically
+            tmp = f"{target}.{threading.get_ident()}.tmp"
+            shutil.copyfile(source_path, tmp)
+            os.replace(tmp, target)
+            os.remove(source_path)
+
+    def delete(self, name):
+        try:
+            os.remove(self.local_path(name))
+        except FileNotFoundError:
+            pass
+
+
+class S3StorageBackend:
+    """
+    Blobs stored in an S3-compatible bucket (AWS S3, MinIO, R2, ...).
+
+    Image processing and serving need local files, so blobs are also kept in
+    a local cache directory: new uploads are moved there after upload and
+    other blobs are downloaded on first use.
+    """
+
+    def __init__(self, bucket, cache_dir, prefix='', endpoint_url=None, region=None,
+                 access_key_id=None, secret_access_key=None, client=None):
+        """
+        Args:
+            bucket: Bucket name
+            cache_dir: Local directory for cached copies
+            prefix: Key prefix inside the bucket
+            endpoint_url: Custom endpoint for S3-compatible services
+            region: Bucket region
+            access_key_id: Credentials (default: the standard AWS credential chain)
+            secret_access_key: Credentials
+            client: Pre-built boto3-style client (e.g. a local stand-in)
+        """
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise RuntimeError("MEDIA_STORAGE_BACKEND=s3 requires boto3 (pip install boto3, see requirements.txt)")
+            client = boto3.client(
+                's3',
+                endpoint_url=endpoint_url or None,
+                region_name=region or None,
+                aws_access_key_id=access_key_id or None,
+                aws_secret_access_key=secret_access_key or None
+            )
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.local_root = self.cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _object_key(self, name):
+        return f"{self.prefix}{name}"
+
+    def cached_path(self, name):
+        """Where the local copy of a blob lives (it may not exist yet)"""
+        return os.path.join(self.cache_dir, *name.split('/'))
+
+    def local_path(self, name):
+        """Local copy of a blob, downloading it on first use"""
+        path = self.cached_path(name)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            self.client.download_file(self.bucket, self._object_key(name), tmp)
+            os.replace(tmp, path)
+        return path
+
+    def store(self, name, source_path):
+        self.client.upload_file(source_path, self.bucket, self._object_key(name))
+        target = self.cached_path(name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(source_path, target)
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(name))
+        try:
+            os.remove(self.cached_path(name))
+        except FileNotFoundError:
+            pass
+
+
+class MediaStore:
+    """
+    Content-addressed media storage with reference counting.
+
+    Every stored file is named by the sha256 of its bytes and sharded by
+    hash prefix (`ab/cd/<digest>.png`), so no directory grows past a few
+    thousand entries and identical uploads share one blob. Media keys
+    (`photos/<uuid>.png`, what records store and URLs use) map to blobs via
+    the media_objects table, mirrored in memory for lookups; blobs are
+    deleted when their last key is released.
+
+    Files that predate the store are still found through the MediaIndex of
+    the flat upload folders until `flask media backfill` ingests them.
+    """
+
+    def __init__(self, backend, media_index):
+        self.backend = backend
+        self.index = media_index
+        # New files are written here first, on the same filesystem as the blobs
+        self.staging_dir = os.path.join(backend.local_root, '.staging')
+        os.makedirs(self.staging_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._objects = {}  # media key -> blob name
+
+    def staging_path(self, filename):
+        """Where to write a new file before ingest() moves it into the store"""
+        return os.path.join(self.staging_dir, filename)
+
+    @staticmethod
+    def blob_name(digest, ext):
+        return f"{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+    @staticmethod
+    def _digest(path):
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def load(self):
+        """Load the key -> blob map (needs an app context)"""
+        rows = db.session.query(MediaObject.key, MediaBlob.name).join(
+            MediaBlob, MediaBlob.digest == MediaObject.digest
+        ).all()
+        with self._lock:
+            self._objects = dict(rows)
+        return len(rows)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._objects)
+
+    def keys(self):
+        with self._lock:
+            return set(self._objects)
+
+    def _blob_for(self, key):
+        with self._lock:
+            name = self._objects.get(key)
+        if name is None:
+            # Another worker process may have stored it
+            row = db.session.query(MediaBlob.name).join(
+                MediaObject, MediaObject.digest == MediaBlob.digest
+            ).filter(MediaObject.key == key).first()
+            if row:
+                name = row[0]
+                with self._lock:
+                    self._objects[key] = name
+        return name
+
+    def ingest(self, key, source_path):
+        """
+        Store the file at source_path under `key`, consuming the file.
+
+        Runs in the caller's transaction; the caller commits. Returns the
+        local path to read the stored bytes from.
+        """
+        digest = self._digest(source_path)
+        name = self.blob_name(digest, os.path.splitext(key)[1].lower())
+
+        if self._add_reference(digest):
+            # Same bytes are already stored (possibly under another extension)
+            os.remove(source_path)
+            name = self._existing_name(digest)
+        else:
+            size = os.path.getsize(source_path)
+            try:
+                # Another upload of the same bytes may have inserted the blob
+                # row since _add_reference(); then count this key against it.
+                # The row goes in before the file, so a purge() of these bytes
+                # still in progress finishes before the file is written
+                with db.session.begin_nested():
+                    db.session.add(MediaBlob(digest=digest, name=name, size_bytes=size, ref_count=1))
+            except IntegrityError:
+                self._add_reference(digest)
+                os.remove(source_path)
+                name = self._existing_name(digest)
+            else:
+                self.backend.store(name, source_path)
+
+        db.session.add(MediaObject(key=key, digest=digest))
+        with self._lock:
+            self._objects[key] = name
+        return self.backend.local_path(name)
+
+    def _add_reference(self, digest):
+        updated = MediaBlob.query.filter_by(digest=digest).update(
+            {MediaBlob.ref_count: MediaBlob.ref_count + 1},
+            synchronize_session=False
+        )
+        return updated > 0
+
+    def _existing_name(self, digest):
+        return db.session.query(MediaBlob.name).filter_by(digest=digest).scalar()
+
+    def resolve(self, stored_path, subfolder, filename=None):
+        """Absolute local path of a record's file, or None if it isn't stored"""
+        key = self.index.normalize(stored_path, subfolder, filename)
+        if not key:
+            return None
+        name = self._blob_for(key)
+        if name:
+            return self.backend.local_path(name)
+        # Not ingested yet: legacy flat upload folders
+        return self.index.resolve(key, subfolder)
+
+    def resolve_key(self, key):
+        """Local path for a media key such as 'photos/<name>' (keys must already be safe)"""
+        subfolder = key.split('/', 1)[0]
+        if subfolder not in self.index.SUBFOLDERS:
+            return None
+        return self.resolve(key, subfolder)
+
+    def release(self, stored_path, subfolder, filename=None):
+        """
+        Drop a record's reference to its file, in the caller's transaction.
+
+        Returns a token for purge(), to be called once the caller has committed.
+        """
+        key = self.index.normalize(stored_path, subfolder, filename)
+        if not key:
+            return None
+
+        obj = db.session.get(MediaObject, key)
+        if obj is None:
+            # Legacy flat file: nothing else can reference it
+            return ('flat', self.index.path(key), None)
+
+        digest = obj.digest
+        db.session.delete(obj)
+        with self._lock:
+            self._objects.pop(key, None)
+
+        MediaBlob.query.filter_by(digest=digest).update(
+            {MediaBlob.ref_count: MediaBlob.ref_count - 1},
+            synchronize_session=False
+        )
+        blob = MediaBlob.query.filter(MediaBlob.digest == digest, MediaBlob.ref_count <= 0).first()
+        if blob is None:
+            return None
+        token = ('blob', blob.name, digest)
+        db.session.delete(blob)
+        return token
+
+    def purge(self, token):
+        """
+        Delete the file released by release(), if it was the last reference.
+
+        Call after the caller has committed; purge() commits its own work.
+        Returns the local path the file had (for cleaning up thumbnails etc.) or None.
+        """
+        if not token:
+            return None
+        kind, target, digest = token
+        if kind == 'flat':
+            try:
+                os.remove(target)
+            except FileNotFoundError:
+                pass
+            self.index.discard(target)
+            return target
+        try:
+            # Hold the blob's row while its file is deleted: ingest() of the
+            # same bytes inserts that row before writing the file, so it
+            # either waits for this purge or already owns the file. No
+            # savepoint here: on SQLite releasing an outermost savepoint
+            # commits, which would let go of the row too early
+            db.session.add(MediaBlob(digest=digest, name=target, size_bytes=0, ref_count=0))
+            db.session.flush()
+        except IntegrityError:
+            # The same bytes were uploaded again since release()
+            db.session.rollback()
+            return None
+        path = self.backend.cached_path(target)
+        try:
+            self.backend.delete(target)
+        finally:
+            MediaBlob.query.filter_by(digest=digest, ref_count=0).delete(synchronize_session=False)
+            db.session.commit()
+        return path
+
+
+def create_media_store(config, media_index):
+    """Build the MediaStore for the configured backend"""
+    if config['MEDIA_STORAGE_BACKEND'] == 's3':
+        if not config['S3_BUCKET']:
+            raise RuntimeError("MEDIA_STORAGE_BACKEND=s3 requires S3_BUCKET")
+        backend = S3StorageBackend(
+            config['S3_BUCKET'],
+            config['MEDIA_CACHE_DIR'],
+            prefix=config['S3_PREFIX'],
+            endpoint_url=config['S3_ENDPOINT_URL'],
+            region=config['S3_REGION'],
+            access_key_id=config['S3_ACCESS_KEY_ID'],
+            secret_access_key=config['S3_SECRET_ACCESS_KEY']
+        )
+    elif config['MEDIA_STORAGE_BACKEND'] == 'local':
+        backend = LocalStorageBackend(config['MEDIA_STORAGE_DIR'])
+    else:
+        raise RuntimeError(f"Unknown MEDIA_STORAGE_BACKEND: {config['MEDIA_STORAGE_BACKEND']}")
+    return MediaStore(backend, media_index)
@@ -0,0 +1,233 @@
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+from flask import g, request
+
+# Seconds; spans cache hits (milliseconds) up to slow upstream generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160)
+
+# Prefix added to every exported metric name
+NAMESPACE = 'tryon'
+
+_NULL_CONTEXT = nullcontext()
+
+
+class _Series:
+    """One metric family: a value (or bucket counts) per label combination"""
+
+    def __init__(self, name, kind, help_text, labelnames, buckets=None):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        self.values = {}  # label values tuple -> float, or [bucket counts, sum, count]
+
+
+class Metrics:
+    """
+    In-process metrics registry with Prometheus text output.
+
+    Records per-route and per-stage latency histograms and upstream call
+    counters; gauges such as queue depths and cache hit counts are read
+    from their owners at scrape time via collectors. With structured
+    logging on, every observation is also printed as one JSON line.
+
+    Like `db`, a module-level instance is configured by init_app(). While
+    disabled, timed()/observe()/inc() return immediately and no request
+    hooks are installed. Values are per process: with several Gunicorn
+    workers, each worker exposes its own.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.json_logs = False
+        self._lock = threading.Lock()
+        self._series = {}
+        self._collectors = {}  # name -> (kind, help, labelnames, callable -> {labels tuple: value})
+
+        self.histogram('http_request_duration_seconds', 'HTTP request latency by route',
+                       ('method', 'route', 'status'))
+        self.histogram('stage_duration_seconds', 'Latency of individual processing stages', ('stage',))
+        self.histogram('upstream_call_duration_seconds', 'Latency of model API calls',
+                       ('operation', 'outcome'))
+        self.counter('upstream_calls_total', 'Model API calls by outcome and error class',
+                     ('operation', 'outcome', 'error_class'))
+
+    def init_app(self, app):
+        self.enabled = app.config['METRICS_ENABLED']
+        self.json_logs = self.enabled and app.config['METRICS_JSON_LOGS']
+        if not self.enabled:
+            return
+
+        @app.before_request
+        def _start_timer():
+            g._metrics_started = time.perf_counter()
+
+        @app.after_request
+        def _record_request(response):
+            started = g.pop('_metrics_started', None)
+            if started is not None:
+                # Label by route pattern, not raw path, to keep cardinality bounded
+                route = request.url_rule.rule if request.url_rule else 'unmatched'
+                self.observe('http_request_duration_seconds', time.perf_counter() - started,
+                             method=request.method, route=route, status=str(response.status_code))
+            return response
+
+    # --- registration ---
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self._series[name] = _Series(name, 'histogram', help_text, labelnames, tuple(buckets))
+
+    def counter(self, name, help_text, labelnames=()):
+        self._series[name] = _Series(name, 'counter', help_text, labelnames)
+
+    def collector(self, name, kind, help_text, labelnames, collect):
+        """
+        Register a metric read at scrape time.
+
+        collect() returns {label values tuple: value}; use () as the key for
+        an unlabeled value. Registering a name again replaces the collector.
+        """
+        self._collectors[name] = (kind, help_text, tuple(labelnames), collect)
+
+    # --- recording ---
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        series = self._series[name]
+        key = tuple(labels.get(label, '') for label in series.labelnames)
+        with self._lock:
+            entry = series.values.get(key)
+            if entry is None:
+                entry = series.values[key] = [[0] * len(series.buckets), 0.0, 0]
+            for idx, bound in enumerate(series.buckets):
+                if value <= bound:
+                    entry[0][idx] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+        if self.json_logs:
+            self.log(name, duration_ms=round(value * 1000, 2), **labels)
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        series = self._series[name]
+        key = tuple(labels.get(label, '') for label in series.labelnames)
+        with self._lock:
+            series.values[key] = series.values.get(key, 0) + amount
+
+    def timed(self, stage):
+        """Context manager recording the block's duration as a stage"""
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._timed(stage)
+
+    @contextmanager
+    def _timed(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_duration_seconds', time.perf_counter() - started, stage=stage)
+
+    def upstream(self, operation):
+        """Context manager recording a model API call's latency and outcome"""
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._upstream(operation)
+
+    @contextmanager
+    def _upstream(self, operation):
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            elapsed = time.perf_counter() - started
+            error_class = classify_error(e)
+            self.inc('upstream_calls_total', operation=operation, outcome='error', error_class=error_class)
+            self.observe('upstream_call_duration_seconds', elapsed, operation=operation, outcome='error')
+            raise
+        elapsed = time.perf_counter() - started
+        self.inc('upstream_calls_total', operation=operation, outcome='ok', error_class='')
+        self.observe('upstream_call_duration_seconds', elapsed, operation=operation, outcome='ok')
+
+    def log(self, event, **fields):
+        """Print one structured JSON log line"""
+        line = json.dumps({'ts': round(time.time(), 3), 'event': event, **fields}, default=str)
+        # One write per line so lines from concurrent threads don't interleave
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+    # --- exposition ---
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        with self._lock:
+            snapshot = [
+                (series, {key: [list(value[0]), value[1], value[2]] if series.kind == 'histogram' else value
+                          for key, value in series.values.items()})
+                for series in self._series.values()
+            ]
+        for series, values in snapshot:
+            kind = series.kind
+            name = f"{NAMESPACE}_{series.name}"
+            lines.append(f"# HELP {name} {series.help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in sorted(values.items()):
+                labels = list(zip(series.labelnames, key))
+                if kind == 'histogram':
+                    counts, total, count = value
+                    cumulative = 0
+                    for bound, bucket_count in zip(series.buckets, counts):
+                        cumulative += bucket_count
+                        lines.append(f"{name}_bucket{_labels(labels + [('le', _number(bound))])} {cumulative}")
+                    lines.append(f"{name}_bucket{_labels(labels + [('le', '+Inf')])} {count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+                    lines.append(f"{name}_count{_labels(labels)} {count}")
+                else:
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+        for name, (kind, help_text, labelnames, collect) in list(self._collectors.items()):
+            name = f"{NAMESPACE}_{name}"
+            try:
+                values = collect()
+            except Exception as e:
+                print(f"⚠️ Metrics collector {name} failed: {e}")
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in sorted(values.items()):
+                lines.append(f"{name}{_labels(list(zip(labelnames, key)))} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def classify_error(error):
+    """Short error class label, including the HTTP status code when the error has one"""
+    code = getattr(error, 'code', None) or getattr(error, 'status_code', None)
+    return f"{type(error).__name__}:{code}" if isinstance(code, int) else type(error).__name__
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+metrics = Metrics()
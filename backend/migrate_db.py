@@ -40,6 +40,45 @@ try:
         conn.commit()
         print("Successfully added 'wear_count' column.")
 
+    # Add status column (background removal pipeline)
+    if 'status' in columns:
+        print("Column 'status' already exists.")
+    else:
+        print("Adding column 'status'...")
+        cursor.execute("ALTER TABLE clothing_items ADD COLUMN status VARCHAR(20) DEFAULT 'ready'")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_clothing_items_status ON clothing_items (status)")
+        conn.commit()
+        print("Successfully added 'status' column.")
+
+    # Composite indexes backing keyset-paginated listings
+    for index_sql in (
+        "CREATE INDEX IF NOT EXISTS ix_photos_user_uploaded ON photos (user_id, uploaded_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_clothing_items_user_uploaded ON clothing_items (user_id, uploaded_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_clothing_items_user_category_uploaded "
+        "ON clothing_items (user_id, category, uploaded_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_saved_looks_user_created ON saved_looks (user_id, created_at, id)",
+    ):
+        cursor.execute(index_sql)
+    conn.commit()
+    print("Listing indexes are in place.")
+
+    # Add denormalized entry_count to challenges and backfill it
+    cursor.execute("PRAGMA table_info(challenges)")
+    challenge_columns = [info[1] for info in cursor.fetchall()]
+    if not challenge_columns:
+        print("Table 'challenges' does not exist yet.")
+    elif 'entry_count' in challenge_columns:
+        print("Column 'entry_count' already exists in challenges table.")
+    else:
+        print("Adding column 'entry_count'...")
+        cursor.execute("ALTER TABLE challenges ADD COLUMN entry_count INTEGER NOT NULL DEFAULT 0")
+        cursor.execute(
+            "UPDATE challenges SET entry_count = "
+            "(SELECT COUNT(*) FROM challenge_entries WHERE challenge_entries.challenge_id = challenges.id)"
+        )
+        conn.commit()
+        print("Successfully added and backfilled 'entry_count' column.")
+
     # Check users table columns
     cursor.execute("PRAGMA table_info(users)")
     user_columns = [info[1] for info in cursor.fetchall()]
@@ -62,9 +101,50 @@ try:
         cursor.execute("ALTER TABLE users ADD COLUMN last_daily_login DATETIME DEFAULT '2024-01-01 00:00:00'")
         conn.commit()
         print("Successfully added 'last_daily_login' column.")
+
+    # Add progress stage to jobs
+    cursor.execute("PRAGMA table_info(jobs)")
+    job_columns = [info[1] for info in cursor.fetchall()]
+    if not job_columns:
+        print("Table 'jobs' does not exist yet.")
+    elif 'stage' in job_columns:
+        print("Column 'stage' already exists in jobs table.")
+    else:
+        print("Adding column 'stage'...")
+        cursor.execute("ALTER TABLE jobs ADD COLUMN stage VARCHAR(30)")
+        conn.commit()
+        print("Successfully added 'stage' column.")
+
+    # Add dedupe key to jobs so identical in-flight requests share one job
+    if 'dedupe_key' in job_columns:
+        print("Column 'dedupe_key' already exists in jobs table.")
+    elif job_columns:
+        print("Adding column 'dedupe_key'...")
+        cursor.execute("ALTER TABLE jobs ADD COLUMN dedupe_key VARCHAR(64)")
+        cursor.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_jobs_active_dedupe_key ON jobs (dedupe_key) "
+            "WHERE status IN ('queued', 'running')"
+        )
+        conn.commit()
+        print("Successfully added 'dedupe_key' column.")
+
+    # Add heartbeat to jobs so runs abandoned by a dead worker can be detected
+    if 'heartbeat_at' in job_columns:
+        print("Column 'heartbeat_at' already exists in jobs table.")
+    elif job_columns:
+        print("Adding column 'heartbeat_at'...")
+        cursor.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at DATETIME")
+        conn.commit()
+        print("Successfully added 'heartbeat_at' column.")
+
+    # Finished jobs no longer hold their dedupe key
+    if job_columns:
+        cursor.execute("UPDATE jobs SET dedupe_key = NULL WHERE status IN ('succeeded', 'failed')")
+        conn.commit()
         
     conn.close()
     print("\n✅ Database migration completed successfully!")
+    print("ℹ️  Run `flask media backfill` once to normalize stored media paths and move files into the media store.")
 
 except Exception as e:
     print(f"❌ Error: {e}")
@@ -0,0 +1,99 @@
+import os
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from metrics import metrics
+from imaging import decode_reduced
+
+
+class ModelInputCache:
+    """
+    Pre-normalized copies of photos and clothing images for model calls.
+
+    Each source image gets one compact RGB JPEG next to it
+    (`<name>.model.jpg`), downscaled to `max_side`. Try-on and style-me send
+    these bytes as-is, so no request re-decodes or re-encodes a full-size upload.
+    """
+
+    SUFFIX = '.model.jpg'
+
+    def __init__(self, max_side=1536, quality=90, max_workers=2):
+        """
+        Args:
+            max_side: Longest side of the prepared image in pixels
+            quality: JPEG quality of the prepared image
+            max_workers: Threads preparing inputs in the background
+        """
+        self.max_side = max_side
+        self.quality = quality
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='model-inputs')
+
+    def path_for(self, source_path):
+        return f"{source_path}{self.SUFFIX}"
+
+    def schedule(self, source_path):
+        """Prepare the model input for source_path in the background"""
+        self.executor.submit(self._prepare_logged, source_path)
+
+    def _prepare_logged(self, source_path):
+        try:
+            self.prepare(source_path)
+        except Exception:
+            traceback.print_exc()
+
+    def prepare(self, source_path):
+        """Return the prepared model input for source_path, creating it if missing"""
+        target = self.path_for(source_path)
+        if os.path.exists(target):
+            return target
+
+        with metrics.timed('model_input_prepare'), Image.open(source_path) as image:
+            # JPEG sources decode straight at a reduced scale
+            image = decode_reduced(image, self.max_side, 'RGB')
+            image.thumbnail((self.max_side, self.max_side), Image.Resampling.LANCZOS)
+
+            if image.mode in ('RGBA', 'LA', 'P'):
+                # Cut-out clothing: flatten transparency onto white, as the prompts expect
+                image = image.convert('RGBA')
+                flattened = Image.new('RGB', image.size, (255, 255, 255))
+                flattened.paste(image, mask=image.split()[-1])
+                image = flattened
+            elif image.mode != 'RGB':
+                image = image.convert('RGB')
+
+            tmp = f"{target}.{threading.get_ident()}.tmp"
+            image.save(tmp, 'JPEG', quality=self.quality, optimize=True)
+            os.replace(tmp, target)
+
+        return target
+
+    def lookup(self, source_path):
+        """
+        The prepared model input if it already exists, otherwise the original.
+
+        Never encodes on the caller's thread: a missing input is scheduled
+        for the background workers and later lookups pick it up.
+        """
+        target = self.path_for(source_path)
+        if os.path.exists(target):
+            return target
+        self.schedule(source_path)
+        return source_path
+
+    def resolve(self, source_path):
+        """Like prepare(), but fall back to the original if it can't be prepared"""
+        try:
+            return self.prepare(source_path)
+        except Exception as e:
+            print(f"⚠️ Using original as model input for {source_path}: {e}")
+            return source_path
+
+    def remove(self, source_path):
+        """Delete the prepared input for source_path"""
+        try:
+            os.remove(self.path_for(source_path))
+        except OSError:
+            pass
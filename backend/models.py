@@ -1,3 +1,4 @@
+import uuid
 from datetime import datetime, timezone
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
@@ -29,6 +30,8 @@ class User(db.Model):
     clothing_items = db.relationship('ClothingItem', backref='user', lazy=True, cascade='all, delete-orphan')
     saved_looks = db.relationship('SavedLook', backref='user', lazy=True, cascade='all, delete-orphan')
     challenge_entries = db.relationship('ChallengeEntry', backref='user', lazy=True, cascade='all, delete-orphan')
+    challenge_votes = db.relationship('ChallengeVote', lazy=True, cascade='all, delete-orphan')
+    jobs = db.relationship('Job', backref='user', lazy=True, cascade='all, delete-orphan')
     
     def set_password(self, password):
         """Hash and set the user's password"""
@@ -51,6 +54,13 @@ class User(db.Model):
 class Photo(db.Model):
     """User photos for virtual try-on"""
     __tablename__ = 'photos'
+    __table_args__ = (
+        # Backs keyset-paginated listing: WHERE user_id = ? ORDER BY uploaded_at DESC, id DESC
+        db.Index('ix_photos_user_uploaded', 'user_id', 'uploaded_at', 'id'),
+    )
+
+    # Keys of to_dict(), selectable via ?fields=
+    FIELDS = ('id', 'filename', 'filepath', 'is_selected', 'uploaded_at')
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
@@ -72,6 +82,13 @@ class Photo(db.Model):
 class ClothingItem(db.Model):
     """Clothing items in user's wardrobe"""
     __tablename__ = 'clothing_items'
+    __table_args__ = (
+        db.Index('ix_clothing_items_user_uploaded', 'user_id', 'uploaded_at', 'id'),
+        db.Index('ix_clothing_items_user_category_uploaded', 'user_id', 'category', 'uploaded_at', 'id'),
+    )
+
+    FIELDS = ('id', 'filename', 'filepath', 'category', 'price', 'wear_count',
+              'cost_per_wear', 'status', 'uploaded_at')
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
@@ -83,6 +100,7 @@ class ClothingItem(db.Model):
     price = db.Column(db.Float, default=0.0)
     wear_count = db.Column(db.Integer, default=0)
     is_generated = db.Column(db.Boolean, default=False)
+    status = db.Column(db.String(20), default='ready', index=True)  # processing, ready
 
     uploaded_at = db.Column(db.DateTime, default=utcnow)
     
@@ -102,12 +120,19 @@ class ClothingItem(db.Model):
             'price': self.price,
             'wear_count': self.wear_count,
             'cost_per_wear': round(cpw, 2),
+            'status': self.status,
             'uploaded_at': self.uploaded_at.isoformat()
         }
 
 class SavedLook(db.Model):
     """Saved virtual try-on results"""
     __tablename__ = 'saved_looks'
+    __table_args__ = (
+        db.Index('ix_saved_looks_user_created', 'user_id', 'created_at', 'id'),
+    )
+
+    FIELDS = ('id', 'photo_id', 'clothing_id', 'result_filename', 'result_filepath',
+              'ai_analysis', 'created_at')
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
@@ -118,17 +143,19 @@ class SavedLook(db.Model):
     ai_analysis = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=utcnow, index=True)
     
-    def to_dict(self):
-        """Convert saved look to dictionary"""
-        return {
+    def to_dict(self, fields=None):
+        """Convert saved look to dictionary; ai_analysis is only read when requested"""
+        data = {
             'id': self.id,
             'photo_id': self.photo_id,
             'clothing_id': self.clothing_id,
             'result_filename': self.result_filename,
             'result_filepath': f"uploads/results/{self.result_filename}",
-            'ai_analysis': self.ai_analysis,
             'created_at': self.created_at.isoformat()
         }
+        if fields is None or 'ai_analysis' in fields:
+            data['ai_analysis'] = self.ai_analysis
+        return data
 
 class Challenge(db.Model):
     """Daily Fashion Challenges"""
@@ -139,6 +166,8 @@ class Challenge(db.Model):
     description = db.Column(db.Text, nullable=True)
     start_date = db.Column(db.DateTime, default=utcnow)
     end_date = db.Column(db.DateTime, nullable=False, index=True)
+    # Denormalized count of entries, kept in step by enter_challenge
+    entry_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     entries = db.relationship('ChallengeEntry', backref='challenge', lazy=True, cascade='all, delete-orphan')
 
@@ -149,7 +178,7 @@ class Challenge(db.Model):
             'description': self.description,
             'start_date': self.start_date.isoformat(),
             'end_date': self.end_date.isoformat(),
-            'entry_count': len(self.entries)
+            'entry_count': self.entry_count
         }
 
 class ChallengeEntry(db.Model):
@@ -165,6 +194,7 @@ class ChallengeEntry(db.Model):
 
     # Relationships
     saved_look = db.relationship('SavedLook')
+    vote_records = db.relationship('ChallengeVote', lazy=True, cascade='all, delete-orphan')
 
     def to_dict(self):
         return {
@@ -177,3 +207,94 @@ class ChallengeEntry(db.Model):
             'created_at': self.created_at.isoformat()
         }
 
+class ChallengeVote(db.Model):
+    """One row per user per entry voted on"""
+    __tablename__ = 'challenge_votes'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'entry_id', name='uq_challenge_votes_user_entry'),
+        # Backs the "already voted in this challenge" exclusion when sampling entries
+        db.Index('ix_challenge_votes_user_challenge', 'user_id', 'challenge_id', 'entry_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    challenge_id = db.Column(db.Integer, db.ForeignKey('challenges.id'), nullable=False)
+    entry_id = db.Column(db.Integer, db.ForeignKey('challenge_entries.id'), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=utcnow)
+
+
+class Job(db.Model):
+    """Background generation jobs processed by the worker pool"""
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # At most one unfinished job per dedupe key, so identical requests
+        # racing in different workers attach to the same job. Finished jobs
+        # clear their key, so the index also holds where it can't be partial
+        db.Index('uq_jobs_active_dedupe_key', 'dedupe_key', unique=True,
+                 sqlite_where=db.text("status IN ('queued', 'running')"),
+                 postgresql_where=db.text("status IN ('queued', 'running')")),
+    )
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    kind = db.Column(db.String(50), nullable=False)  # tryon
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued, running, succeeded, failed
+    stage = db.Column(db.String(30), nullable=True, default='queued')  # progress.STAGES, while running
+    payload = db.Column(db.Text, nullable=True)  # JSON-encoded job arguments
+    dedupe_key = db.Column(db.String(64), nullable=True)  # sha256 of user, inputs, prompt and model config; NULL once finished
+    saved_look_id = db.Column(db.Integer, db.ForeignKey('saved_looks.id'), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)  # refreshed while a worker is running the job
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    # Relationships
+    saved_look = db.relationship('SavedLook')
+
+    @property
+    def is_finished(self):
+        return self.status in ('succeeded', 'failed')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'stage': self.stage,
+            'error': self.error,
+            'result': self.saved_look.to_dict() if self.saved_look else None,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class GenerationCache(db.Model):
+    """Index of cached generation results stored on disk"""
+    __tablename__ = 'generation_cache'
+
+    key = db.Column(db.String(64), primary_key=True)  # sha256 of inputs, prompt and model config
+    filename = db.Column(db.String(255), nullable=False)
+    size_bytes = db.Column(db.Integer, nullable=False, default=0)
+    analysis = db.Column(db.Text, nullable=True)
+    hit_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=utcnow)
+    last_used_at = db.Column(db.DateTime, default=utcnow, index=True)
+
+class MediaBlob(db.Model):
+    """Content-addressed media file, shared by every key with the same bytes"""
+    __tablename__ = 'media_blobs'
+
+    digest = db.Column(db.String(64), primary_key=True)  # sha256 of the file bytes
+    name = db.Column(db.String(255), nullable=False)  # storage object name, e.g. ab/cd/<digest>.png
+    size_bytes = db.Column(db.Integer, nullable=False, default=0)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=utcnow)
+
+class MediaObject(db.Model):
+    """A media key (e.g. photos/<uuid>.png) and the blob holding its bytes"""
+    __tablename__ = 'media_objects'
+
+    key = db.Column(db.String(255), primary_key=True)
+    digest = db.Column(db.String(64), db.ForeignKey('media_blobs.digest'), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=utcnow)
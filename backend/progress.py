@@ -0,0 +1,106 @@
+import json
+import time
+import queue
+import threading
+
+from flask import Response, stream_with_context
+
+# Stage names reported while a generation runs, in order
+STAGES = ('queued', 'preparing_inputs', 'model_call_started', 'image_received', 'post_processing', 'saved')
+
+
+def stream_format(request):
+    """
+    'sse' when the client asks for text/event-stream, 'ndjson' for ?stream=1,
+    otherwise None (a plain JSON response).
+    """
+    if request.accept_mimetypes.best == 'text/event-stream':
+        return 'sse'
+    if request.args.get('stream') in ('1', 'true', 'ndjson'):
+        return 'ndjson'
+    if request.args.get('stream') == 'sse':
+        return 'sse'
+    return None
+
+
+def format_event(fmt, event, data, event_id=None):
+    """Encode one event; a None event is a keep-alive"""
+    if fmt == 'sse':
+        if event is None:
+            return ": keep-alive\n\n"
+        lines = [f"id: {event_id}"] if event_id is not None else []
+        lines += [f"event: {event}", f"data: {json.dumps(data)}"]
+        return "\n".join(lines) + "\n\n"
+    if event is None:
+        return ""
+    return json.dumps({'event': event, **data}) + "\n"
+
+
+def event_stream_response(events, fmt):
+    """
+    Stream (event, data) pairs from a generator as SSE or NDJSON.
+
+    Each event carries `elapsed_ms` since the stream started, so stage
+    timings can be read straight off the stream. An exception raised by the
+    generator ends the stream with an `error` event.
+    """
+    started = time.monotonic()
+
+    def encode():
+        sequence = 0
+        try:
+            for event, data in events:
+                if event is not None:
+                    sequence += 1
+                    data = {**data, 'elapsed_ms': round((time.monotonic() - started) * 1000)}
+                chunk = format_event(fmt, event, data, sequence)
+                if chunk:
+                    yield chunk
+        except Exception as e:
+            print(f"❌ Event stream failed: {e}")
+            yield format_event(fmt, 'error', {'error': str(e)}, sequence + 1)
+
+    mimetype = 'text/event-stream' if fmt == 'sse' else 'application/x-ndjson'
+    response = Response(stream_with_context(encode()), mimetype=mimetype)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies (nginx) from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def run_with_progress(work, heartbeat=15):
+    """
+    Run work(emit) on a helper thread and yield its progress as it happens.
+
+    `work` reports stages with emit(event, **data) and returns the final
+    payload, which is yielded as a `done` event. (None, {}) keep-alives are
+    yielded every `heartbeat` seconds of silence. Exceptions from `work` are
+    re-raised in the consuming thread.
+    """
+    events = queue.Queue()
+    finished = object()
+
+    def emit(event, **data):
+        events.put((event, data))
+
+    def target():
+        try:
+            events.put(('done', work(emit) or {}))
+        except Exception as e:
+            events.put((finished, e))
+            return
+        events.put((finished, None))
+
+    threading.Thread(target=target, name='progress-worker', daemon=True).start()
+
+    while True:
+        try:
+            event, data = events.get(timeout=heartbeat)
+        except queue.Empty:
+            yield None, {}
+            continue
+        if event is finished:
+            if data is not None:
+                raise data
+            return
+        yield event, data
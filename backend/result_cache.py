@@ -0,0 +1,157 @@
+import os
+import shutil
+import hashlib
+import threading
+
+from sqlalchemy import func
+
+from models import db, GenerationCache, utcnow
+
+
+class ResultCache:
+    """
+    Content-addressed on-disk cache of generated images.
+
+    Entries are keyed by a hash of the input image bytes, the prompt and the
+    model configuration, indexed in the `generation_cache` table and evicted
+    least-recently-used once the cache grows past `max_bytes`.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._digests = {}  # (path, mtime_ns, size) -> sha256 of file bytes
+        self.hits = 0
+        self.misses = 0
+
+    def _file_digest(self, path):
+        """Hash a file's bytes, memoized on its path, mtime and size"""
+        stat = os.stat(path)
+        memo_key = (path, stat.st_mtime_ns, stat.st_size)
+        digest = self._digests.get(memo_key)
+        if digest is None:
+            hasher = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    hasher.update(chunk)
+            digest = hasher.hexdigest()
+            self._digests[memo_key] = digest
+        return digest
+
+    def make_key(self, input_paths, prompt, model_signature):
+        """
+        Build the cache key for a generation.
+
+        Args:
+            input_paths: Image paths in the order they are sent to the model
+            prompt: Prompt text
+            model_signature: String identifying model and generation config
+
+        Returns:
+            Hex sha256 key
+        """
+        hasher = hashlib.sha256()
+        for path in input_paths:
+            hasher.update(self._file_digest(path).encode())
+            hasher.update(b'\0')
+        hasher.update(prompt.encode('utf-8'))
+        hasher.update(b'\0')
+        hasher.update(model_signature.encode('utf-8'))
+        return hasher.hexdigest()
+
+    def _entry_path(self, entry):
+        return os.path.join(self.cache_dir, entry.filename)
+
+    def get(self, key):
+        """Return the GenerationCache entry for key, or None on a miss"""
+        entry = db.session.get(GenerationCache, key)
+        if entry and not os.path.exists(self._entry_path(entry)):
+            # Index row outlived its file; drop it
+            db.session.delete(entry)
+            db.session.commit()
+            entry = None
+
+        with self._lock:
+            if entry:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if entry:
+            entry.hit_count += 1
+            entry.last_used_at = utcnow()
+        return entry
+
+    def materialize(self, entry, dest_path):
+        """Place a cached image at dest_path, hard-linking when possible"""
+        src = self._entry_path(entry)
+        try:
+            os.link(src, dest_path)
+        except OSError:
+            shutil.copyfile(src, dest_path)
+
+    def put(self, key, source_path, analysis=None):
+        """Store a copy of source_path under key, evicting old entries if needed"""
+        if db.session.get(GenerationCache, key):
+            return
+
+        filename = f"{key}{os.path.splitext(source_path)[1]}"
+        dest = os.path.join(self.cache_dir, filename)
+        tmp = f"{dest}.{threading.get_ident()}.tmp"
+        try:
+            os.link(source_path, tmp)
+        except OSError:
+            shutil.copyfile(source_path, tmp)
+        os.replace(tmp, dest)
+
+        entry = GenerationCache(
+            key=key,
+            filename=filename,
+            size_bytes=os.path.getsize(dest),
+            analysis=analysis
+        )
+        try:
+            # Savepoint so a concurrent insert of the same key doesn't
+            # roll back the caller's pending work
+            with db.session.begin_nested():
+                db.session.add(entry)
+        except Exception:
+            return
+
+        self._evict()
+
+    def _evict(self):
+        total = db.session.query(func.coalesce(func.sum(GenerationCache.size_bytes), 0)).scalar()
+        if total <= self.max_bytes:
+            return
+
+        oldest = GenerationCache.query.order_by(GenerationCache.last_used_at.asc()).limit(100).all()
+        for entry in oldest:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._entry_path(entry))
+            except FileNotFoundError:
+                pass
+            total -= entry.size_bytes
+            db.session.delete(entry)
+        print(f"🧹 Result cache evicted down to {total} bytes")
+
+    def stats(self):
+        """Hit/miss counters for this process plus index totals"""
+        entries, total = db.session.query(
+            func.count(GenerationCache.key),
+            func.coalesce(func.sum(GenerationCache.size_bytes), 0)
+        ).one()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            'entries': entries,
+            'bytes': total,
+            'max_bytes': self.max_bytes
+        }
@@ -0,0 +1,275 @@
+import os
+import time
+import uuid
+import random
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from metrics import metrics
+from upstream import UpstreamError, parse_pairs
+
+# Operations run as background work; everything else is interactive
+OPERATION_CLASSES = {
+    'remove_background': 'background',
+    'generate_clothing': 'background',
+}
+DEFAULT_CLASS = 'interactive'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scheduler_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    tokens REAL NOT NULL,
+    refilled_at REAL NOT NULL,
+    virtual_time REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scheduler_classes (
+    klass TEXT PRIMARY KEY,
+    finish_time REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scheduler_tickets (
+    id TEXT PRIMARY KEY,
+    user_key TEXT NOT NULL,
+    klass TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    enqueued_at REAL NOT NULL,
+    started_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_scheduler_tickets_started ON scheduler_tickets (started_at, enqueued_at);
+"""
+
+
+class SchedulerTimeout(UpstreamError):
+    """A model call waited longer than allowed for a slot"""
+
+
+def operation_class(operation):
+    return OPERATION_CLASSES.get(operation, DEFAULT_CLASS)
+
+
+class ModelCallScheduler:
+    """
+    Admission control for model API calls, shared by every worker process.
+
+    A call takes a ticket and waits until it is granted a slot. A grant
+    needs a token from the global bucket (refilled at the provider quota
+    rate), a free global slot, and the caller's user being under its
+    concurrency cap for the call's class, so a user's background work never
+    holds back their interactive calls. Among eligible waiters, classes (interactive,
+    background) are served by start-time fair queuing in proportion to
+    their weights, and within a class the user with the fewest running
+    calls goes first, then the oldest ticket.
+
+    State lives in a small SQLite file next to the app database; each
+    decision runs in a BEGIN IMMEDIATE transaction, so Gunicorn workers on
+    one host coordinate without an external service. Tickets of processes
+    that died are reaped.
+    """
+
+    def __init__(self, path, rate=1.0, burst=10, max_concurrent=8, per_user_limit=2,
+                 weights=None, max_wait=120, poll_interval=0.1, lease_ttl=900):
+        """
+        Args:
+            path: SQLite file holding the shared state
+            rate: Tokens (model calls) added per second (0 = no rate limit)
+            burst: Bucket capacity
+            max_concurrent: Calls in flight at once across all processes
+            per_user_limit: Calls in flight at once per user, in each class
+            weights: {class: weight} share of grants when classes compete
+            max_wait: Seconds a call may wait for a slot before failing
+            poll_interval: Seconds between admission checks while waiting
+            lease_ttl: Seconds after which a running ticket is presumed lost
+        """
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.per_user_limit = per_user_limit
+        self.weights = {'interactive': 3.0, 'background': 1.0, **(weights or {})}
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.lease_ttl = lease_ttl
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Bootstrap on a throwaway connection: one opened here would be
+        # inherited by workers forked from a preloading parent
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            conn.execute(
+                "INSERT OR IGNORE INTO scheduler_state (id, tokens, refilled_at, virtual_time) VALUES (1, ?, ?, 0)",
+                (float(burst), time.time())
+            )
+        finally:
+            conn.close()
+
+        metrics.histogram('model_call_wait_seconds', 'Time model calls waited for a scheduler slot', ('class',))
+        metrics.counter('model_call_wait_timeouts_total', 'Model calls that gave up waiting for a slot', ('class',))
+        metrics.collector('model_call_slots', 'gauge', 'Model calls waiting for or holding a slot (all processes)',
+                          ('class', 'state'), self.depths)
+
+    def _connection(self):
+        # Keyed by pid as well, so a forked child never reuses its parent's connection
+        conn, pid = getattr(self._local, 'conn', (None, None))
+        if conn is None or pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = (conn, os.getpid())
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @contextmanager
+    def slot(self, user_id, operation, max_wait=None):
+        """Hold a slot for one model call made on behalf of user_id"""
+        klass = operation_class(operation)
+        ticket = self.acquire(user_id, klass, max_wait)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    def acquire(self, user_id, klass=DEFAULT_CLASS, max_wait=None):
+        """Wait for a slot (at most max_wait seconds, capped by the scheduler's); returns the ticket to release()"""
+        max_wait = self.max_wait if max_wait is None else min(max_wait, self.max_wait)
+        ticket = uuid.uuid4().hex
+        user_key = str(user_id) if user_id is not None else 'system'
+        enqueued = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO scheduler_tickets (id, user_key, klass, pid, enqueued_at) VALUES (?, ?, ?, ?, ?)",
+                (ticket, user_key, klass, os.getpid(), enqueued)
+            )
+
+        try:
+            while True:
+                with self._transaction() as conn:
+                    wait = self._try_grant(conn, ticket)
+                if wait is None:
+                    metrics.observe('model_call_wait_seconds', time.time() - enqueued, **{'class': klass})
+                    return ticket
+                if time.time() - enqueued > max_wait:
+                    metrics.inc('model_call_wait_timeouts_total', **{'class': klass})
+                    raise SchedulerTimeout(f"No model call slot free after {max_wait:g}s; try again shortly")
+                # Jitter keeps waiters in different processes from polling in lockstep
+                time.sleep(min(max(wait, self.poll_interval), 1.0) * random.uniform(0.8, 1.2))
+        except BaseException:
+            self.release(ticket)
+            raise
+
+    def release(self, ticket):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM scheduler_tickets WHERE id = ?", (ticket,))
+
+    def _try_grant(self, conn, ticket):
+        """
+        Grant `ticket` if it is next in line and capacity allows.
+
+        Returns None once granted, otherwise a suggested number of seconds
+        to wait before checking again.
+        """
+        now = time.time()
+        self._reap(conn, now)
+
+        # (user_key, klass) -> calls in flight
+        running = {(user_key, klass): count for user_key, klass, count in conn.execute(
+            "SELECT user_key, klass, COUNT(*) FROM scheduler_tickets WHERE started_at IS NOT NULL "
+            "GROUP BY user_key, klass"
+        ).fetchall()}
+        if sum(running.values()) >= self.max_concurrent:
+            return self.poll_interval
+
+        waiting = conn.execute(
+            "SELECT id, user_key, klass, enqueued_at FROM scheduler_tickets "
+            "WHERE started_at IS NULL ORDER BY enqueued_at"
+        ).fetchall()
+        eligible = [row for row in waiting if running.get((row[1], row[2]), 0) < self.per_user_limit]
+        if not any(row[0] == ticket for row in eligible):
+            return self.poll_interval
+
+        tokens, refilled_at, virtual_time = conn.execute(
+            "SELECT tokens, refilled_at, virtual_time FROM scheduler_state WHERE id = 1"
+        ).fetchone()
+        finish = dict(conn.execute("SELECT klass, finish_time FROM scheduler_classes").fetchall())
+
+        # A class's next start tag; an idle class doesn't bank credit
+        def start_tag(klass):
+            return max(finish.get(klass, 0.0), virtual_time)
+
+        klass = min({row[2] for row in eligible}, key=lambda c: (start_tag(c), c))
+        candidates = [row for row in eligible if row[2] == klass]
+        chosen = min(candidates, key=lambda row: (running.get((row[1], klass), 0), row[3]))
+        if chosen[0] != ticket:
+            return self.poll_interval
+
+        if self.rate > 0:
+            tokens = min(float(self.burst), tokens + (now - refilled_at) * self.rate)
+        else:
+            tokens = float(self.burst)  # no rate limit
+        if tokens < 1:
+            conn.execute("UPDATE scheduler_state SET tokens = ?, refilled_at = ? WHERE id = 1", (tokens, now))
+            return (1 - tokens) / self.rate
+
+        start = start_tag(klass)
+        conn.execute(
+            "UPDATE scheduler_state SET tokens = ?, refilled_at = ?, virtual_time = ? WHERE id = 1",
+            (tokens - 1, now, start)
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO scheduler_classes (klass, finish_time) VALUES (?, ?)",
+            (klass, start + 1.0 / self.weights.get(klass, 1.0))
+        )
+        conn.execute("UPDATE scheduler_tickets SET started_at = ? WHERE id = ?", (now, ticket))
+        return None
+
+    def _reap(self, conn, now):
+        """Drop tickets of dead processes and running tickets past their lease"""
+        for (pid,) in conn.execute("SELECT DISTINCT pid FROM scheduler_tickets").fetchall():
+            if not _process_alive(pid):
+                conn.execute("DELETE FROM scheduler_tickets WHERE pid = ?", (pid,))
+        conn.execute("DELETE FROM scheduler_tickets WHERE started_at < ?", (now - self.lease_ttl,))
+
+    def depths(self):
+        """{(class, 'waiting'|'running'): count} across all processes"""
+        rows = self._connection().execute(
+            "SELECT klass, started_at IS NOT NULL, COUNT(*) FROM scheduler_tickets GROUP BY 1, 2"
+        ).fetchall()
+        counts = {(klass, state): 0 for klass in self.weights for state in ('waiting', 'running')}
+        for klass, started, count in rows:
+            counts[(klass, 'running' if started else 'waiting')] = count
+        return counts
+
+
+def _process_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def create_scheduler(config):
+    """Build the ModelCallScheduler from app config"""
+    return ModelCallScheduler(
+        config['SCHEDULER_DB_PATH'],
+        rate=config['SCHEDULER_RATE_PER_MINUTE'] / 60.0,
+        burst=config['SCHEDULER_BURST'],
+        max_concurrent=config['SCHEDULER_MAX_CONCURRENT'],
+        per_user_limit=config['SCHEDULER_PER_USER_LIMIT'],
+        weights=parse_pairs(config['SCHEDULER_WEIGHTS']),
+        max_wait=config['SCHEDULER_MAX_WAIT']
+    )
@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process coalescing
+    fcntl = None
+
+from metrics import metrics
+
+
+class SingleFlightError(Exception):
+    """The in-flight computation this caller attached to failed"""
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight computations across threads and worker processes.
+
+    The first caller for a key holds an exclusive flock on `<key>.lock` while
+    it computes and then writes the outcome to `<key>.json`. A caller that
+    finds the lock held waits for it and returns the outcome the leader
+    wrote, as long as that outcome finished after the caller arrived; a
+    leader's failure is re-raised to its followers as SingleFlightError.
+    Results must be JSON-serializable. Outcomes are only shared with calls
+    that overlapped the computation, so this is not a cache.
+
+    Old lock files are only swept while nobody holds them; a caller that
+    locked a file the sweep unlinked underneath it retries on the new one.
+    """
+
+    SWEEP_INTERVAL = 60  # seconds between clean-ups of old lock and outcome files
+
+    def __init__(self, directory, kind, retention=300):
+        """
+        Args:
+            directory: Directory for lock and outcome files (local to the host)
+            kind: Label for metrics, e.g. 'clothing_generate'
+            retention: Seconds outcome files are kept before being swept
+        """
+        self.directory = os.path.join(directory, kind)
+        self.kind = kind
+        self.retention = retention
+        self._last_sweep = 0.0
+        self._sweep_lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+        metrics.counter('coalesced_requests_total', 'Requests attached to an identical in-flight request',
+                        ('kind',))
+
+    def do(self, key, compute):
+        """
+        Run compute() once per set of overlapping calls for `key`.
+
+        Returns (result, shared), shared being True when the result came from
+        another caller's computation.
+        """
+        if fcntl is None:
+            return compute(), False
+
+        arrived = time.time()
+        outcome_path = os.path.join(self.directory, f"{key}.json")
+        lock_path = os.path.join(self.directory, f"{key}.lock")
+        lock_file, waited = self._lock(lock_path)
+        with lock_file:
+            if waited:
+                outcome = self._read(outcome_path)
+                if outcome and outcome['finished_at'] >= arrived:
+                    metrics.inc('coalesced_requests_total', kind=self.kind)
+                    if 'error' in outcome:
+                        raise SingleFlightError(outcome['error'])
+                    return outcome['result'], True
+
+            try:
+                result = compute()
+            except Exception as e:
+                self._write(outcome_path, {'error': str(e), 'finished_at': time.time()})
+                raise
+            self._write(outcome_path, {'result': result, 'finished_at': time.time()})
+
+        self._maybe_sweep()
+        return result, False
+
+    @staticmethod
+    def _lock(lock_path):
+        """Open and exclusively lock lock_path; returns (file, waited for another holder)"""
+        waited = False
+        while True:
+            lock_file = open(lock_path, 'a')
+            # Fresh mtime keeps the sweep away from locks in use
+            os.utime(lock_file.fileno())
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Identical request in flight: wait for it to finish
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                waited = True
+            try:
+                current = os.stat(lock_path).st_ino == os.fstat(lock_file.fileno()).st_ino
+            except FileNotFoundError:
+                current = False
+            if current:
+                return lock_file, waited
+            # Swept between our open() and flock(): lock the file now at lock_path
+            lock_file.close()
+
+    @staticmethod
+    def _remove_unheld(lock_path):
+        """Delete a lock file unless some caller holds it"""
+        try:
+            lock_file = open(lock_path, 'r')
+        except FileNotFoundError:
+            return
+        with lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            os.remove(lock_path)
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    @staticmethod
+    def _write(path, outcome):
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(outcome, f)
+        os.replace(tmp, path)
+
+    def _maybe_sweep(self):
+        now = time.time()
+        if now - self._last_sweep < self.SWEEP_INTERVAL or not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_sweep = now
+            cutoff = now - self.retention
+            for entry in os.scandir(self.directory):
+                try:
+                    if entry.stat().st_mtime >= cutoff:
+                        continue
+                    if entry.name.endswith('.lock'):
+                        self._remove_unheld(entry.path)
+                    else:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+        finally:
+            self._sweep_lock.release()
@@ -0,0 +1,44 @@
+import os
+import sys
+import tempfile
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Config reads the environment when first imported, so point it at a
+# throwaway database and storage directories before any test module loads
+TMP_DIR = tempfile.mkdtemp(prefix='tryon-tests-')
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(TMP_DIR, 'app.db')}",
+    'UPLOAD_FOLDER': os.path.join(TMP_DIR, 'uploads'),
+    'RESULT_CACHE_DIR': os.path.join(TMP_DIR, 'cache'),
+    'MEDIA_STORAGE_DIR': os.path.join(TMP_DIR, 'media'),
+    'MEDIA_CACHE_DIR': os.path.join(TMP_DIR, 'media_cache'),
+    'SCHEDULER_DB_PATH': os.path.join(TMP_DIR, 'scheduler.db'),
+    'INFLIGHT_DIR': os.path.join(TMP_DIR, 'inflight'),
+    'GOOGLE_API_KEY': 'test',
+    'REMBG_WARMUP': 'false',
+})
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import create_app
+    return create_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth_headers(client):
+    """Register a user and return its bearer token header"""
+    response = client.post('/api/auth/register', json={
+        'email': 'voter@example.com', 'password': 'secret', 'full_name': 'Voter'
+    })
+    if response.status_code != 201:
+        response = client.post('/api/auth/login', json={'email': 'voter@example.com', 'password': 'secret'})
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
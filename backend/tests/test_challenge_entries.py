@@ -0,0 +1,58 @@
+from datetime import timedelta
+
+from sqlalchemy import event
+
+import app as app_module
+from models import db, utcnow, User, SavedLook, Challenge, ChallengeEntry
+
+
+def seed_challenge(entry_count):
+    """A challenge with `entry_count` entries, each by a different user"""
+    challenge = Challenge(theme=f'{entry_count} entries', end_date=utcnow() + timedelta(days=1),
+                          entry_count=entry_count)
+    db.session.add(challenge)
+    for index in range(entry_count):
+        author = User(full_name=f'Author {index}', email=f'author-{entry_count}-{index}@example.com',
+                      password_hash='x')
+        look = SavedLook(user=author, result_filename=f'look-{index}.png', result_filepath=f'results/look-{index}.png')
+        db.session.add(ChallengeEntry(challenge=challenge, user=author, saved_look=look))
+    db.session.commit()
+    return challenge.id
+
+
+def count_queries(app, client, headers, challenge_id):
+    """Statements executed while serving the challenge's entries"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(f'/api/challenges/{challenge_id}/entries', headers=headers)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200
+    return len(statements), response.get_json()['entries']
+
+
+def test_entries_query_count_does_not_grow_with_entries(app, client, auth_headers, monkeypatch):
+    # Offer every entry so the number loaded is N, not the sampler's limit
+    def all_entry_ids(challenge_id, user_id, limit=10, exclude=()):
+        return [entry_id for (entry_id,) in
+                db.session.query(ChallengeEntry.id).filter_by(challenge_id=challenge_id).all()]
+    monkeypatch.setattr(app_module, 'sample_entry_ids', all_entry_ids)
+
+    with app.app_context():
+        small = seed_challenge(3)
+        large = seed_challenge(30)
+
+    small_count, small_entries = count_queries(app, client, auth_headers, small)
+    large_count, large_entries = count_queries(app, client, auth_headers, large)
+
+    assert len(small_entries) == 3
+    assert len(large_entries) == 30
+    assert all(entry['user_name'] and entry['saved_look_url'] for entry in large_entries)
+    assert large_count == small_count
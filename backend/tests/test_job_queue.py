@@ -0,0 +1,117 @@
+import os
+import uuid
+from datetime import timedelta
+
+import pytest
+from PIL import Image
+
+from job_queue import JobQueue
+from models import db, utcnow, User, Photo, ClothingItem, Job
+
+
+@pytest.fixture
+def queue(app):
+    """A queue whose heartbeat never fires during a test; jobs are processed inline"""
+    queue = JobQueue(app, max_workers=1, lease_timeout=60, heartbeat_interval=3600)
+    queue.refunds = []
+    queue.runs = []
+    queue.register('ok', lambda job: queue.runs.append(job.id), on_failure=lambda job: queue.refunds.append(job.id))
+
+    def explode(job):
+        queue.runs.append(job.id)
+        raise RuntimeError('model unavailable')
+    queue.register('boom', explode, on_failure=lambda job: queue.refunds.append(job.id))
+    return queue
+
+
+@pytest.fixture
+def user_id(app):
+    with app.app_context():
+        user = User(full_name='Queue', email=f'queue-{uuid.uuid4().hex}@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def add_job(user_id, kind, **fields):
+    job = Job(user_id=user_id, kind=kind, dedupe_key=uuid.uuid4().hex, **fields)
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+
+def test_job_is_claimed_once(app, queue, user_id):
+    with app.app_context():
+        job_id = add_job(user_id, 'ok')
+        queue._process(job_id)
+        queue._process(job_id)
+
+        job = db.session.get(Job, job_id)
+        assert queue.runs == [job_id]
+        assert job.status == 'succeeded'
+        assert job.dedupe_key is None
+        assert queue.refunds == []
+
+
+def test_failed_job_is_refunded_and_frees_its_dedupe_key(app, queue, user_id):
+    with app.app_context():
+        job_id = add_job(user_id, 'boom')
+        queue._process(job_id)
+
+        job = db.session.get(Job, job_id)
+        assert job.status == 'failed'
+        assert job.error == 'model unavailable'
+        assert job.dedupe_key is None
+        assert queue.refunds == [job_id]
+
+
+def test_sweep_fails_only_jobs_whose_lease_expired(app, queue, user_id):
+    stale = utcnow() - timedelta(seconds=120)
+    with app.app_context():
+        abandoned = add_job(user_id, 'ok', status='running', started_at=stale, heartbeat_at=stale)
+        alive = add_job(user_id, 'ok', status='running', started_at=stale, heartbeat_at=utcnow())
+        # Running in this process; its heartbeat just hasn't been written yet
+        local = add_job(user_id, 'ok', status='running', started_at=stale, heartbeat_at=stale)
+        queue._running.add(local)
+
+        queue._fail_abandoned()
+        queue._fail_abandoned()
+
+        assert db.session.get(Job, abandoned).status == 'failed'
+        assert db.session.get(Job, abandoned).dedupe_key is None
+        assert db.session.get(Job, alive).status == 'running'
+        assert db.session.get(Job, local).status == 'running'
+        assert queue.refunds == [abandoned]
+
+
+def test_identical_tryon_requests_share_one_job_and_one_credit(app, client, monkeypatch):
+    # Keep the job queued so the second request finds it active
+    monkeypatch.setattr(JobQueue, 'submit', lambda self, job_id: None)
+
+    response = client.post('/api/auth/register', json={
+        'email': f'tryon-{uuid.uuid4().hex}@example.com', 'password': 'secret', 'full_name': 'Try On'
+    })
+    headers = {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+    user_id = response.get_json()['user']['id']
+
+    with app.app_context():
+        for subfolder in ('photos', 'clothing'):
+            os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], subfolder), exist_ok=True)
+            color = (user_id % 256, 0 if subfolder == 'photos' else 255, 0)
+            Image.new('RGB', (8, 8), color).save(os.path.join(app.config['UPLOAD_FOLDER'], subfolder, f'{user_id}.png'))
+        photo = Photo(user_id=user_id, filename=f'{user_id}.png', filepath=f'photos/{user_id}.png')
+        clothing = ClothingItem(user_id=user_id, filename=f'{user_id}.png', filepath=f'clothing/{user_id}.png',
+                                category='tops')
+        db.session.add_all([photo, clothing])
+        db.session.commit()
+        body = {'photo_id': photo.id, 'clothing_id': clothing.id}
+        credits = db.session.get(User, user_id).credits
+
+    first = client.post('/api/tryon', headers=headers, json=body)
+    second = client.post('/api/tryon', headers=headers, json=body)
+
+    assert first.status_code == 202
+    assert second.status_code == 202
+    assert second.get_json()['coalesced'] is True
+    assert second.get_json()['job']['id'] == first.get_json()['job']['id']
+    assert second.get_json()['credits_remaining'] == credits - 1
@@ -0,0 +1,73 @@
+import os
+import uuid
+
+import pytest
+
+from media_index import MediaIndex
+from media_store import LocalStorageBackend, MediaStore
+from models import db, MediaBlob
+
+
+@pytest.fixture
+def store(app, tmp_path):
+    return MediaStore(LocalStorageBackend(str(tmp_path / 'media')), MediaIndex(str(tmp_path / 'uploads')))
+
+
+def ingest(store, content, subfolder='photos'):
+    """Store `content` under a new key; returns (key, local path)"""
+    key = f"{subfolder}/{uuid.uuid4().hex}.png"
+    staged = store.staging_path(f"{uuid.uuid4().hex}.png")
+    with open(staged, 'wb') as f:
+        f.write(content)
+    path = store.ingest(key, staged)
+    db.session.commit()
+    return key, path
+
+
+def blob_for(path):
+    return db.session.get(MediaBlob, MediaStore._digest(path))
+
+
+def release(store, key):
+    token = store.release(key, key.split('/')[0])
+    db.session.commit()
+    return token
+
+
+def test_identical_bytes_share_one_counted_blob(app, store):
+    content = uuid.uuid4().bytes
+    with app.app_context():
+        first_key, first_path = ingest(store, content)
+        second_key, second_path = ingest(store, content, subfolder='results')
+
+        assert first_path == second_path
+        assert blob_for(first_path).ref_count == 2
+        assert store.resolve_key(first_key) == store.resolve_key(second_key) == first_path
+
+        # Another key still points at the bytes: nothing to purge
+        assert release(store, first_key) is None
+        assert blob_for(first_path).ref_count == 1
+        assert os.path.exists(first_path)
+
+        digest = MediaStore._digest(first_path)
+        token = release(store, second_key)
+        assert store.purge(token) == first_path
+        assert not os.path.exists(first_path)
+        assert db.session.get(MediaBlob, digest) is None
+
+
+def test_purge_keeps_bytes_uploaded_again_after_release(app, store):
+    content = uuid.uuid4().bytes
+    with app.app_context():
+        key, path = ingest(store, content)
+        digest = MediaStore._digest(path)
+        token = release(store, key)
+
+        # The same bytes arrive again before the purge runs
+        new_key, new_path = ingest(store, content)
+
+        assert store.purge(token) is None
+        assert new_path == path
+        assert os.path.exists(path)
+        assert db.session.get(MediaBlob, digest).ref_count == 1
+        assert store.resolve_key(new_key) == path
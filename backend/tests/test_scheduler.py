@@ -0,0 +1,40 @@
+import pytest
+
+from scheduler import ModelCallScheduler, SchedulerTimeout
+
+
+@pytest.fixture
+def scheduler(tmp_path):
+    return ModelCallScheduler(str(tmp_path / 'scheduler.db'), rate=0, max_concurrent=8, per_user_limit=1,
+                              max_wait=0.3, poll_interval=0.01)
+
+
+def test_per_user_cap_applies_to_each_class_separately(scheduler):
+    interactive = scheduler.acquire(1, 'interactive')
+
+    # The user's interactive slot is taken...
+    with pytest.raises(SchedulerTimeout):
+        scheduler.acquire(1, 'interactive', max_wait=0.1)
+
+    # ...but their background work and other users are not held back by it
+    background = scheduler.acquire(1, 'background')
+    other_user = scheduler.acquire(2, 'interactive')
+
+    assert scheduler.depths()[('interactive', 'running')] == 2
+    assert scheduler.depths()[('background', 'running')] == 1
+    assert scheduler.depths()[('interactive', 'waiting')] == 0
+
+    scheduler.release(interactive)
+    scheduler.release(scheduler.acquire(1, 'interactive', max_wait=0.1))
+    for ticket in (background, other_user):
+        scheduler.release(ticket)
+
+
+def test_global_cap_holds_back_every_class(tmp_path):
+    scheduler = ModelCallScheduler(str(tmp_path / 'scheduler.db'), rate=0, max_concurrent=1, per_user_limit=1,
+                                   max_wait=0.3, poll_interval=0.01)
+    ticket = scheduler.acquire(1, 'interactive')
+    with pytest.raises(SchedulerTimeout):
+        scheduler.acquire(2, 'background', max_wait=0.1)
+    scheduler.release(ticket)
+    scheduler.release(scheduler.acquire(2, 'background', max_wait=0.1))
@@ -0,0 +1,293 @@
+import time
+import random
+import threading
+from collections import deque
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import httpx
+
+from metrics import metrics
+
+# HTTP statuses worth retrying: timeouts, rate limiting and transient server errors
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """Base class for failures raised by the upstream-call layer itself"""
+
+
+class CircuitOpenError(UpstreamError):
+    """The model API is failing; calls are refused until the cooldown passes"""
+
+
+class DeadlineExceeded(UpstreamError, TimeoutError):
+    """An operation ran past its deadline"""
+
+
+def is_retryable(error):
+    """True for errors a later attempt may not hit (rate limits, 5xx, network trouble)"""
+    if isinstance(error, UpstreamError):
+        return False
+    code = getattr(error, 'code', None) or getattr(error, 'status_code', None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS
+    return isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError))
+
+
+class CircuitBreaker:
+    """
+    Rolling-window circuit breaker.
+
+    Opens when at least `min_calls` attempts in the last `window` seconds
+    failed at a rate of `failure_rate` or more. While open, allow() is False
+    until `cooldown` seconds pass; then one probe call is let through
+    (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_rate=0.5, min_calls=10, window=60, cooldown=30, clock=time.monotonic):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = self.CLOSED
+        self._lock = threading.Lock()
+        self._outcomes = deque()  # (timestamp, failed)
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if self.clock() - self._opened_at < self.cooldown:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def discard(self):
+        """An allowed call ended without reaching the API; lets another probe through"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+
+    def record(self, failed):
+        with self._lock:
+            now = self.clock()
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+                if failed:
+                    self._open(now)
+                else:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                return
+            if self.state == self.OPEN:
+                # Late result of an attempt started before the circuit opened
+                return
+
+            self._outcomes.append((now, failed))
+            while self._outcomes and self._outcomes[0][0] < now - self.window:
+                self._outcomes.popleft()
+            failures = sum(1 for _, f in self._outcomes if f)
+            if len(self._outcomes) >= self.min_calls and failures >= self.failure_rate * len(self._outcomes):
+                self._open(now)
+
+    def _open(self, now):
+        if self.state != self.OPEN:
+            print(f"⚡ Model API circuit opened; failing fast for {self.cooldown}s")
+        self.state = self.OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+
+
+class ResilientCaller:
+    """
+    Runs model API calls with per-operation deadlines, jittered exponential
+    retry, optional hedging and a shared circuit breaker.
+
+    call(operation, attempt) invokes attempt(timeout) — timeout being the
+    seconds left before the operation's deadline — on a worker thread, so a
+    hung request can't hold the caller past the deadline. Retryable errors
+    are retried with full-jitter backoff while attempts and time remain.
+    For operations listed in `hedge_operations`, a second attempt starts if
+    the first hasn't answered after `hedge_after` seconds, and whichever
+    succeeds first wins. Every attempt, retries and hedges included, is
+    separately admitted by `admit` and holds what it got until it returns.
+    """
+
+    def __init__(self, deadlines=None, default_deadline=60, max_attempts=3, base_delay=0.5,
+                 max_delay=8, hedge_after=0, hedge_operations=(), breaker=None, max_workers=16,
+                 sleep=time.sleep):
+        """
+        Args:
+            deadlines: {operation: seconds} overrides of default_deadline
+            default_deadline: Seconds an operation may take, including retries
+            max_attempts: Attempts per operation (1 = no retry)
+            base_delay: Backoff before the first retry, doubled per retry
+            max_delay: Cap on a single backoff
+            hedge_after: Seconds before a hedged second attempt starts (0 = never)
+            hedge_operations: Operations that may be hedged
+            breaker: Shared CircuitBreaker (default: a new one)
+            max_workers: Threads available to in-flight attempts
+            sleep: Backoff sleep function (replaceable in tests)
+        """
+        self.deadlines = dict(deadlines or {})
+        self.default_deadline = default_deadline
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_after = hedge_after
+        self.hedge_operations = set(hedge_operations)
+        self.breaker = breaker or CircuitBreaker()
+        self.sleep = sleep
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='upstream')
+
+        metrics.counter('upstream_retries_total', 'Model API calls retried after a retryable error',
+                        ('operation', 'error_class'))
+        metrics.counter('upstream_hedges_total', 'Hedged second attempts started, by winner',
+                        ('operation', 'winner'))
+        metrics.counter('upstream_rejected_total', 'Model API calls refused by the open circuit',
+                        ('operation',))
+        metrics.collector(
+            'upstream_circuit_open', 'gauge', '1 while the model API circuit breaker is open or probing', (),
+            lambda: {(): 0 if self.breaker.state == CircuitBreaker.CLOSED else 1}
+        )
+
+    def deadline_for(self, operation):
+        return self.deadlines.get(operation, self.default_deadline)
+
+    def call(self, operation, attempt, admit=None):
+        """
+        Args:
+            operation: Operation name (deadlines, hedging, metrics)
+            attempt: callable(timeout) making one request
+            admit: Optional callable(timeout) returning a context manager each
+                attempt holds while it runs (e.g. a scheduler slot)
+        """
+        deadline = time.monotonic() + self.deadline_for(operation)
+        for number in range(1, self.max_attempts + 1):
+            if deadline <= time.monotonic():
+                raise DeadlineExceeded(f"{operation} exceeded its {self.deadline_for(operation)}s deadline")
+            if not self.breaker.allow():
+                metrics.inc('upstream_rejected_total', operation=operation)
+                raise CircuitOpenError(f"Model API temporarily unavailable ({operation} refused by open circuit)")
+
+            try:
+                return self._run(operation, attempt, deadline, admit)
+            except Exception as e:
+                if not is_retryable(e) or number == self.max_attempts:
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (number - 1)))
+                if time.monotonic() + delay >= deadline:
+                    raise
+                print(f"🔁 {operation} failed ({e}); retry {number}/{self.max_attempts - 1} in {delay:.2f}s")
+                metrics.inc('upstream_retries_total', operation=operation, error_class=type(e).__name__)
+                self.sleep(delay)
+
+    def _attempt(self, attempt, deadline, admit, settled):
+        """One attempt; feeds its outcome to the breaker"""
+        with ExitStack() as stack:
+            if admit:
+                # Held until this thread returns, even after the caller gave up at the deadline
+                try:
+                    stack.enter_context(admit(max(deadline - time.monotonic(), 0.001)))
+                except Exception:
+                    self.breaker.discard()
+                    raise
+                if settled.is_set():
+                    # Admitted only after another attempt won or the deadline passed
+                    self.breaker.discard()
+                    raise UpstreamError("Attempt no longer needed")
+            try:
+                result = attempt(max(deadline - time.monotonic(), 0.001))
+            except Exception as e:
+                # Client errors (bad request, blocked prompt) say nothing about upstream health
+                self.breaker.record(failed=is_retryable(e))
+                raise
+            self.breaker.record(failed=False)
+            return result
+
+    def _run(self, operation, attempt, deadline, admit):
+        settled = threading.Event()
+        try:
+            return self._race(operation, attempt, deadline, admit, settled)
+        finally:
+            settled.set()
+
+    def _race(self, operation, attempt, deadline, admit, settled):
+        first = self._executor.submit(self._attempt, attempt, deadline, admit, settled)
+        pending = [first]
+        hedge_after = self.hedge_after if operation in self.hedge_operations else 0
+        if hedge_after and time.monotonic() + hedge_after < deadline:
+            done, _ = wait(pending, timeout=hedge_after)
+            if not done and self.breaker.allow():
+                print(f"🪁 {operation} slow after {hedge_after}s; starting hedged attempt")
+                pending.append(self._executor.submit(self._attempt, attempt, deadline, admit, settled))
+        hedged = len(pending) > 1
+
+        error = None
+        while pending:
+            done, _ = wait(pending, timeout=max(deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            if not done:
+                for future in pending:
+                    future.cancel()
+                raise DeadlineExceeded(f"{operation} exceeded its {self.deadline_for(operation)}s deadline")
+            for future in done:
+                pending.remove(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if hedged:
+                    metrics.inc('upstream_hedges_total', operation=operation,
+                                winner='first' if future is first else 'hedge')
+                for other in pending:
+                    other.cancel()
+                return result
+        raise error
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def parse_pairs(value):
+    """'tryon=90,recommend_outfits=45' -> {'tryon': 90.0, 'recommend_outfits': 45.0}"""
+    pairs = {}
+    for item in value.split(','):
+        if '=' not in item:
+            continue
+        name, number = item.split('=', 1)
+        pairs[name.strip()] = float(number)
+    return pairs
+
+
+def create_upstream_caller(config):
+    """Build the ResilientCaller from app config"""
+    return ResilientCaller(
+        deadlines=parse_pairs(config['UPSTREAM_DEADLINES']),
+        default_deadline=config['UPSTREAM_DEFAULT_DEADLINE'],
+        max_attempts=config['UPSTREAM_MAX_ATTEMPTS'],
+        base_delay=config['UPSTREAM_RETRY_BASE_DELAY'],
+        max_delay=config['UPSTREAM_RETRY_MAX_DELAY'],
+        hedge_after=config['UPSTREAM_HEDGE_AFTER'],
+        hedge_operations=[op.strip() for op in config['UPSTREAM_HEDGE_OPERATIONS'].split(',') if op.strip()],
+        breaker=CircuitBreaker(
+            failure_rate=config['UPSTREAM_BREAKER_FAILURE_RATE'],
+            min_calls=config['UPSTREAM_BREAKER_MIN_CALLS'],
+            window=config['UPSTREAM_BREAKER_WINDOW'],
+            cooldown=config['UPSTREAM_BREAKER_COOLDOWN']
+        ),
+        max_workers=config['UPSTREAM_MAX_WORKERS']
+    )
@@ -0,0 +1,76 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class WardrobeSnapshot:
+    """A user's ready clothing items, resolved once for style-me"""
+
+    def __init__(self, items, paths, total_items):
+        """
+        Args:
+            items: {item_id: {'id', 'category', 'filename', 'display_name'}} for usable items
+            paths: {item_id: stored clothing image path}
+            total_items: All wardrobe rows, including ones still processing or missing on disk
+        """
+        self.items = items
+        self.paths = paths
+        self.total_items = total_items
+        # Inventory section of the styling prompt, built once per snapshot
+        self.inventory_text = "\n".join(
+            f"{item['id']}: Category={item['category']}, Name={item['display_name']}"
+            for item in items.values()
+        )
+
+
+class WardrobeSnapshotCache:
+    """
+    Read-through, per-user cache of wardrobe snapshots.
+
+    Callers invalidate a user's snapshot whenever their clothing changes
+    (upload, import, delete, background removal finishing). The TTL only
+    bounds staleness across processes, which don't see each other's
+    invalidations.
+    """
+
+    def __init__(self, ttl=300, max_users=1024):
+        """
+        Args:
+            ttl: Seconds a snapshot is reused
+            max_users: Number of snapshots kept (least recently used are dropped)
+        """
+        self.ttl = ttl
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._snapshots = OrderedDict()  # user_id -> (expires_at, snapshot)
+        self._generations = {}           # user_id -> invalidation counter
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, build):
+        """Return the user's snapshot, calling build() to create it on a miss"""
+        with self._lock:
+            cached = self._snapshots.get(user_id)
+            if cached and cached[0] > time.time():
+                self._snapshots.move_to_end(user_id)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+            generation = self._generations.get(user_id, 0)
+
+        snapshot = build()
+
+        with self._lock:
+            # Don't store a snapshot the wardrobe changed underneath while it was built
+            if self._generations.get(user_id, 0) == generation:
+                self._snapshots[user_id] = (time.time() + self.ttl, snapshot)
+                self._snapshots.move_to_end(user_id)
+                while len(self._snapshots) > self.max_users:
+                    self._snapshots.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id):
+        """Drop the user's snapshot; the next get() rebuilds it"""
+        with self._lock:
+            self._snapshots.pop(user_id, None)
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
@@ -1,84 +1,197 @@
+import time
+import threading
+from collections import OrderedDict
+
 import requests
-from datetime import datetime
+from requests.adapters import HTTPAdapter
+
 
 class WeatherService:
     """Service to get weather information"""
-    
-    def __init__(self):
+
+    # Weather code mapping
+    WEATHER_CODES = {
+        0: "Clear sky",
+        1: "Mainly clear", 2: "Partly cloudy", 3: "Overcast",
+        45: "Foggy", 48: "Depositing rime fog",
+        51: "Light drizzle", 53: "Moderate drizzle", 55: "Dense drizzle",
+        61: "Slight rain", 63: "Moderate rain", 65: "Heavy rain",
+        71: "Slight snow", 73: "Moderate snow", 75: "Heavy snow",
+        80: "Slight rain showers", 81: "Moderate rain showers", 82: "Violent rain showers",
+        95: "Thunderstorm"
+    }
+
+    def __init__(self, timeout=5, forecast_ttl=600, stale_ttl=3600, geocode_ttl=7 * 24 * 3600,
+                 max_entries=1024, geocoding_url=None, weather_url=None):
+        """
+        Args:
+            timeout: Seconds before an upstream HTTP call is abandoned
+            forecast_ttl: Seconds a forecast is served without revalidation
+            stale_ttl: Seconds a forecast may be served stale while it is refreshed in the background
+            geocode_ttl: Seconds a location -> coordinates lookup is remembered
+            max_entries: Size limit of each cache (least recently used entries are dropped)
+            geocoding_url: Override the geocoding endpoint (e.g. a local stand-in)
+            weather_url: Override the forecast endpoint
+        """
         # Using Open-Meteo (free, no API key required)
-        self.geocoding_url = "https://geocoding-api.open-meteo.com/v1/search"
-        self.weather_url = "https://api.open-meteo.com/v1/forecast"
-    
+        self.geocoding_url = geocoding_url or "https://geocoding-api.open-meteo.com/v1/search"
+        self.weather_url = weather_url or "https://api.open-meteo.com/v1/forecast"
+
+        self.timeout = timeout
+        self.forecast_ttl = forecast_ttl
+        self.stale_ttl = stale_ttl
+        self.geocode_ttl = geocode_ttl
+        self.max_entries = max_entries
+
+        # One pooled session so repeat lookups reuse connections
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+        self.session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+        self._lock = threading.Lock()
+        self._geocodes = OrderedDict()   # normalized location -> (expires_at, place or None)
+        self._forecasts = OrderedDict()  # (lat, lon) rounded -> (fetched_at, current)
+        self._refreshing = set()
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, cache, key, value):
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.max_entries:
+                cache.popitem(last=False)
+
+    def _lookup(self, cache, key):
+        with self._lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return value
+
+    def _geocode(self, location):
+        """Resolve a location string to {'name', 'latitude', 'longitude'}, memoized"""
+        key = ' '.join(location.lower().split())
+        cached = self._lookup(self._geocodes, key)
+        if cached and cached[0] > time.time():
+            place = cached[1]
+        else:
+            geocode_response = self.session.get(
+                self.geocoding_url,
+                params={'name': location, 'count': 1, 'language': 'en', 'format': 'json'},
+                timeout=self.timeout
+            )
+
+            if geocode_response.status_code != 200:
+                raise Exception("Failed to geocode location")
+
+            results = geocode_response.json().get('results')
+            place = None
+            ttl = self.geocode_ttl
+            if results:
+                result = results[0]
+                place = {
+                    'name': result['name'],
+                    'latitude': result['latitude'],
+                    'longitude': result['longitude']
+                }
+            else:
+                # Remember misses too, but not for as long
+                ttl = self.forecast_ttl
+            self._remember(self._geocodes, key, (time.time() + ttl, place))
+
+        if not place:
+            raise Exception(f"Location '{location}' not found")
+        return place
+
+    def _fetch_forecast(self, latitude, longitude):
+        weather_response = self.session.get(
+            self.weather_url,
+            params={
+                'latitude': latitude,
+                'longitude': longitude,
+                'current': 'temperature_2m,weather_code,wind_speed_10m',
+                'temperature_unit': 'fahrenheit'
+            },
+            timeout=self.timeout
+        )
+
+        if weather_response.status_code != 200:
+            raise Exception("Failed to get weather data")
+
+        current = weather_response.json()['current']
+        self._remember(self._forecasts, (latitude, longitude), (time.time(), current))
+        return current
+
+    def _refresh_in_background(self, latitude, longitude):
+        key = (latitude, longitude)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._fetch_forecast(latitude, longitude)
+            except Exception as e:
+                print(f"Weather refresh failed for {key}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name='weather-refresh', daemon=True).start()
+
+    def _current_conditions(self, latitude, longitude):
+        # Nearby lookups (~1km) share a forecast
+        latitude, longitude = round(latitude, 2), round(longitude, 2)
+        cached = self._lookup(self._forecasts, (latitude, longitude))
+
+        if cached:
+            fetched_at, current = cached
+            age = time.time() - fetched_at
+            if age < self.forecast_ttl:
+                return current
+            if age < self.stale_ttl:
+                # Serve stale, revalidate off the request path
+                self._refresh_in_background(latitude, longitude)
+                return current
+
+        try:
+            return self._fetch_forecast(latitude, longitude)
+        except Exception:
+            if cached:
+                print("Weather fetch failed, serving expired forecast")
+                return cached[1]
+            raise
+
     def get_weather(self, location):
         """
         Get current weather for a location
-        
+
         Args:
             location: Location string (e.g., "New York, NY")
-            
+
         Returns:
             dict with temperature, conditions, etc.
         """
         try:
-            # Get coordinates from location name
-            geocode_response = requests.get(
-                self.geocoding_url,
-                params={'name': location, 'count': 1, 'language': 'en', 'format': 'json'}
-            )
-            
-            if geocode_response.status_code != 200:
-                raise Exception("Failed to geocode location")
-            
-            geocode_data = geocode_response.json()
-            
-            if not geocode_data.get('results'):
-                raise Exception(f"Location '{location}' not found")
-            
-            result = geocode_data['results'][0]
-            latitude = result['latitude']
-            longitude = result['longitude']
-            location_name = result['name']
-            
-            # Get weather
-            weather_response = requests.get(
-                self.weather_url,
-                params={
-                    'latitude': latitude,
-                    'longitude': longitude,
-                    'current': 'temperature_2m,weather_code,wind_speed_10m',
-                    'temperature_unit': 'fahrenheit'
-                }
-            )
-            
-            if weather_response.status_code != 200:
-                raise Exception("Failed to get weather data")
-            
-            weather_data = weather_response.json()
-            current = weather_data['current']
-            
-            # Weather code mapping
-            weather_codes = {
-                0: "Clear sky",
-                1: "Mainly clear", 2: "Partly cloudy", 3: "Overcast",
-                45: "Foggy", 48: "Depositing rime fog",
-                51: "Light drizzle", 53: "Moderate drizzle", 55: "Dense drizzle",
-                61: "Slight rain", 63: "Moderate rain", 65: "Heavy rain",
-                71: "Slight snow", 73: "Moderate snow", 75: "Heavy snow",
-                80: "Slight rain showers", 81: "Moderate rain showers", 82: "Violent rain showers",
-                95: "Thunderstorm"
-            }
-            
-            weather_desc = weather_codes.get(current['weather_code'], "Unknown")
-            
+            place = self._geocode(location)
+            current = self._current_conditions(place['latitude'], place['longitude'])
+
+            weather_desc = self.WEATHER_CODES.get(current['weather_code'], "Unknown")
+
             return {
-                'location': location_name,
+                'location': place['name'],
                 'temperature': round(current['temperature_2m']),
                 'temperature_unit': 'F',
                 'conditions': weather_desc,
                 'wind_speed': round(current['wind_speed_10m']),
                 'timestamp': current['time']
             }
-            
+
         except Exception as e:
             print(f"Weather service error: {e}")
             # Return default if weather fails
@@ -90,4 +203,3 @@ class WeatherService:
                 'wind_speed': 5,
                 'error': str(e)
             }
-
@@ -110,7 +110,7 @@ function Photos() {
                 `}>
                   <div className="aspect-square overflow-hidden border-2 border-black mb-2">
                     <img
-                      src={`/${photo.filepath}`}
+                      src={`/${photo.filepath}?w=512`}
                       alt="User photo"
                       className="w-full h-full object-cover"
                     />
@@ -5,10 +5,15 @@ import NeoButton from '../components/ui/NeoButton'
 import NeoCard from '../components/ui/NeoCard'
 import { Camera } from 'lucide-react'
 
+const PAGE_SIZE = 48
+const LIST_FIELDS = 'id,result_filepath,created_at'
+
 function SavedLooks() {
   const navigate = useNavigate()
   const [looks, setLooks] = useState([])
   const [loading, setLoading] = useState(true)
+  const [nextCursor, setNextCursor] = useState(null)
+  const [loadingMore, setLoadingMore] = useState(false)
 
   useEffect(() => {
     fetchLooks()
@@ -16,8 +21,9 @@ function SavedLooks() {
 
   const fetchLooks = async () => {
     try {
-      const response = await tryonAPI.getSaved()
+      const response = await tryonAPI.getSaved({ limit: PAGE_SIZE, fields: LIST_FIELDS })
       setLooks(response.data.looks)
+      setNextCursor(response.data.next_cursor)
     } catch (error) {
       console.error('Error fetching saved looks:', error)
     } finally {
@@ -25,6 +31,20 @@ function SavedLooks() {
     }
   }
 
+  const loadMore = async () => {
+    if (!nextCursor) return
+    setLoadingMore(true)
+    try {
+      const response = await tryonAPI.getSaved({ limit: PAGE_SIZE, fields: LIST_FIELDS, cursor: nextCursor })
+      setLooks((current) => [...current, ...response.data.looks])
+      setNextCursor(response.data.next_cursor)
+    } catch (error) {
+      console.error('Error fetching saved looks:', error)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   const handleDelete = async (id) => {
     if (!confirm('DELETE THIS LOOK?')) return
 
@@ -69,7 +89,7 @@ function SavedLooks() {
               <div key={look.id} className="border-3 border-black bg-white p-2 shadow-neo hover:-translate-y-1 hover:translate-x-1 transition-transform flex flex-col">
                 <div className="relative aspect-[3/4] border-2 border-black mb-2">
                   <img
-                    src={`/${look.result_filepath}`}
+                    src={`/${look.result_filepath}?w=512`}
                     alt="Saved look"
                     className="w-full h-full object-cover"
                     loading="lazy"
@@ -95,6 +115,13 @@ function SavedLooks() {
             ))}
           </div>
         )}
+        {nextCursor && (
+          <div className="flex justify-center mt-4">
+            <NeoButton onClick={loadMore} disabled={loadingMore} variant="outline" className="px-6 py-2 text-sm">
+              {loadingMore ? 'LOADING...' : 'LOAD MORE'}
+            </NeoButton>
+          </div>
+        )}
       </div>
     </div>
   )
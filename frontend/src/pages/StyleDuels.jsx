@@ -37,7 +37,7 @@ function StyleDuels() {
 
     const fetchSavedLooks = async () => {
         try {
-            const { data } = await tryonAPI.getSaved()
+            const { data } = await tryonAPI.getSaved({ limit: 'all' })
             setSavedLooks(data.looks || [])
         } catch (error) {
             console.error('Error fetching saved looks:', error)
@@ -63,7 +63,12 @@ function StyleDuels() {
         try {
             await challengeAPI.vote(entryId)
             // Remove voted entry from list to show next one
-            setEntries((prev) => prev.filter((e) => e.id !== entryId))
+            const remaining = entries.filter((e) => e.id !== entryId)
+            setEntries(remaining)
+            // Voted entries are excluded server-side, so a refetch brings fresh ones
+            if (remaining.length === 0 && challenge) {
+                fetchEntries(challenge.id)
+            }
         } catch (error) {
             console.error('Error voting:', error)
         }
@@ -150,7 +155,7 @@ function StyleDuels() {
                             {savedLooks.map(look => (
                                 <div key={look.id} className="border-2 border-black p-2 cursor-pointer hover:bg-gray-100" onClick={() => handleEnterChallenge(look.id)}>
                                     <img
-                                        src={`/uploads/results/${look.result_filename}`}
+                                        src={`/uploads/results/${look.result_filename}?w=256`}
                                         alt="Look"
                                         className="w-full h-32 object-cover mb-2"
                                     />
@@ -1,9 +1,19 @@
 import { useState, useEffect } from 'react'
 import { useNavigate } from 'react-router-dom'
-import { photosAPI, clothingAPI, tryonAPI } from '../services/api'
+import { photosAPI, clothingAPI, tryonAPI, jobsAPI } from '../services/api'
 import NeoButton from '../components/ui/NeoButton'
 import { MousePointerClick, Sparkles } from 'lucide-react'
 
+// Button text for the progress stages streamed by /api/jobs/<id>/events
+const STAGE_LABELS = {
+  queued: 'QUEUED...',
+  preparing_inputs: 'PREPARING...',
+  model_call_started: 'GENERATING...',
+  image_received: 'FINISHING...',
+  post_processing: 'FINISHING...',
+  saved: 'SAVED!'
+}
+
 function TryOnStudio() {
   const navigate = useNavigate()
   const [photos, setPhotos] = useState([])
@@ -12,6 +22,7 @@ function TryOnStudio() {
   const [selectedClothing, setSelectedClothing] = useState(null)
   const [activeTab, setActiveTab] = useState('photos')
   const [generating, setGenerating] = useState(false)
+  const [stage, setStage] = useState(null)
   const [result, setResult] = useState(null)
 
   useEffect(() => {
@@ -41,17 +52,33 @@ function TryOnStudio() {
     }
 
     setGenerating(true)
+    setStage('queued')
     try {
       const response = await tryonAPI.generate({
         photo_id: selectedPhoto.id,
         clothing_id: selectedClothing.id
       })
-      setResult(response.data.result)
+      // Cached results come back already finished
+      let job = response.data.job
+      if (job.status !== 'succeeded' && job.status !== 'failed') {
+        try {
+          job = await jobsAPI.watch(job.id, setStage)
+        } catch (streamError) {
+          // Streaming unavailable (e.g. a buffering proxy): fall back to long-polling
+          console.warn('Job event stream failed, polling instead:', streamError)
+          job = await jobsAPI.waitFor(job.id)
+        }
+      }
+      if (job.status !== 'succeeded') {
+        throw new Error(job.error || 'Try-on job failed')
+      }
+      setResult(job.result)
     } catch (error) {
       console.error('Error generating try-on:', error)
       alert('FAILED TO GENERATE TRY-ON')
     } finally {
       setGenerating(false)
+      setStage(null)
     }
   }
 
@@ -152,7 +179,7 @@ function TryOnStudio() {
                   `}
                 >
                   <img
-                    src={`/uploads/${activeTab === 'photos' ? 'photos' : 'clothing'}/${item.filename}`}
+                    src={`/uploads/${activeTab === 'photos' ? 'photos' : 'clothing'}/${item.filename}?w=256`}
                     alt="Item"
                     className="w-full h-full object-cover"
                   />
@@ -175,7 +202,7 @@ function TryOnStudio() {
           variant="primary"
           className="mt-1 md:mt-2 py-[0.55rem] md:py-[0.825rem] text-[0.825rem] md:text-[0.96rem]"
         >
-          {generating ? 'GENERATING...' : 'TRY ON NOW'}
+          {generating ? (STAGE_LABELS[stage] || 'GENERATING...') : 'TRY ON NOW'}
         </NeoButton>
       </div>
     </div>
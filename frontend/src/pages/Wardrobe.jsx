@@ -39,6 +39,13 @@ function Wardrobe() {
     fetchItems()
   }, [fetchItems])
 
+  // Refresh while uploads are still having their backgrounds removed
+  useEffect(() => {
+    if (!items.some((item) => item.status === 'processing')) return
+    const timer = setTimeout(fetchItems, 3000)
+    return () => clearTimeout(timer)
+  }, [items, fetchItems])
+
   const getErrorMessage = (error, fallback) => {
     return error?.response?.data?.error || error?.message || fallback
   }
@@ -76,10 +83,19 @@ function Wardrobe() {
           filename: data.filename
         })
       } else if (addMode === 'link') {
-        await clothingAPI.importFromUrl({
-          url: linkUrl,
-          category: uploadCategory
-        })
+        const urls = linkUrl.split(/\s+/).filter(Boolean)
+        if (urls.length > 1) {
+          const { data } = await clothingAPI.importBulk(urls, uploadCategory)
+          const failures = data.results.filter((result) => result.event === 'failed')
+          if (failures.length > 0) {
+            alert(failures.map((result) => `${result.url}: ${result.error}`).join('\n'))
+          }
+        } else {
+          await clothingAPI.importFromUrl({
+            url: linkUrl.trim(),
+            category: uploadCategory
+          })
+        }
         await fetchItems()
         setShowUploadModal(false)
         setLinkUrl('')
@@ -205,7 +221,7 @@ function Wardrobe() {
               <div key={item.id} className="border-3 border-black bg-white p-2 shadow-neo hover:-translate-y-1 hover:translate-x-1 transition-transform flex flex-col">
                 <div className="aspect-square overflow-hidden border-2 border-black mb-2 relative group">
                   <img
-                    src={`/uploads/clothing/${item.filename}`}
+                    src={`/uploads/clothing/${item.filename}?w=512`}
                     alt={item.category}
                     className="w-full h-full object-cover"
                     loading="lazy"
@@ -394,12 +410,12 @@ function Wardrobe() {
 
                   {addMode === 'link' && (
                     <div>
-                      <label className="font-display font-bold text-sm uppercase mb-2 block">PRODUCT URL</label>
-                      <input
-                        type="text"
+                      <label className="font-display font-bold text-sm uppercase mb-2 block">PRODUCT URLS (ONE PER LINE)</label>
+                      <textarea
                         value={linkUrl}
                         onChange={(e) => setLinkUrl(e.target.value)}
                         className="w-full border-3 border-black p-3.5 font-mono text-sm"
+                        rows={3}
                         placeholder="https://..."
                       />
                       <NeoButton onClick={handleUpload} fullWidth disabled={uploading} className="mt-2">
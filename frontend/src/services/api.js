@@ -10,18 +10,20 @@ const api = axios.create({
   }
 })
 
-// Add auth token to requests
-api.interceptors.request.use((config) => {
-  let token = null
+const getToken = () => {
   const authStorage = localStorage.getItem('auth-storage')
-  if (authStorage) {
-    try {
-      const { state } = JSON.parse(authStorage)
-      token = state?.token || null
-    } catch {
-      token = null
-    }
+  if (!authStorage) return null
+  try {
+    const { state } = JSON.parse(authStorage)
+    return state?.token || null
+  } catch {
+    return null
   }
+}
+
+// Add auth token to requests
+api.interceptors.request.use((config) => {
+  const token = getToken()
 
   if (token) {
     console.log('🔑 Attaching token to request:', token.substring(0, 20) + '...')
@@ -32,6 +34,47 @@ api.interceptors.request.use((config) => {
   return config
 })
 
+// Read a Server-Sent Events response, calling onEvent(event, data) for each event.
+// fetch is used instead of EventSource so the Authorization header can be sent.
+export const streamEvents = async (path, onEvent, { method = 'GET', body } = {}) => {
+  const token = getToken()
+  const response = await fetch(`${API_BASE_URL}${path}`, {
+    method,
+    headers: {
+      Accept: 'text/event-stream',
+      ...(body ? { 'Content-Type': 'application/json' } : {}),
+      ...(token ? { Authorization: `Bearer ${token}` } : {})
+    },
+    body: body ? JSON.stringify(body) : undefined
+  })
+  if (!response.ok) {
+    const error = await response.json().catch(() => ({}))
+    throw new Error(error.error || `Request failed with status ${response.status}`)
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  for (;;) {
+    const { value, done } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    let boundary
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const block = buffer.slice(0, boundary)
+      buffer = buffer.slice(boundary + 2)
+      let event = 'message'
+      let data = ''
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event: ')) event = line.slice(7)
+        else if (line.startsWith('data: ')) data += line.slice(6)
+      }
+      // Lines starting with ':' are keep-alives
+      if (data) onEvent(event, JSON.parse(data))
+    }
+  }
+}
+
 // Auth APIs
 export const authAPI = {
   register: (data) => api.post('/auth/register', data),
@@ -41,7 +84,7 @@ export const authAPI = {
 
 // Photos APIs
 export const photosAPI = {
-  getAll: () => api.get('/photos'),
+  getAll: () => api.get('/photos', { params: { limit: 'all' } }),
   upload: (formData) => api.post('/photos', formData, {
     headers: { 'Content-Type': 'multipart/form-data' }
   }),
@@ -51,7 +94,7 @@ export const photosAPI = {
 
 // Clothing APIs
 export const clothingAPI = {
-  getAll: (category) => api.get('/clothing', { params: { category } }),
+  getAll: (category) => api.get('/clothing', { params: { category, limit: 'all' } }),
   upload: (formData) => api.post('/clothing', formData, {
     headers: { 'Content-Type': 'multipart/form-data' }
   }),
@@ -59,16 +102,44 @@ export const clothingAPI = {
   generateFromText: (data) => api.post('/clothing/generate', data),
   refineGenerated: (data) => api.post('/clothing/refine', data),
   saveGenerated: (data) => api.post('/clothing/save-generated', data),
-  importFromUrl: (data) => api.post('/clothing/import', data)
+  importFromUrl: (data) => api.post('/clothing/import', data),
+  importBulk: (urls, category) => api.post('/clothing/import/bulk', { urls, category })
 }
 
 // Try-On APIs
 export const tryonAPI = {
   generate: (data) => api.post('/tryon', data),
-  getSaved: () => api.get('/saved-looks'),
+  getSaved: (params) => api.get('/saved-looks', { params }),
   deleteSaved: (id) => api.delete(`/saved-looks/${id}`)
 }
 
+// Background job APIs
+export const jobsAPI = {
+  get: (jobId, wait = 0) => api.get(`/jobs/${jobId}`, { params: { wait } }),
+  // Follow a job's progress stages; resolves with the finished job
+  watch: async (jobId, onStage) => {
+    for (;;) {
+      let finished = null
+      await streamEvents(`/jobs/${jobId}/events`, (event, data) => {
+        if (event === 'stage') onStage?.(data.stage)
+        else if (event === 'done' || event === 'failed') finished = data.job
+        else if (event === 'error') throw new Error(data.error)
+      })
+      if (finished) return finished
+      // The server closes long streams; reconnect and keep following
+    }
+  },
+  // Long-poll until the job succeeds or fails
+  waitFor: async (jobId, wait = 25) => {
+    for (;;) {
+      const { data } = await jobsAPI.get(jobId, wait)
+      if (data.job.status === 'succeeded' || data.job.status === 'failed') {
+        return data.job
+      }
+    }
+  }
+}
+
 // Daily briefing / utility
 export const utilityAPI = {
   getDailyBriefing: (location) => api.get('/daily-briefing', { params: { location } })